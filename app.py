@@ -4,14 +4,81 @@ import io
 import json
 import zipfile
 import logging
+import logging.handlers
+import queue
+import tempfile
+import threading
+import time
+import random
+import cProfile
+import pstats
+import uuid
+import re
+import sys
+import shutil
+import struct
+import subprocess
+import argparse
+import signal
+import socket
+import urllib.request
+import gzip
+import zlib
+import csv
+import smtplib
+import socketserver
+from email.message import EmailMessage
+import hashlib
+import hmac
+import pickle
+import gc
+import atexit
+from collections import OrderedDict
+from html.parser import HTMLParser
+from bisect import bisect_left
 from datetime import datetime
+from urllib.parse import urlsplit
+from xml.sax.saxutils import escape
+from xml.etree import ElementTree
 from flask import (
     Flask, render_template, render_template_string, request, redirect, url_for,
-    session, send_from_directory, send_file, abort, flash, Response
+    session, send_from_directory, send_file, abort, flash, Response, g,
+    before_render_template, template_rendered, has_request_context, jsonify, Request
 )
+from flask.sessions import SecureCookieSessionInterface
 from werkzeug.utils import secure_filename
-from jinja2 import DictLoader
+from werkzeug.exceptions import RequestEntityTooLarge
+from jinja2 import DictLoader, FileSystemBytecodeCache
+from jinja2.bccache import Bucket
 from functools import wraps
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import brotli  # optionnel : pip install brotli
+except ImportError:
+    brotli = None
+try:
+    import fcntl  # verrou inter-processus du journal d'état (absent sous Windows)
+except ImportError:
+    fcntl = None
+try:
+    from gunicorn.app.base import BaseApplication  # optionnel : pip install gunicorn
+except ImportError:
+    BaseApplication = None
+try:
+    from fontTools import subset as font_subset  # optionnel : pip install fonttools
+    from fontTools.ttLib import TTFont
+except ImportError:
+    font_subset = None
+try:
+    import pymupdf  # optionnel : pip install pymupdf (aperçus des PDF)
+except ImportError:
+    pymupdf = None
+try:
+    import olefile  # optionnel : pip install olefile (métadonnées des fichiers Revit)
+except ImportError:
+    olefile = None
 
 # ----------------------------------------
 # CONFIGURATION DE BASE
@@ -24,6 +91,7 @@ TRAFFIC_FILE = os.environ.get("TRAFFIC_FILE_PATH", os.path.join(UPLOAD_FOLDER, "
 ROTATOR_FILE = os.environ.get("ROTATOR_FILE_PATH", os.path.join(UPLOAD_FOLDER, "rotator.json"))
 CONFIG_FILE = os.environ.get("CONFIG_FILE_PATH", os.path.join(UPLOAD_FOLDER, "config.json"))
 GALLERY_FILE = os.environ.get("GALLERY_FILE_PATH", os.path.join(UPLOAD_FOLDER, "gallery.json"))
+ATTACHMENTS_FILE = os.environ.get("ATTACHMENTS_FILE_PATH", os.path.join(UPLOAD_FOLDER, "attachments.json"))
 
 # Admin credentials (à sécuriser via variables d’environnement en production)
 ADMIN_USER = os.environ.get("ADMIN_USER", "bacseried@gmail.com")
@@ -38,21 +106,161 @@ IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "gif"}
 PDF_EXTENSIONS = {"pdf"}
 VIDEO_EXTENSIONS = {"mp4", "webm", "ogg"}
 
+# Langues du site public : chaque page existe sous /fr/... et /en/...
+LANGS = {"fr": "Français", "en": "English"}
+DEFAULT_LANG = "fr"
+PUBLIC_ENDPOINTS = ("index", "services", "portfolio", "galeries", "pourquoi", "contact")
+# Durée de cache partagé (CDN / proxy) des pages publiques
+PUBLIC_MAX_AGE = int(os.environ.get("PUBLIC_MAX_AGE", 300))
+
+class PublicPageSessionInterface(SecureCookieSessionInterface):
+    """
+    Comme l'interface par défaut, mais sans `Vary: Cookie` sur les pages
+    publiques marquées partageables (g._public_cache) : leur HTML ne dépend
+    plus de la session.
+    """
+    def save_session(self, app, session, response):
+        public = g.get("_public_cache")
+        super().save_session(app, session, response)
+        if public and not session.modified:
+            response.vary.discard("Cookie")
+
 # Application Flask
 app = Flask(__name__)
 # Clé secrète pour session/flash (à personnaliser en production)
 app.secret_key = os.environ.get("SECRET_KEY", "super_secret_key_2024")
+app.session_interface = PublicPageSessionInterface()
+# Taille maximale d'une requête (pièces jointes comprises), en Mo, pour les
+# routes sans limite propre : les routes d'upload suivent UPLOAD_ROUTE_LIMITS
+app.config["MAX_CONTENT_LENGTH"] = int(float(os.environ.get("MAX_BODY_MB", 50)) * 1024 * 1024)
 
 # Logging
+# Les threads de requête ne font que déposer l'enregistrement dans une file
+# (QueueHandler, jamais bloquant) ; un thread d'écoute écrit le fichier et la
+# console, fait tourner le fichier (taille ou heure) et compresse en .gz les
+# anciens segments. Plusieurs processus peuvent partager le même fichier.
 LOG_FILE = os.environ.get("LOG_FILE_PATH", "app.log")
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")  # text | json
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024))
+# Rotation horaire (ex. "midnight", "H") à la place de la rotation par taille
+LOG_ROTATE_WHEN = os.environ.get("LOG_ROTATE_WHEN", "")
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", 10))
+LOG_COMPRESS = os.environ.get("LOG_COMPRESS", "true").lower() in ("true", "1", "yes")
+LOG_COMPRESS_DELAY = float(os.environ.get("LOG_COMPRESS_DELAY", 0.5))
+
+class JsonLogFormatter(logging.Formatter):
+    """Une ligne JSON par enregistrement (LOG_FORMAT=json)."""
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+def _gzip_rotator(source, dest):
+    """
+    Segment sorti de rotation : renommé, puis compressé en .gz (dest) après
+    un court délai, le temps qu'un autre processus qui y écrivait encore sa
+    dernière ligne rouvre le nouveau fichier. Tourne dans le thread d'écoute :
+    les requêtes n'attendent pas, leurs logs patientent dans la file.
+    """
+    plain = f"{source}.rotating"
+    os.rename(source, plain)
+    time.sleep(LOG_COMPRESS_DELAY)
+    with open(plain, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(plain)
+
+class _SharedRotationMixin:
+    """
+    Rotation sûre entre processus : verrou fichier pendant la rotation, et
+    réouverture quand un autre processus a déjà fait tourner le fichier.
+    """
+    def _reopen_if_rotated(self):
+        if self.stream is None:
+            return False
+        try:
+            st = os.stat(self.baseFilename)
+            rotated = (st.st_ino, st.st_dev) != os.fstat(self.stream.fileno())[1:3]
+        except FileNotFoundError:
+            rotated = True
+        if rotated:
+            self.stream.close()
+            self.stream = self._open()
+            if hasattr(self, "computeRollover"):
+                self.rolloverAt = self.computeRollover(int(time.time()))
+        return rotated
+
+    def shouldRollover(self, record):
+        self._reopen_if_rotated()
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        lock_fd = os.open(f"{self.baseFilename}.lock", os.O_RDWR | os.O_CREAT, 0o600) if fcntl else None
+        try:
+            if lock_fd is not None:
+                # lockf (et non flock) : un enfant forké pendant une rotation
+                # n'hérite pas du verrou
+                fcntl.lockf(lock_fd, fcntl.LOCK_EX)
+            if not self._reopen_if_rotated():
+                super().doRollover()
+        finally:
+            if lock_fd is not None:
+                os.close(lock_fd)
+
+class SharedRotatingFileHandler(_SharedRotationMixin, logging.handlers.RotatingFileHandler):
+    pass
+
+class SharedTimedRotatingFileHandler(_SharedRotationMixin, logging.handlers.TimedRotatingFileHandler):
+    pass
+
+def build_log_handlers():
+    if LOG_ROTATE_WHEN:
+        file_handler = SharedTimedRotatingFileHandler(LOG_FILE, when=LOG_ROTATE_WHEN,
+                                                      backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    else:
+        file_handler = SharedRotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES,
+                                                 backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    if LOG_COMPRESS:
+        file_handler.namer = lambda name: f"{name}.gz"
+        file_handler.rotator = _gzip_rotator
+    handlers = [file_handler, logging.StreamHandler()]
+    formatter = (JsonLogFormatter() if LOG_FORMAT == "json"
+                 else logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+LOG_HANDLERS = build_log_handlers()
+_log_queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+# Message déjà mis en forme (arguments fusionnés) ; le format final est celui des handlers
+_log_queue_handler.setFormatter(logging.Formatter("%(message)s"))
+_log_pipeline = {"listener": None}
+
+def start_log_listener():
+    """(Re)démarre le thread d'écriture des logs sur une file neuve (aussi après fork)."""
+    _log_queue_handler.queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(_log_queue_handler.queue, *LOG_HANDLERS,
+                                              respect_handler_level=True)
+    listener.start()
+    _log_pipeline["listener"] = listener
+
+def stop_log_listener():
+    """Écrit les enregistrements en attente puis arrête le thread (sortie du processus)."""
+    listener, _log_pipeline["listener"] = _log_pipeline["listener"], None
+    if listener is not None:
+        listener.stop()
+
+logging.basicConfig(level=getattr(logging, LOG_LEVEL, logging.INFO), handlers=[_log_queue_handler])
+start_log_listener()
+atexit.register(stop_log_listener)
 
 # ----------------------------------------
 # FONCTIONS UTILITAIRES
@@ -96,22 +304,391 @@ def load_json_file(path, expect_dict=False):
         logging.error(f"Erreur création initiale de {path}: {e}")
     return default
 
-def save_json_file(path, data):
+def write_json_atomic(path, data):
     """
-    Sauvegarde data dans path. Crée les dossiers parents si besoin.
+    Écrit data dans un fichier temporaire du même dossier puis le renomme :
+    un lecteur voit l'ancienne ou la nouvelle version, jamais un fichier tronqué.
     """
+    start = time.perf_counter()
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
     try:
         parent = os.path.dirname(path)
         if parent and not os.path.exists(parent):
             os.makedirs(parent, exist_ok=True)
-        with open(path, "w", encoding="utf-8") as f:
+        with open(tmp, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
     except Exception as e:
         logging.error(f"Erreur écriture {path}: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    finally:
+        observe_metric("storage", os.path.basename(path), time.perf_counter() - start)
+
+class JsonFileWriter(threading.Thread):
+    """
+    Thread d'écriture unique pour un fichier JSON. Les demandes arrivées
+    pendant une écriture sont fusionnées : seule la plus récente est écrite.
+    """
+    def __init__(self, path):
+        super().__init__(daemon=True, name=f"json-writer:{os.path.basename(path)}")
+        self.path = path
+        self.cond = threading.Condition()
+        self.pending = None
+        self.requested = 0
+        self.written = 0
 
-def send_email_notification(subject: str, body: str):
-    # Stub d'envoi d’e-mail : à remplacer par implémentation pro si nécessaire
-    logging.info(f"[Notification stub] Sujet: {subject} | Corps: {body}")
+    def submit(self, data):
+        with self.cond:
+            self.pending = data
+            self.requested += 1
+            self.cond.notify_all()
+            return self.requested
+
+    def wait_for(self, generation, timeout=None):
+        with self.cond:
+            return self.cond.wait_for(lambda: self.written >= generation, timeout)
+
+    def run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending is not None)
+                data, generation, self.pending = self.pending, self.requested, None
+            write_json_atomic(self.path, data)
+            with self.cond:
+                self.written = generation
+                self.cond.notify_all()
+
+_json_writers = {}
+_json_writers_lock = threading.Lock()
+
+def save_json_file(path, data, wait=False):
+    """
+    Sauvegarde data dans path via le thread d'écriture du fichier (écriture
+    atomique). data ne doit plus être modifiée ensuite : passer une copie.
+    wait=True attend que cette version soit sur disque.
+    """
+    with _json_writers_lock:
+        writer = _json_writers.get(path)
+        if writer is None:
+            writer = _json_writers[path] = JsonFileWriter(path)
+            writer.start()
+    generation = writer.submit(data)
+    if wait:
+        writer.wait_for(generation)
+
+def flush_json_writes(timeout=10):
+    """Attend l'écriture de toutes les sauvegardes JSON en attente."""
+    with _json_writers_lock:
+        writers = list(_json_writers.values())
+    for writer in writers:
+        with writer.cond:
+            generation = writer.requested
+        writer.wait_for(generation, timeout)
+
+atexit.register(flush_json_writes)
+
+class RWLock:
+    """
+    Verrou lecteurs/écrivain : lectures concurrentes, écriture exclusive.
+    Les écrivains en attente passent avant les nouveaux lecteurs ; une
+    lecture imbriquée dans le même thread (rendu du CSS critique) passe.
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def read(self):
+        depth = getattr(self._local, "depth", 0)
+        if not depth:
+            with self._cond:
+                self._cond.wait_for(lambda: not self._writer and not self._writers_waiting)
+                self._readers += 1
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if not depth:
+                with self._cond:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            self._cond.wait_for(lambda: not self._writer and not self._readers)
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+# ----------------------------------------
+# NOTIFICATIONS E-MAIL (file d'attente sur disque)
+# ----------------------------------------
+# send_email_notification ne fait qu'écrire la notification dans MAIL_QUEUE_DIR
+# (un fichier JSON par notification) : la requête ne dépend jamais du serveur
+# SMTP. Un thread d'envoi par processus vide la file ; un verrou fichier
+# garantit qu'un seul processus envoie à la fois. La connexion SMTP est
+# réutilisée entre deux envois, les échecs sont retentés avec un délai
+# croissant, et une rafale de notifications part en un seul e-mail récapitulatif.
+# Sans SMTP_HOST, les notifications sont seulement journalisées (comme avant).
+# Pour tester en local : `python app.py smtp-debug` puis SMTP_HOST=127.0.0.1 SMTP_PORT=1025.
+SMTP_HOST = os.environ.get("SMTP_HOST", "")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 25))
+SMTP_USER = os.environ.get("SMTP_USER", "")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD", "")
+SMTP_SSL = os.environ.get("SMTP_SSL", "").lower() in ("true", "1", "yes")
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "").lower() in ("true", "1", "yes")
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", 10))
+MAIL_FROM = os.environ.get("MAIL_FROM", SMTP_USER or "noreply@localhost")
+MAIL_TO = os.environ.get("MAIL_TO", ADMIN_USER)
+MAIL_QUEUE_DIR = os.environ.get("MAIL_QUEUE_DIR", "mail_queue")
+# Attente après la première notification pour regrouper une rafale (s)
+MAIL_BATCH_WINDOW = float(os.environ.get("MAIL_BATCH_WINDOW", 2))
+MAIL_DIGEST_MAX = int(os.environ.get("MAIL_DIGEST_MAX", 50))
+# Relecture périodique de la file (notifications d'autres processus, reprises)
+MAIL_POLL_SECONDS = float(os.environ.get("MAIL_POLL_SECONDS", 30))
+MAIL_RETRY_BASE = float(os.environ.get("MAIL_RETRY_BASE", 5))
+MAIL_RETRY_MAX = float(os.environ.get("MAIL_RETRY_MAX", 600))
+MAIL_MAX_ATTEMPTS = int(os.environ.get("MAIL_MAX_ATTEMPTS", 20))
+# Fermeture de la connexion SMTP après cette inactivité (s)
+MAIL_IDLE_SECONDS = float(os.environ.get("MAIL_IDLE_SECONDS", 60))
+
+def mail_queue_files(folder="pending"):
+    path = os.path.join(MAIL_QUEUE_DIR, folder)
+    try:
+        names = sorted(n for n in os.listdir(path) if n.endswith(".json"))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(path, n) for n in names]
+
+def _write_mail_file(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class MailSender(threading.Thread):
+    """Thread d'envoi : regroupe, envoie et retente les notifications en attente."""
+    def __init__(self):
+        super().__init__(daemon=True, name="mail-sender")
+        self.wakeup = threading.Event()
+        self.idle = threading.Event()
+        self.smtp = None
+        self.last_used = 0.0
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def run(self):
+        while True:
+            if self.wakeup.wait(MAIL_POLL_SECONDS) and MAIL_BATCH_WINDOW > 0:
+                time.sleep(MAIL_BATCH_WINDOW)  # laisse arriver le reste de la rafale
+            # Après un échec, les nouvelles notifications attendent la fin du
+            # délai de reprise : wakeup ne fait que signaler qu'il y a du travail
+            while (remaining := self.retry_at - time.monotonic()) > 0:
+                time.sleep(remaining)
+            self.wakeup.clear()
+            self.idle.clear()
+            try:
+                while self.send_batch():
+                    pass
+                self.failures = 0
+            except Exception as e:
+                self.failures += 1
+                self.close()
+                delay = min(MAIL_RETRY_BASE * 2 ** (self.failures - 1), MAIL_RETRY_MAX)
+                logging.warning(f"Envoi e-mail échoué ({e}), nouvel essai dans {delay:.0f} s")
+                self.retry_at = time.monotonic() + delay
+                self.wakeup.set()
+                continue
+            if self.smtp is not None and time.monotonic() - self.last_used > MAIL_IDLE_SECONDS:
+                self.close()
+            self.idle.set()
+
+    def connect(self):
+        if self.smtp is not None:
+            try:
+                if self.smtp.noop()[0] == 250:
+                    return self.smtp
+            except smtplib.SMTPException:
+                pass
+            self.close()
+        factory = smtplib.SMTP_SSL if SMTP_SSL else smtplib.SMTP
+        smtp = factory(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        if SMTP_STARTTLS and not SMTP_SSL:
+            smtp.starttls()
+        if SMTP_USER:
+            smtp.login(SMTP_USER, SMTP_PASSWORD)
+        self.smtp = smtp
+        return smtp
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except Exception:
+                pass
+            self.smtp = None
+
+    def send_batch(self):
+        """Envoie au plus MAIL_DIGEST_MAX notifications ; False si la file est vide."""
+        with _mail_queue_lock() as locked:
+            if not locked:
+                return False  # un autre processus vide la file
+            paths = mail_queue_files()[:MAIL_DIGEST_MAX]
+            if not paths:
+                return False
+            notes = []
+            for path in paths:
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        notes.append((path, json.load(f)))
+                except (OSError, ValueError) as e:
+                    logging.error(f"Notification illisible {path}: {e}")
+                    os.replace(path, os.path.join(MAIL_QUEUE_DIR, "failed", os.path.basename(path)))
+            if not notes:
+                return True
+            try:
+                msg = build_notification_email([n for _, n in notes])
+            except Exception as e:
+                # Erreur de construction : la réessayer ne changerait rien
+                self.reject_unbuildable(notes, e)
+                return True
+            try:
+                self.connect().send_message(msg)
+            except Exception:
+                self.record_failure(notes)
+                raise
+            self.last_used = time.monotonic()
+            for path, _ in notes:
+                os.remove(path)
+            logging.info(f"E-mail envoyé ({len(notes)} notification(s))")
+            return True
+
+    def reject_unbuildable(self, notes, error):
+        """Place directement dans failed/ les notifications impossibles à construire."""
+        invalid = []
+        for path, note in notes:
+            try:
+                build_notification_email([note])
+            except Exception:
+                invalid.append((path, note))
+        for path, note in invalid or notes:
+            logging.error(f"Notification invalide abandonnée ({error}): {note.get('subject')!r}")
+            os.replace(path, os.path.join(MAIL_QUEUE_DIR, "failed", os.path.basename(path)))
+
+    def record_failure(self, notes):
+        for path, note in notes:
+            note["attempts"] = note.get("attempts", 0) + 1
+            if note["attempts"] >= MAIL_MAX_ATTEMPTS:
+                logging.error(f"Notification abandonnée après {note['attempts']} essais: {note.get('subject')}")
+                _write_mail_file(os.path.join(MAIL_QUEUE_DIR, "failed", os.path.basename(path)), note)
+                os.remove(path)
+            else:
+                _write_mail_file(path, note)
+
+@contextmanager
+def _mail_queue_lock():
+    """Verrou non bloquant entre processus ; produit False s'il est déjà pris."""
+    if fcntl is None:
+        yield True
+        return
+    fd = os.open(os.path.join(MAIL_QUEUE_DIR, "queue.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        yield True
+    finally:
+        os.close(fd)
+
+def header_value(value):
+    """Valeur d'en-tête sur une ligne : un CR/LF venant d'un formulaire ne doit ni
+    injecter d'en-tête ni faire échouer EmailMessage."""
+    return re.sub(r"[\r\n]+", " ", str(value or "")).strip()
+
+def build_notification_email(notes):
+    """Un e-mail par notification, ou un récapitulatif pour une rafale."""
+    msg = EmailMessage()
+    msg["From"] = MAIL_FROM
+    msg["To"] = MAIL_TO
+    if len(notes) == 1:
+        note = notes[0]
+        msg["Subject"] = note["subject"]
+        if note.get("reply_to"):
+            msg["Reply-To"] = note["reply_to"]
+        msg.set_content(note["body"])
+    else:
+        msg["Subject"] = f"{len(notes)} nouvelles notifications"
+        parts = [f"[{n.get('created', '')}] {n['subject']}\n\n{n['body']}" for n in notes]
+        msg.set_content(("\n\n" + "-" * 40 + "\n\n").join(parts))
+    return msg
+
+_mail = {"sender": None}
+_mail_lock = threading.Lock()
+
+def start_mail_sender():
+    """Démarre (une fois par processus) le thread d'envoi si SMTP est configuré."""
+    if not SMTP_HOST:
+        return None
+    with _mail_lock:
+        if _mail["sender"] is None:
+            for folder in ("pending", "failed"):
+                os.makedirs(os.path.join(MAIL_QUEUE_DIR, folder), exist_ok=True)
+            _mail["sender"] = MailSender()
+            _mail["sender"].start()
+        return _mail["sender"]
+
+def send_email_notification(subject: str, body: str, reply_to: str = ""):
+    """Met la notification en file d'attente (écriture disque, pas de réseau)."""
+    sender = start_mail_sender()
+    if sender is None:
+        logging.info(f"[Notification] Sujet: {subject} | Corps: {body}")
+        return
+    note = {"subject": header_value(subject), "body": body, "reply_to": header_value(reply_to),
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "attempts": 0}
+    name = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.json"
+    try:
+        _write_mail_file(os.path.join(MAIL_QUEUE_DIR, "pending", name), note)
+    except OSError as e:
+        logging.error(f"Notification non mise en file ({e}): {subject} | {body}")
+        return
+    sender.wakeup.set()
+
+def flush_mail(timeout=30):
+    """Attend que la file soit vide (tests, arrêt) ; renvoie True si c'est le cas."""
+    sender = start_mail_sender()
+    if sender is None:
+        return True
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not mail_queue_files():
+            return True
+        sender.idle.clear()
+        sender.wakeup.set()
+        sender.idle.wait(max(deadline - time.monotonic(), 0))
+    return not mail_queue_files()
+
+# Notifications restées en file (arrêt ou panne SMTP) : reprise au démarrage
+if SMTP_HOST and mail_queue_files():
+    start_mail_sender()
 
 def admin_login_required(f):
     """
@@ -125,35 +702,2208 @@ def admin_login_required(f):
         return f(*args, **kwargs)
     return decorated
 
+# ----------------------------------------
+# MÉTRIQUES (latences par route, requêtes en cours, octets, écritures)
+# ----------------------------------------
+# Bornes (en secondes) des histogrammes, au format Prometheus "le".
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Jeton optionnel pour qu'un scraper Prometheus lise /metrics sans session admin
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+class Histogram:
+    """
+    Histogramme minimal : un compteur par borne + somme et nombre d'observations.
+    """
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(METRICS_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(METRICS_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimation grossière d'un quantile : borne du bucket qui le contient."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return METRICS_BUCKETS[i] if i < len(METRICS_BUCKETS) else float("inf")
+        return float("inf")
+
+# Familles d'histogrammes : "requests" (par endpoint), "templates", "storage" (par fichier)
+METRICS = {
+    "requests": {},
+    "templates": {},
+    "storage": {},
+    "bytes_sent": {},   # endpoint -> octets envoyés
+    "responses": {},    # (endpoint, status) -> nombre
+    "abuse": {},        # (endpoint, issue) -> nombre (allowed, limited, honeypot, pow_failed)
+    "offenders": {},    # client -> requêtes refusées
+    "in_flight": 0,
+}
+ABUSE_OFFENDERS_MAX = 1000
+_metrics_lock = threading.Lock()
+
+def observe_metric(family, label, value):
+    with _metrics_lock:
+        hist = METRICS[family].get(label)
+        if hist is None:
+            hist = METRICS[family][label] = Histogram()
+        hist.observe(value)
+
+def metrics_summary():
+    """
+    Résumé par endpoint pour le tableau de bord admin (trié par temps cumulé).
+    """
+    with _metrics_lock:
+        rows = [{
+            "endpoint": endpoint,
+            "count": hist.count,
+            "avg_ms": hist.total / hist.count * 1000 if hist.count else 0.0,
+            "p95_ms": hist.quantile(0.95) * 1000,
+            "bytes": METRICS["bytes_sent"].get(endpoint, 0),
+        } for endpoint, hist in METRICS["requests"].items()]
+        storage = [{
+            "file": name,
+            "count": hist.count,
+            "avg_ms": hist.total / hist.count * 1000 if hist.count else 0.0,
+        } for name, hist in METRICS["storage"].items()]
+        in_flight = METRICS["in_flight"]
+        abuse = [{"endpoint": endpoint, "issue": issue, "count": total}
+                 for (endpoint, issue), total in sorted(METRICS["abuse"].items())]
+        offenders = sorted(METRICS["offenders"].items(), key=lambda kv: kv[1], reverse=True)[:10]
+    rows.sort(key=lambda r: r["avg_ms"] * r["count"], reverse=True)
+    return {"routes": rows, "storage": storage, "in_flight": in_flight,
+            "abuse": abuse, "offenders": offenders}
+
+def count_abuse(endpoint, issue, client=None):
+    """Compte une décision du limiteur ; client renseigné pour les requêtes refusées."""
+    with _metrics_lock:
+        key = (endpoint, issue)
+        METRICS["abuse"][key] = METRICS["abuse"].get(key, 0) + 1
+        if client is not None:
+            offenders = METRICS["offenders"]
+            offenders[client] = offenders.get(client, 0) + 1
+            if len(offenders) > ABUSE_OFFENDERS_MAX:
+                # On ne garde que la moitié la plus active
+                keep = sorted(offenders.items(), key=lambda kv: kv[1], reverse=True)[:ABUSE_OFFENDERS_MAX // 2]
+                METRICS["offenders"] = dict(keep)
+
+def _prometheus_escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def render_prometheus_metrics():
+    """
+    Exporte METRICS au format texte Prometheus (version 0.0.4).
+    """
+    lines = []
+    families = (
+        ("requests", "plan_request_duration_seconds", "endpoint", "Durée des requêtes par endpoint."),
+        ("templates", "plan_template_render_seconds", "template", "Durée de rendu Jinja par template."),
+        ("storage", "plan_storage_write_seconds", "file", "Durée des écritures JSON par fichier."),
+    )
+    with _metrics_lock:
+        for family, name, label, doc in families:
+            lines.append(f"# HELP {name} {doc}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, hist in sorted(METRICS[family].items()):
+                lbl = f'{label}="{_prometheus_escape(key)}"'
+                cumulative = 0
+                for bound, c in zip(METRICS_BUCKETS, hist.counts):
+                    cumulative += c
+                    lines.append(f'{name}_bucket{{{lbl},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{lbl},le="+Inf"}} {hist.count}')
+                lines.append(f"{name}_sum{{{lbl}}} {hist.total:.6f}")
+                lines.append(f"{name}_count{{{lbl}}} {hist.count}")
+        lines.append("# HELP plan_response_bytes_total Octets de corps envoyés par endpoint.")
+        lines.append("# TYPE plan_response_bytes_total counter")
+        for endpoint, total in sorted(METRICS["bytes_sent"].items()):
+            lines.append(f'plan_response_bytes_total{{endpoint="{_prometheus_escape(endpoint)}"}} {total}')
+        lines.append("# HELP plan_responses_total Réponses par endpoint et code HTTP.")
+        lines.append("# TYPE plan_responses_total counter")
+        for (endpoint, status), total in sorted(METRICS["responses"].items()):
+            lines.append(f'plan_responses_total{{endpoint="{_prometheus_escape(endpoint)}",status="{status}"}} {total}')
+        lines.append("# HELP plan_abuse_decisions_total Décisions du limiteur anti-abus par endpoint.")
+        lines.append("# TYPE plan_abuse_decisions_total counter")
+        for (endpoint, issue), total in sorted(METRICS["abuse"].items()):
+            lines.append(f'plan_abuse_decisions_total{{endpoint="{_prometheus_escape(endpoint)}",issue="{issue}"}} {total}')
+        lines.append("# HELP plan_requests_in_flight Requêtes en cours de traitement.")
+        lines.append("# TYPE plan_requests_in_flight gauge")
+        lines.append(f"plan_requests_in_flight {METRICS['in_flight']}")
+    return "\n".join(lines) + "\n"
+
+@app.before_request
+def metrics_start():
+    # Enregistré avant log_traffic pour que son écriture soit comptée dans la latence
+    g._metrics_start = time.perf_counter()
+    with _metrics_lock:
+        METRICS["in_flight"] += 1
+
+@app.after_request
+def metrics_response(response):
+    g._metrics_status = response.status_code
+    g._metrics_bytes = response.content_length or 0
+    return response
+
+@app.teardown_request
+def metrics_end(exc):
+    start = g.pop("_metrics_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    endpoint = request.endpoint or "not_found"
+    status = g.pop("_metrics_status", 500)
+    sent = g.pop("_metrics_bytes", 0)
+    with _metrics_lock:
+        METRICS["in_flight"] -= 1
+        hist = METRICS["requests"].get(endpoint)
+        if hist is None:
+            hist = METRICS["requests"][endpoint] = Histogram()
+        hist.observe(elapsed)
+        METRICS["bytes_sent"][endpoint] = METRICS["bytes_sent"].get(endpoint, 0) + sent
+        key = (endpoint, status)
+        METRICS["responses"][key] = METRICS["responses"].get(key, 0) + 1
+
+def _template_render_started(sender, template, context, **extra):
+    g.setdefault("_template_starts", []).append(time.perf_counter())
+
+def _template_render_finished(sender, template, context, **extra):
+    starts = g.get("_template_starts")
+    if starts:
+        elapsed = time.perf_counter() - starts.pop()
+        observe_metric("templates", template.name or "inline", elapsed)
+        timings = g.get("_profile_templates")
+        if timings is not None:
+            timings.append({"name": template.name or "inline", "ms": round(elapsed * 1000, 3)})
+
+before_render_template.connect(_template_render_started, app)
+template_rendered.connect(_template_render_finished, app)
+
+# ----------------------------------------
+# PROFILEUR À LA DEMANDE (cProfile échantillonné, activé par l'admin)
+# ----------------------------------------
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 200))
+PROFILE_TOP_FUNCTIONS = 30
+# État par worker, modifié depuis la page admin du profileur
+PROFILER = {"enabled": False, "sample_rate": 0.1}
+
+@app.before_request
+def profiler_start():
+    if not PROFILER["enabled"] or random.random() >= PROFILER["sample_rate"]:
+        return
+    if request.endpoint in ("admin_profiler", "admin_profile_download", "static"):
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Un autre profileur est déjà actif sur ce thread
+        return
+    g._profiler = profiler
+    g._profile_templates = []
+    g._profile_start = time.perf_counter()
+
+@app.teardown_request
+def profiler_end(exc):
+    profiler = g.pop("_profiler", None)
+    if profiler is None:
+        return
+    profiler.disable()
+    duration = time.perf_counter() - g.pop("_profile_start")
+    try:
+        save_profile(profiler, duration, g.pop("_profile_templates", []))
+    except Exception as e:
+        logging.error(f"Erreur sauvegarde profil: {e}")
+
+def save_profile(profiler, duration, templates):
+    """
+    Écrit le profil (résumé JSON + stats cProfile brutes) puis ne garde que
+    les PROFILE_KEEP plus récents.
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stats = pstats.Stats(profiler)
+    functions = []
+    for (filename, line, func), (cc, nc, tt, ct, callers) in stats.stats.items():
+        functions.append({
+            "func": func,
+            "file": os.path.basename(filename),
+            "line": line,
+            "calls": nc,
+            "tottime_ms": round(tt * 1000, 3),
+            "cumtime_ms": round(ct * 1000, 3),
+        })
+    functions.sort(key=lambda f: f["cumtime_ms"], reverse=True)
+    profile_id = f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}_{uuid.uuid4().hex[:6]}"
+    record = {
+        "id": profile_id,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "method": request.method,
+        "path": request.full_path.rstrip("?"),
+        "endpoint": request.endpoint or "not_found",
+        "status": g.get("_metrics_status", 500),
+        "duration_ms": round(duration * 1000, 3),
+        "templates": templates,
+        "functions": functions[:PROFILE_TOP_FUNCTIONS],
+    }
+    stats.dump_stats(os.path.join(PROFILE_DIR, f"{profile_id}.prof"))
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False)
+    summaries = sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith(".json"))
+    for name in summaries[:-PROFILE_KEEP] if len(summaries) > PROFILE_KEEP else []:
+        for ext in (".json", ".prof"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name[:-5] + ext))
+            except OSError:
+                pass
+
+def load_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, name), "r", encoding="utf-8") as f:
+                profiles.append(json.load(f))
+        except Exception as e:
+            logging.warning(f"Profil illisible {name}: {e}")
+    return profiles
+
+# ----------------------------------------
+# COMPRESSION DES RÉPONSES (gzip / brotli selon Accept-Encoding)
+# ----------------------------------------
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_GZIP_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 5
+COMPRESS_CACHE_MAX_BYTES = int(os.environ.get("COMPRESS_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+# Types textuels uniquement : images, vidéos, PDF et zip sont déjà compressés
+COMPRESSIBLE_MIMETYPES = {
+    "text/html", "text/css", "text/plain", "text/xml", "text/javascript", "text/csv",
+    "application/xml", "application/json", "application/javascript", "image/svg+xml",
+    "application/x-ndjson",
+}
+# Uploads pour lesquels on génère des variantes .gz/.br une fois pour toutes.
+# Aucun format texte n'est accepté en upload ; PDF et DWG se compressent
+# souvent bien, et la variante n'est gardée que si elle fait gagner >= 10 %.
+# Les RVT (flux déjà compressés) et les fichiers au-delà de
+# PRECOMPRESS_MAX_BYTES ne sont pas précompressés.
+PRECOMPRESS_EXTENSIONS = {"pdf", "dwg"}
+PRECOMPRESS_MIN_GAIN = 0.10
+PRECOMPRESS_MAX_BYTES = int(os.environ.get("PRECOMPRESS_MAX_BYTES", 64 * 1024 * 1024))
+# Au-delà de ce volume lu, on abandonne si le gain n'est pas au rendez-vous
+PRECOMPRESS_PROBE_BYTES = 4 * 1024 * 1024
+PRECOMPRESS_CHUNK = 256 * 1024
+SIDECAR_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+
+# Cache LRU des corps compressés, indexé par (empreinte du corps, encodage)
+_compress_cache = OrderedDict()
+_compress_cache_bytes = 0
+_compress_cache_lock = threading.Lock()
+
+def compress_bytes(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+def negotiate_encoding(accept_encodings):
+    """Choisit br puis gzip selon l'en-tête Accept-Encoding du client."""
+    if brotli is not None and accept_encodings.quality("br") > 0:
+        return "br"
+    if accept_encodings.quality("gzip") > 0:
+        return "gzip"
+    return None
+
+def cached_compress(data, encoding):
+    global _compress_cache_bytes
+    key = (hashlib.blake2b(data, digest_size=16).digest(), encoding)
+    with _compress_cache_lock:
+        body = _compress_cache.get(key)
+        if body is not None:
+            _compress_cache.move_to_end(key)
+            return body
+    body = compress_bytes(data, encoding)
+    with _compress_cache_lock:
+        if key not in _compress_cache and len(body) <= COMPRESS_CACHE_MAX_BYTES:
+            _compress_cache[key] = body
+            _compress_cache_bytes += len(body)
+            while _compress_cache_bytes > COMPRESS_CACHE_MAX_BYTES:
+                _, evicted = _compress_cache.popitem(last=False)
+                _compress_cache_bytes -= len(evicted)
+    return body
+
+def stream_compress(chunks, encoding):
+    """Compression incrémentale d'une réponse en flux (mémoire constante)."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=5)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        compress, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        out = compress(chunk)
+        if out:
+            yield out
+    yield finish()
+
+@app.after_request
+def compress_response(response):
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    if (response.status_code != 200 or response.direct_passthrough or request.method == "HEAD"
+            or "Content-Encoding" in response.headers):
+        return response
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        # Réponse générée au fil de l'eau (exports) : ne pas la matérialiser
+        response.response = stream_compress(response.iter_encoded(), encoding)
+        response.headers["Content-Encoding"] = encoding
+        response.headers.pop("Content-Length", None)
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(cached_compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
+
+def precompress_upload(path):
+    """
+    Génère les variantes .gz (et .br si disponible) d'un upload compressible,
+    via la file des traitements de fond pour ne pas rallonger la requête d'upload.
+    """
+    ext = path.rsplit(".", 1)[-1].lower()
+    if ext not in PRECOMPRESS_EXTENSIONS:
+        return
+    try:
+        if os.path.getsize(path) > PRECOMPRESS_MAX_BYTES:
+            return
+    except OSError:
+        return
+    schedule_ingest(("precompress", os.path.basename(path)), _write_sidecars, path)
+
+def _sidecar_compressors():
+    """(suffixe, compress, finish) par encodage disponible."""
+    gz = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+    compressors = [(SIDECAR_EXTENSIONS["gzip"], gz.compress, gz.flush)]
+    if brotli is not None:
+        br = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        compressors.append((SIDECAR_EXTENSIONS["br"], br.process, br.finish))
+    return compressors
+
+def _write_sidecars(path):
+    """Compression en flux (mémoire constante) des deux variantes en une lecture."""
+    outputs = []
+    try:
+        outputs = [(suffix, compress, finish, open(f"{path}{suffix}.{os.getpid()}.tmp", "wb"))
+                   for suffix, compress, finish in _sidecar_compressors()]
+        sizes = dict.fromkeys(suffix for suffix, *_ in outputs)
+        read, probed = 0, False
+        with open(path, "rb") as src:
+            while True:
+                chunk = src.read(PRECOMPRESS_CHUNK)
+                for suffix, compress, finish, out in outputs:
+                    data = compress(chunk) if chunk else finish()
+                    out.write(data)
+                    sizes[suffix] = out.tell()
+                if not chunk:
+                    break
+                read += len(chunk)
+                if not probed and read >= PRECOMPRESS_PROBE_BYTES:
+                    probed = True
+                    # Données déjà compressées : inutile d'aller au bout
+                    if min(sizes.values()) > read * (1 - PRECOMPRESS_MIN_GAIN / 2):
+                        return
+        for suffix, compress, finish, out in outputs:
+            out.close()
+            if sizes[suffix] <= read * (1 - PRECOMPRESS_MIN_GAIN):
+                os.replace(out.name, path + suffix)
+    except Exception as e:
+        logging.error(f"Erreur précompression {path}: {e}")
+    finally:
+        for suffix, compress, finish, out in outputs:
+            out.close()
+            try:
+                os.remove(out.name)
+            except OSError:
+                pass
+
+def remove_sidecars(path):
+    for suffix in SIDECAR_EXTENSIONS.values():
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+
+def send_precompressed(directory, filename, **kwargs):
+    """
+    Sert la variante .br/.gz de filename si elle existe et que le client l'accepte.
+    """
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding:
+        sidecar = filename + SIDECAR_EXTENSIONS[encoding]
+        if os.path.isfile(os.path.join(directory, sidecar)):
+            response = send_from_directory(directory, sidecar, download_name=os.path.basename(filename), **kwargs)
+            response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept-Encoding")
+            return response
+    return send_from_directory(directory, filename, **kwargs)
+
+# ----------------------------------------
+# TRAITEMENTS DES UPLOADS EN TÂCHE DE FOND
+# ----------------------------------------
+# Aperçus des PDF et métadonnées des pièces jointes sont produits après
+# l'upload par un seul thread (file d'attente) : la requête n'attend pas et
+# une rafale d'uploads ne monopolise pas le CPU des workers. Les images
+# dérivées vont dans uploads/previews/, servies comme les images d'upload.
+PREVIEW_DIR = os.path.join(UPLOAD_FOLDER, "previews")
+_ingest = {"queue": queue.Queue(), "thread": None, "pending": set()}
+_ingest_lock = threading.Lock()
+
+def _ingest_worker(jobs):
+    while True:
+        key, fn, args = jobs.get()
+        try:
+            fn(*args)
+        except Exception as e:
+            logging.error(f"Erreur traitement {key[0]} {key[1]}: {e}")
+        finally:
+            with _ingest_lock:
+                _ingest["pending"].discard(key)
+
+def schedule_ingest(key, fn, *args):
+    """Met fn(*args) en file ; sans effet si key (type, fichier) est déjà en attente."""
+    with _ingest_lock:
+        if key in _ingest["pending"]:
+            return
+        _ingest["pending"].add(key)
+        _ingest["queue"].put((key, fn, args))
+        thread = _ingest["thread"]
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=_ingest_worker, args=(_ingest["queue"],),
+                                      name="upload-ingest", daemon=True)
+            _ingest["thread"] = thread
+            thread.start()
+
+# ----------------------------------------
+# APERÇUS DES PDF (carousel, pièces jointes)
+# ----------------------------------------
+# Chaque PDF reçu est rastérisé : une couverture (page 1, grande largeur) et
+# une vignette par page, en JPEG. Le manifeste <pdf>.json est écrit en
+# dernier : tant qu'il manque, les templates gardent l'icône PDF. Moteur :
+# PyMuPDF si installé, sinon pdftoppm/pdfinfo (poppler-utils) ; sans l'un
+# ni l'autre, pas d'aperçu (signalé sur la page admin du carousel). Un PDF
+# antérieur sans aperçu est mis en file au premier affichage.
+# Le rendu tourne toujours dans un processus à part, borné par
+# PDF_PREVIEW_TIMEOUT pour l'ensemble du PDF. Chaque JPEG est écrit sous un
+# nom propre au processus puis renommé, et un verrou <pdf>.lock (flock) évite
+# que deux workers rendent le même PDF en même temps.
+PDF_PREVIEW_COVER_WIDTH = int(os.environ.get("PDF_PREVIEW_COVER_WIDTH", 1200))
+PDF_PREVIEW_THUMB_WIDTH = int(os.environ.get("PDF_PREVIEW_THUMB_WIDTH", 320))
+PDF_PREVIEW_MAX_PAGES = int(os.environ.get("PDF_PREVIEW_MAX_PAGES", 12))
+PDF_PREVIEW_QUALITY = int(os.environ.get("PDF_PREVIEW_QUALITY", 80))
+PDF_PREVIEW_TIMEOUT = float(os.environ.get("PDF_PREVIEW_TIMEOUT", 60))
+if pymupdf is not None:
+    PDF_RASTERIZER = "pymupdf"
+elif shutil.which("pdftoppm") and shutil.which("pdfinfo"):
+    PDF_RASTERIZER = "pdftoppm"
+else:
+    PDF_RASTERIZER = None
+
+PDF_PREVIEW_MANIFESTS = {}  # nom du PDF -> manifeste (sous _ingest_lock)
+
+# Exécuté par `python -c` : un PDF piégé ou trop lourd ne bloque ni ne fait
+# tomber le worker, et le délai peut l'interrompre
+_PYMUPDF_SCRIPT = """
+import json, sys, pymupdf
+path, jobs, quality = sys.argv[1], json.loads(sys.argv[2]), int(sys.argv[3])
+with pymupdf.open(path) as doc:
+    for index, width, dest in jobs:
+        if index >= doc.page_count:
+            continue
+        page = doc.load_page(index)
+        zoom = width / page.rect.width
+        pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+        pix.save(dest, jpg_quality=quality)
+    print(doc.page_count)
+"""
+
+def _time_left(deadline):
+    return max(deadline - time.monotonic(), 0.01)
+
+def _rasterize_pymupdf(path, jobs, deadline):
+    """jobs : [(index de page, largeur, destination)] ; renvoie le nombre de pages."""
+    out = subprocess.run([sys.executable, "-c", _PYMUPDF_SCRIPT, path, json.dumps(jobs), str(PDF_PREVIEW_QUALITY)],
+                         capture_output=True, text=True, errors="replace",
+                         timeout=_time_left(deadline), check=True).stdout
+    return int(out.strip() or 0)
+
+def _pdf_page_count(path, deadline):
+    out = subprocess.run(["pdfinfo", path], capture_output=True, text=True, errors="replace",
+                         timeout=_time_left(deadline), check=True).stdout
+    match = re.search(r"^Pages:\s+(\d+)", out, re.M)
+    return int(match.group(1)) if match else 0
+
+def _rasterize_pdftoppm(path, jobs, deadline):
+    pages = _pdf_page_count(path, deadline)
+    for index, width, dest in jobs:
+        if index >= pages:
+            continue
+        # -singlefile : sortie <racine>.jpg, sans numéro de page
+        subprocess.run(["pdftoppm", "-jpeg", "-jpegopt", f"quality={PDF_PREVIEW_QUALITY}",
+                        "-f", str(index + 1), "-l", str(index + 1), "-singlefile",
+                        "-scale-to-x", str(width), "-scale-to-y", "-1", path, dest[:-len(".jpg")]],
+                       capture_output=True, text=True, errors="replace", timeout=_time_left(deadline), check=True)
+    return pages
+
+@contextmanager
+def _pdf_preview_claim(name):
+    """Verrou non bloquant entre processus sur le rendu d'un PDF ; produit False s'il est pris."""
+    if fcntl is None:
+        yield True
+        return
+    fd = os.open(os.path.join(PREVIEW_DIR, f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        yield True
+    finally:
+        os.close(fd)
+
+def _load_pdf_manifest(name):
+    try:
+        with open(os.path.join(PREVIEW_DIR, f"{name}.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def render_pdf_previews(path):
+    """
+    Produit couverture + vignettes de path puis son manifeste ; renvoie le
+    manifeste, ou None si un autre processus est en train de le produire.
+    """
+    name = os.path.basename(path)
+    os.makedirs(PREVIEW_DIR, exist_ok=True)
+    with _pdf_preview_claim(name) as claimed:
+        if not claimed:
+            return None
+        # Rendu terminé par un autre processus entre la mise en file et le verrou
+        manifest_path = os.path.join(PREVIEW_DIR, f"{name}.json")
+        if os.path.isfile(manifest_path) and os.path.getmtime(manifest_path) >= os.path.getmtime(path):
+            manifest = _load_pdf_manifest(name)
+            if manifest is not None:
+                return manifest
+        return _render_pdf_previews(path, name)
+
+def _render_pdf_previews(path, name):
+    cover = f"{name}.cover.jpg"
+    thumbs = [f"{name}.p{i + 1}.jpg" for i in range(PDF_PREVIEW_MAX_PAGES)]
+    # Noms temporaires propres au processus, renommés une fois le rendu terminé
+    suffix = f".{os.getpid()}.tmp.jpg"
+    jobs = [(0, PDF_PREVIEW_COVER_WIDTH, os.path.join(PREVIEW_DIR, cover[:-len(".jpg")] + suffix))]
+    jobs += [(i, PDF_PREVIEW_THUMB_WIDTH, os.path.join(PREVIEW_DIR, t[:-len(".jpg")] + suffix))
+             for i, t in enumerate(thumbs)]
+    manifest = {"pages": 0, "cover": None, "thumbs": []}
+    start = time.perf_counter()
+    try:
+        rasterize = _rasterize_pymupdf if PDF_RASTERIZER == "pymupdf" else _rasterize_pdftoppm
+        manifest["pages"] = rasterize(path, jobs, time.monotonic() + PDF_PREVIEW_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        logging.error(f"Aperçu PDF {name} abandonné après {PDF_PREVIEW_TIMEOUT:g} s")
+    except subprocess.CalledProcessError as e:
+        detail = (e.stderr or "").strip().rsplit("\n", 1)[-1] or f"code {e.returncode}"
+        logging.error(f"Erreur aperçu PDF {name}: {detail}")
+    except Exception as e:
+        # PDF illisible, chiffré ou trop long à rendre : manifeste vide, pour
+        # ne pas réessayer à chaque affichage
+        logging.error(f"Erreur aperçu PDF {name}: {e}")
+    rendered = []
+    for (_, _, tmp), final in zip(jobs, [cover] + thumbs):
+        if os.path.isfile(tmp):
+            os.replace(tmp, os.path.join(PREVIEW_DIR, final))
+            rendered.append(final)
+    if cover in rendered:
+        manifest["cover"] = cover
+    manifest["thumbs"] = [t for t in thumbs if t in rendered]
+    tmp_path = os.path.join(PREVIEW_DIR, f"{name}.json.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(PREVIEW_DIR, f"{name}.json"))
+    logging.info(f"Aperçus PDF {name}: {len(manifest['thumbs'])}/{manifest['pages']} page(s) "
+                 f"en {(time.perf_counter() - start) * 1000:.0f} ms ({PDF_RASTERIZER})")
+    return manifest
+
+def _build_pdf_previews(path, store):
+    if not os.path.isfile(path):
+        return
+    manifest = render_pdf_previews(path)
+    if manifest is None:
+        return  # rendu en cours dans un autre processus : manifeste lu au prochain affichage
+    with _ingest_lock:
+        PDF_PREVIEW_MANIFESTS[os.path.basename(path)] = manifest
+    if store and manifest["cover"]:
+        # Pages publiques (ETag, export statique) à régénérer
+        notify_content_changed(store)
+
+def schedule_pdf_previews(path, store=None):
+    """
+    Met un PDF d'uploads en file de rastérisation ; store : contenu public
+    dont les pages affichent l'aperçu (notifié une fois celui-ci prêt).
+    """
+    if PDF_RASTERIZER is None or path.rsplit(".", 1)[-1].lower() not in PDF_EXTENSIONS:
+        return
+    schedule_ingest(("pdf", os.path.basename(path)), _build_pdf_previews, path, store)
+
+def remove_pdf_previews(filename):
+    with _ingest_lock:
+        PDF_PREVIEW_MANIFESTS.pop(filename, None)
+    prefix = filename + "."
+    try:
+        names = os.listdir(PREVIEW_DIR)
+    except OSError:
+        return
+    for name in names:
+        if name.startswith(prefix):
+            try:
+                os.remove(os.path.join(PREVIEW_DIR, name))
+            except OSError:
+                pass
+
+@app.template_global()
+def pdf_preview(filename, store=None):
+    """
+    URLs des aperçus d'un PDF d'uploads : {"cover", "thumbs", "pages"},
+    ou None tant qu'ils ne sont pas prêts (le PDF est alors mis en file).
+    """
+    if PDF_RASTERIZER is None or not filename or filename.rsplit(".", 1)[-1].lower() not in PDF_EXTENSIONS:
+        return None
+    name = os.path.basename(filename)
+    with _ingest_lock:
+        manifest = PDF_PREVIEW_MANIFESTS.get(name)
+    if manifest is None:
+        manifest = _load_pdf_manifest(name)
+        if manifest is None:
+            schedule_pdf_previews(os.path.join(UPLOAD_FOLDER, name), store)
+            return None
+        with _ingest_lock:
+            PDF_PREVIEW_MANIFESTS[name] = manifest
+    if not manifest.get("cover"):
+        return None
+    def url(preview):
+        return url_for("uploaded_file", filename=f"previews/{preview}")
+    return {"cover": url(manifest["cover"]), "thumbs": [url(t) for t in manifest["thumbs"]],
+            "pages": manifest["pages"]}
+
+# ----------------------------------------
+# MÉTADONNÉES DES PIÈCES JOINTES (DWG, RVT, XLSX, DOCX)
+# ----------------------------------------
+# Extraction bon marché, sans lire les fichiers en entier : en-tête de
+# version et vignette des DWG, vignette et BasicFileInfo des RVT (conteneur
+# OLE, via olefile), noms de feuilles des XLSX, premières lignes des DOCX,
+# plus les propriétés du document (docProps/core.xml). Le résultat va dans
+# le store "attachments" (nom de fichier -> fiche), affiché dans les vues
+# admin des messages et du portfolio.
+ATTACHMENT_EXTENSIONS = {"dwg", "rvt", "xlsx", "docx"}
+ATTACHMENT_TEXT_LINES = int(os.environ.get("ATTACHMENT_TEXT_LINES", 8))
+ATTACHMENT_MAX_SHEETS = 50
+DWG_VERSIONS = {
+    "AC1.2": "R1.2", "AC1.40": "R1.40", "AC1.50": "R2.05", "AC2.10": "R2.10",
+    "AC1001": "R2.22", "AC1002": "R2.50", "AC1003": "R2.60", "AC1004": "R9", "AC1006": "R10",
+    "AC1009": "R11/R12", "AC1012": "R13", "AC1014": "R14", "AC1015": "AutoCAD 2000",
+    "AC1018": "AutoCAD 2004", "AC1021": "AutoCAD 2007", "AC1024": "AutoCAD 2010",
+    "AC1027": "AutoCAD 2013", "AC1032": "AutoCAD 2018",
+}
+# Lignes de BasicFileInfo reprises telles quelles (libellé affiché)
+RVT_INFO_FIELDS = {
+    "Format": "Version Revit", "Build": "Build", "Worksharing": "Partage de projet",
+    "Username": "Utilisateur", "Central Model Path": "Modèle central",
+    "Last Save Path": "Dernier enregistrement", "Locale when saved": "Langue",
+}
+OOXML_CORE_FIELDS = (("creator", "Auteur"), ("lastModifiedBy", "Modifié par"),
+                     ("modified", "Modifié le"), ("title", "Titre"))
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+def _save_preview(filename, suffix, data):
+    os.makedirs(PREVIEW_DIR, exist_ok=True)
+    name = f"{filename}.{suffix}"
+    tmp_path = os.path.join(PREVIEW_DIR, name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, os.path.join(PREVIEW_DIR, name))
+    return name
+
+def _png_from(data):
+    """PNG inclus dans un flux binaire (de la signature au bloc IEND), ou None."""
+    start = data.find(_PNG_SIGNATURE)
+    end = data.find(b"IEND", start)
+    return data[start:end + 8] if start >= 0 and end >= 0 else None
+
+def _bmp_from_dib(dib):
+    """Ajoute l'en-tête de fichier BMP à un DIB (vignette des anciens DWG)."""
+    header_size, = struct.unpack_from("<I", dib, 0)
+    bit_count, = struct.unpack_from("<H", dib, 14)
+    colors_used, = struct.unpack_from("<I", dib, 32)
+    colors = colors_used or (1 << bit_count if bit_count <= 8 else 0)
+    offset = 14 + header_size + 4 * colors
+    return b"BM" + struct.pack("<IHHI", 14 + len(dib), 0, 0, offset) + dib
+
+def extract_dwg(path, filename, info):
+    with open(path, "rb") as f:
+        head = f.read(0x11)
+        code = head[:6].rstrip(b"\x00").decode("ascii", "replace")
+        info["fields"].append(["Version", f"{DWG_VERSIONS.get(code, 'inconnue')} ({code})"])
+        if len(head) < 0x11 or not code.startswith("AC10") or code < "AC1012":
+            return
+        # R13+ : adresse de l'image de prévisualisation à l'offset 0x0D, puis
+        # sentinelle (16 octets), taille, nombre d'entrées (code, début, taille)
+        image_at, = struct.unpack_from("<I", head, 0x0D)
+        f.seek(image_at + 16 + 4)
+        count = f.read(1)
+        if not count:
+            return
+        entries = [struct.unpack("<BII", f.read(9)) for _ in range(min(count[0], 8))]
+        for kind, start, size in entries:
+            # 2 = BMP (DIB), 6 = PNG (2013+) ; 1 = en-tête, 3 = WMF ignorés
+            if kind in (2, 6) and 0 < size <= 4 * 1024 * 1024:
+                f.seek(start)
+                data = f.read(size)
+                if kind == 6 and data.startswith(_PNG_SIGNATURE):
+                    info["thumbnail"] = _save_preview(filename, "thumb.png", data)
+                elif kind == 2 and len(data) >= 40:
+                    info["thumbnail"] = _save_preview(filename, "thumb.bmp", _bmp_from_dib(data))
+                return
+
+def extract_rvt(path, filename, info):
+    if olefile is None:
+        info["error"] = "olefile non installé (pip install olefile)"
+        return
+    with olefile.OleFileIO(path) as ole:
+        if ole.exists("BasicFileInfo"):
+            raw = ole.openstream("BasicFileInfo").read()
+            # Texte UTF-16 selon les versions, parfois précédé d'octets binaires
+            for text in (raw.decode("utf-16-le", "ignore"), raw.decode("latin-1")):
+                found = {}
+                for line in re.split(r"[\r\n\x00]+", text):
+                    label, sep, value = line.partition(":")
+                    if sep and label.strip() in RVT_INFO_FIELDS and value.strip():
+                        found.setdefault(label.strip(), value.strip())
+                if found:
+                    info["fields"] += [[RVT_INFO_FIELDS[k], v] for k, v in found.items()]
+                    break
+        if ole.exists("RevitPreview4.0"):
+            png = _png_from(ole.openstream("RevitPreview4.0").read())
+            if png:
+                info["thumbnail"] = _save_preview(filename, "thumb.png", png)
+
+def _zip_member(zf, name, limit=8 * 1024 * 1024):
+    """Contenu d'un membre d'archive, refusé au-delà de limit une fois décompressé."""
+    if zf.getinfo(name).file_size > limit:
+        raise ValueError(f"{name} trop volumineux")
+    return zf.read(name)
+
+def _ooxml_core(zf, info):
+    try:
+        root = ElementTree.fromstring(_zip_member(zf, "docProps/core.xml"))
+    except (KeyError, ValueError, ElementTree.ParseError):
+        return
+    values = {el.tag.rsplit("}", 1)[-1]: (el.text or "").strip() for el in root}
+    info["fields"] += [[label, values[key]] for key, label in OOXML_CORE_FIELDS if values.get(key)]
+
+def extract_xlsx(path, filename, info):
+    with zipfile.ZipFile(path) as zf:
+        root = ElementTree.fromstring(_zip_member(zf, "xl/workbook.xml"))
+        sheets = [el.get("name", "") for el in root.iter() if el.tag.rsplit("}", 1)[-1] == "sheet"]
+        info["list_label"] = "Feuilles"
+        info["list"] = sheets[:ATTACHMENT_MAX_SHEETS]
+        if len(sheets) > ATTACHMENT_MAX_SHEETS:
+            info["list"].append(f"… {len(sheets) - ATTACHMENT_MAX_SHEETS} de plus")
+        _ooxml_core(zf, info)
+
+def extract_docx(path, filename, info):
+    lines = []
+    with zipfile.ZipFile(path) as zf:
+        # Lecture en flux : on s'arrête dès les premières lignes non vides
+        with zf.open("word/document.xml") as f:
+            parts = []
+            for event, el in ElementTree.iterparse(f, events=("end",)):
+                tag = el.tag.rsplit("}", 1)[-1]
+                if tag == "t" and el.text:
+                    parts.append(el.text)
+                elif tag == "p":
+                    line = "".join(parts).strip()
+                    parts = []
+                    if line:
+                        lines.append(line[:300])
+                        if len(lines) >= ATTACHMENT_TEXT_LINES:
+                            break
+                    el.clear()
+        _ooxml_core(zf, info)
+    info["list_label"] = "Début du texte"
+    info["list"] = lines
+
+ATTACHMENT_EXTRACTORS = {"dwg": extract_dwg, "rvt": extract_rvt, "xlsx": extract_xlsx, "docx": extract_docx}
+
+def extract_attachment(path):
+    """Fiche d'une pièce jointe : infos fichier, champs, liste, vignette."""
+    filename = os.path.basename(path)
+    ext = filename.rsplit(".", 1)[-1].lower()
+    stat = os.stat(path)
+    info = {"type": ext, "size": stat.st_size,
+            "modified": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S"),
+            "fields": [], "list_label": "", "list": [], "thumbnail": None, "error": ""}
+    start = time.perf_counter()
+    try:
+        ATTACHMENT_EXTRACTORS[ext](path, filename, info)
+    except Exception as e:
+        # Fichier corrompu ou d'un autre format : la fiche garde les infos de base
+        info["error"] = f"{type(e).__name__}: {e}"
+        logging.warning(f"Métadonnées illisibles pour {filename}: {info['error']}")
+    logging.info(f"Métadonnées de {filename} extraites en {(time.perf_counter() - start) * 1000:.0f} ms")
+    return info
+
+def _index_attachment(path):
+    if os.path.isfile(path):
+        apply_op("attachments", "set", extract_attachment(path), os.path.basename(path))
+
+def forget_attachments(filenames):
+    """
+    À la suppression d'un message, d'un projet ou d'un fichier : retire leurs
+    fiches de l'index et leurs aperçus (previews/<fichier>.*, vignettes comprises).
+    """
+    names = {os.path.basename(f) for f in filenames if f}
+    for name in names:
+        remove_pdf_previews(name)
+    # Pas d'écriture (ni de vidage des opérations différées) sans fiche à retirer
+    with reading("attachments"):
+        indexed = [name for name in names if name in ATTACHMENTS]
+    for name in indexed:
+        _commit(lambda name=name: ("attachments", "pop", None, name) if name in ATTACHMENTS else None)
+
+def schedule_attachment_metadata(path):
+    if path.rsplit(".", 1)[-1].lower() in ATTACHMENT_EXTENSIONS:
+        schedule_ingest(("metadata", os.path.basename(path)), _index_attachment, path)
+
+@app.template_global()
+def attachment_info(filename):
+    """Fiche d'une pièce jointe, ou None (extraction en cours ou type non géré)."""
+    if not filename or filename.rsplit(".", 1)[-1].lower() not in ATTACHMENT_EXTENSIONS:
+        return None
+    with reading("attachments"):
+        info = ATTACHMENTS.get(filename)
+    if info is None:
+        # Fichier antérieur à l'index : extrait au premier affichage
+        path = os.path.join(UPLOAD_FOLDER, os.path.basename(filename))
+        if os.path.isfile(path):
+            schedule_attachment_metadata(path)
+        return None
+    if info.get("thumbnail"):
+        info = dict(info, thumbnail_url=url_for("uploaded_file", filename=f"previews/{info['thumbnail']}"))
+    return info
+
+# ----------------------------------------
+# ASSETS FRONT AUTO-HÉBERGÉS (bundles minifiés avec empreinte)
+# ----------------------------------------
+# `python app.py assets` télécharge une fois les fichiers tiers dans assets/vendor
+# (ou les copie depuis --source), puis produit assets/dist/<bundle>.<hash>.<ext>
+# et assets/dist/manifest.json. Sans manifest, les templates retombent sur les CDN.
+ASSETS_DIR = os.environ.get("ASSETS_DIR", "assets")
+ASSETS_VENDOR_DIR = os.path.join(ASSETS_DIR, "vendor")
+ASSETS_DIST_DIR = os.path.join(ASSETS_DIR, "dist")
+ASSETS_MANIFEST_FILE = os.path.join(ASSETS_DIST_DIR, "manifest.json")
+ASSETS_MAX_AGE = 365 * 24 * 3600
+VENDOR_ASSETS = {
+    "bootstrap.min.css": "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css",
+    "aos.css": "https://cdn.jsdelivr.net/npm/aos@2.3.4/dist/aos.css",
+    "bootstrap-icons.css": "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.css",
+    "fonts/bootstrap-icons.woff2": "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/fonts/bootstrap-icons.woff2",
+    "fonts/bootstrap-icons.woff": "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/fonts/bootstrap-icons.woff",
+    "bootstrap.bundle.min.js": "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js",
+    "aos.js": "https://cdn.jsdelivr.net/npm/aos@2.3.4/dist/aos.js",
+    "jquery.min.js": "https://cdn.jsdelivr.net/npm/jquery@3.6.0/dist/jquery.min.js",
+    "spritespin.min.js": "https://cdn.jsdelivr.net/npm/spritespin@4.0.11/release/spritespin.min.js",
+}
+ASSET_BUNDLES = {
+    "site.css": ["bootstrap.min.css", "aos.css", "bootstrap-icons.css"],
+    "site.js": ["bootstrap.bundle.min.js", "aos.js"],
+    # Chargé uniquement par les pages qui contiennent des vues tournantes
+    "spin.js": ["jquery.min.js", "spritespin.min.js"],
+}
+_CSS_COMMENT_RE = re.compile(r"/\*(?!!).*?\*/", re.S)
+_CSS_SPACE_RE = re.compile(r"\s+")
+_CSS_PUNCT_RE = re.compile(r"\s*([{};,>])\s*")
+_CSS_FONT_URL_RE = re.compile(r"""url\((['"]?)\.?/?(fonts/[^'")?#]+)[^'")]*\1\)""")
+
+def load_json_manifest(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+ASSET_MANIFEST = load_json_manifest(ASSETS_MANIFEST_FILE)
+
+@app.template_global()
+def asset_url(name):
+    """URL du bundle `name` (ex. "site.css"), ou None si non construit."""
+    hashed = ASSET_MANIFEST.get(name)
+    return url_for("asset_file", filename=hashed) if hashed else None
+
+def minify_css(css):
+    css = _CSS_COMMENT_RE.sub("", css)
+    css = _CSS_SPACE_RE.sub(" ", css)
+    css = _CSS_PUNCT_RE.sub(r"\1", css)
+    return css.replace(";}", "}").strip()
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+def write_dist_file(name, data):
+    """Écrit dist/<base>.<hash>.<ext> (+ variantes compressées) et renvoie le nom."""
+    base, ext = os.path.splitext(name)
+    hashed = f"{base}.{fingerprint(data)}{ext}"
+    path = os.path.join(ASSETS_DIST_DIR, hashed)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    if ext in (".css", ".js"):
+        for encoding, suffix in SIDECAR_EXTENSIONS.items():
+            if encoding == "br" and brotli is None:
+                continue
+            with open(path + suffix, "wb") as f:
+                f.write(compress_bytes(data, encoding))
+    return hashed
+
+def fetch_vendor_assets(source=None):
+    """Copie (depuis source) ou télécharge les fichiers tiers manquants."""
+    for name, url in VENDOR_ASSETS.items():
+        dest = os.path.join(ASSETS_VENDOR_DIR, name)
+        if os.path.exists(dest):
+            continue
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if source:
+            shutil.copyfile(os.path.join(source, name), dest)
+        else:
+            logging.info(f"Téléchargement {url}")
+            with urllib.request.urlopen(url, timeout=30) as resp, open(dest, "wb") as f:
+                shutil.copyfileobj(resp, f)
+
+def build_assets(source=None, fetch=True):
+    """
+    Construit les bundles minifiés et le manifest à partir d'assets/vendor.
+    """
+    global ASSET_MANIFEST
+    if fetch:
+        fetch_vendor_assets(source)
+    # On ne supprime que les sorties du build précédent (les polices du thème restent)
+    for hashed in ASSET_MANIFEST.values():
+        for suffix in ("", *SIDECAR_EXTENSIONS.values()):
+            try:
+                os.remove(os.path.join(ASSETS_DIST_DIR, hashed + suffix))
+            except OSError:
+                pass
+    manifest = {}
+    # Polices d'icônes : copiées avec empreinte, puis référencées par les CSS
+    for name in VENDOR_ASSETS:
+        if name.startswith("fonts/"):
+            with open(os.path.join(ASSETS_VENDOR_DIR, name), "rb") as f:
+                manifest[name] = write_dist_file(name, f.read())
+    for bundle, parts in ASSET_BUNDLES.items():
+        chunks = []
+        for part in parts:
+            with open(os.path.join(ASSETS_VENDOR_DIR, part), "r", encoding="utf-8") as f:
+                chunks.append(f.read())
+        if bundle.endswith(".css"):
+            content = minify_css("\n".join(chunks))
+            content = _CSS_FONT_URL_RE.sub(
+                lambda m: f'url("{manifest.get(m.group(2), m.group(2))}")', content)
+        else:
+            content = ";\n".join(c.strip().rstrip(";") for c in chunks) + ";\n"
+        manifest[bundle] = write_dist_file(bundle, content.encode("utf-8"))
+    with open(ASSETS_MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    ASSET_MANIFEST = manifest
+    return manifest
+
+# ----------------------------------------
+# POLICES DU THÈME AUTO-HÉBERGÉES (sous-ensemble latin/français en WOFF2)
+# ----------------------------------------
+# Sources : assets/fonts-src/<Famille>/*.ttf|otf|woff|woff2 (vendorisées ou
+# uploadées depuis les paramètres admin). Sorties : assets/dist/theme-fonts/.
+FONT_EXTENSIONS = {"ttf", "otf", "woff", "woff2"}
+FONTS_SOURCE_DIR = os.path.join(ASSETS_DIR, "fonts-src")
+THEME_FONTS_DIR = os.path.join(ASSETS_DIST_DIR, "theme-fonts")
+THEME_FONTS_MANIFEST = os.path.join(ASSETS_DIST_DIR, "theme-fonts.json")
+# Graisses réellement utilisées par le CSS du thème (corps, titres, gras)
+THEME_FONT_WEIGHTS = (400, 500, 600, 700)
+FONT_PRELOAD_WEIGHTS = (400, 600)
+FONT_UNICODE_RANGE = ("U+0020-007E, U+00A0-00FF, U+0152-0153, U+0178, U+02C6, U+02DC, "
+                      "U+2013-2014, U+2018-201E, U+2022, U+2026, U+2039-203A, U+20AC")
+_FONT_WEIGHT_NAMES = (
+    ("extralight", 200), ("ultralight", 200), ("semibold", 600), ("demibold", 600),
+    ("extrabold", 800), ("ultrabold", 800), ("thin", 100), ("light", 300),
+    ("regular", 400), ("book", 400), ("medium", 500), ("bold", 700), ("black", 900),
+)
+_theme_fonts_lock = threading.Lock()
+
+def font_family_slug(family):
+    return re.sub(r"[^a-z0-9]+", "-", family.lower()).strip("-")
+
+def font_unicodes():
+    codes = []
+    for part in FONT_UNICODE_RANGE.split(","):
+        start, _, end = part.strip()[2:].partition("-")
+        codes.extend(range(int(start, 16), int(end or start, 16) + 1))
+    return codes
+
+def font_face_info(path):
+    """
+    Renvoie (graisse, italique, variable) d'un fichier de police.
+    Sans fontTools, la graisse est déduite du nom du fichier.
+    """
+    name = os.path.basename(path).lower()
+    if font_subset is not None:
+        try:
+            font = TTFont(path, lazy=True)
+            if "fvar" in font:
+                axis = next((a for a in font["fvar"].axes if a.axisTag == "wght"), None)
+                weights = (int(axis.minValue), int(axis.maxValue)) if axis else (400, 400)
+                return weights, "italic" in name, True
+            os2 = font["OS/2"]
+            return os2.usWeightClass, bool(os2.fsSelection & 1), False
+        except Exception as e:
+            logging.warning(f"Police illisible {path}: {e}")
+            return None, False, False
+    compact = name.replace("-", "").replace("_", "").replace(" ", "")
+    weight = next((w for key, w in _FONT_WEIGHT_NAMES if key in compact), 400)
+    found = re.search(r"(?<!\d)([1-9]00)(?!\d)", name)
+    return (int(found.group(1)) if found else weight), "italic" in name, False
+
+def find_font_sources(family):
+    """
+    Fichiers sources droits de la famille, indexés par graisse
+    (ou une seule entrée "var" pour une police variable).
+    """
+    folder = os.path.join(FONTS_SOURCE_DIR, font_family_slug(family))
+    if not os.path.isdir(folder):
+        return {}
+    sources = {}
+    for root, dirs, files in os.walk(folder):
+        for fname in sorted(files):
+            if fname.rsplit(".", 1)[-1].lower() not in FONT_EXTENSIONS:
+                continue
+            path = os.path.join(root, fname)
+            weight, italic, variable = font_face_info(path)
+            if weight is None or italic:
+                continue
+            if variable:
+                return {"var": (path, weight)}
+            if weight in THEME_FONT_WEIGHTS:
+                # À graisse égale, on préfère une source déjà en woff2
+                if weight not in sources or fname.lower().endswith(".woff2"):
+                    sources[weight] = (path, weight)
+    return sources
+
+def subset_font_to_woff2(src, dest):
+    """Sous-ensemble latin/français en WOFF2 ; copie simple si fontTools manque."""
+    if font_subset is None or brotli is None:
+        if not src.lower().endswith(".woff2"):
+            return False
+        shutil.copyfile(src, dest)
+        return True
+    options = font_subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["kern", "liga", "calt", "ccmp", "locl", "mark", "mkmk"]
+    options.name_IDs = []
+    options.hinting = False
+    font = font_subset.load_font(src, options)
+    subsetter = font_subset.Subsetter(options)
+    subsetter.populate(unicodes=font_unicodes())
+    subsetter.subset(font)
+    font_subset.save_font(font, dest, options)
+    return True
+
+def load_theme_fonts():
+    data = load_json_manifest(THEME_FONTS_MANIFEST)
+    return data if data.get("faces") else {}
+
+THEME_FONTS = load_theme_fonts()
+
+def build_theme_fonts(family):
+    """
+    Génère les WOFF2 de la famille choisie et leur manifest.
+    Renvoie False (et garde Google Fonts) si aucune source n'est disponible.
+    """
+    global THEME_FONTS
+    with _theme_fonts_lock:
+        sources = find_font_sources(family)
+        if not sources:
+            logging.info(f"Aucune source locale pour la police {family}, repli sur Google Fonts.")
+            return False
+        os.makedirs(THEME_FONTS_DIR, exist_ok=True)
+        slug = font_family_slug(family)
+        faces = {}
+        for key, (src, weight) in sorted(sources.items(), key=lambda kv: str(kv[0])):
+            tmp_path = os.path.join(THEME_FONTS_DIR, f".{slug}-{key}.tmp.woff2")
+            try:
+                if not subset_font_to_woff2(src, tmp_path):
+                    logging.warning(f"Conversion WOFF2 impossible sans fontTools: {src}")
+                    continue
+                with open(tmp_path, "rb") as f:
+                    hashed = f"{slug}-{key}.{fingerprint(f.read())}.woff2"
+                os.replace(tmp_path, os.path.join(THEME_FONTS_DIR, hashed))
+            except Exception as e:
+                logging.error(f"Erreur sous-ensemble police {src}: {e}")
+                continue
+            # Plage (min, max) des polices variables : liste, comme une fois relue du manifeste JSON
+            faces[str(key)] = {"file": hashed, "weight": list(weight) if isinstance(weight, tuple) else weight}
+        if not faces:
+            return False
+        # Nettoyage des fichiers des familles / versions précédentes
+        keep = {face["file"] for face in faces.values()}
+        for fname in os.listdir(THEME_FONTS_DIR):
+            if fname not in keep:
+                try:
+                    os.remove(os.path.join(THEME_FONTS_DIR, fname))
+                except OSError:
+                    pass
+        THEME_FONTS = {"family": family, "faces": faces}
+        with open(THEME_FONTS_MANIFEST, "w", encoding="utf-8") as f:
+            json.dump(THEME_FONTS, f, indent=2, ensure_ascii=False)
+        logging.info(f"Polices du thème régénérées pour {family}: {sorted(faces)}")
+        return True
+
+def schedule_theme_fonts_build(family):
+    threading.Thread(target=build_theme_fonts, args=(family,), daemon=True).start()
+
+@app.template_global()
+def theme_fonts():
+    """
+    @font-face et préchargements de la police du thème, ou None si elle
+    n'est pas (encore) auto-hébergée.
+    """
+    fonts = THEME_FONTS
+    if not fonts or fonts.get("family") != SITE["font"]:
+        return None
+    css, preload = [], []
+    for key, face in fonts["faces"].items():
+        url = url_for("asset_file", filename=f"theme-fonts/{face['file']}")
+        weight = face["weight"]
+        weight_css = f"{weight[0]} {weight[1]}" if isinstance(weight, (list, tuple)) else weight
+        css.append(f"@font-face{{font-family:'{fonts['family']}';font-style:normal;"
+                   f"font-weight:{weight_css};font-display:swap;"
+                   f"src:url('{url}') format('woff2');unicode-range:{FONT_UNICODE_RANGE}}}")
+        if key == "var" or weight in FONT_PRELOAD_WEIGHTS:
+            preload.append(url)
+    return {"css": "".join(css), "preload": preload}
+
+# ----------------------------------------
+# FEUILLE DU THÈME ET CSS CRITIQUE
+# ----------------------------------------
+# La feuille "theme.css" dépend des couleurs/police/photo de config_theme : elle
+# est rendue une fois par combinaison et servie sous une URL avec empreinte.
+# Pour chaque page publique, on en extrait (avec le bundle site.css) les règles
+# utiles au-dessus de la ligne de flottaison, inlinées dans <head>.
+CRITICAL_PAGES = {
+    "index": "index.html",
+    "services": "services.html",
+    "portfolio": "portfolio.html",
+    "galeries": "galleries.html",
+    "pourquoi": "pourquoi.html",
+    "contact": "contact.html",
+}
+# Nombre d'éléments du <body> considérés comme visibles au premier affichage
+CRITICAL_FOLD_ELEMENTS = int(os.environ.get("CRITICAL_FOLD_ELEMENTS", 120))
+CRITICAL_CSS_FILE = os.path.join(ASSETS_DIST_DIR, "critical.json")
+# Classes ajoutées côté client, dont les variantes doivent être prêtes au 1er rendu
+CRITICAL_ALWAYS_CLASSES = {"dark-mode", "show", "active", "collapse"}
+_DYNAMIC_PSEUDO_RE = re.compile(r":(hover|focus|active|visited|focus-visible|focus-within)\b")
+_PSEUDO_RE = re.compile(r"::?[\w-]+(\([^)]*\))?")
+_ATTRIBUTE_RE = re.compile(r"\[[^\]]*\]")
+_SELECTOR_TOKEN_RE = re.compile(r"([.#]?)(-?[_a-zA-Z][\w-]*)")
+_CSS_RELATIVE_URL_RE = re.compile(r"""url\((['"]?)(?!data:|[a-z]+://|/)""")
+
+_theme_css_cache = {"key": None, "css": "", "hash": "", "rules": None, "critical": {}}
+_theme_css_lock = threading.RLock()
+
+def theme_css_key():
+    values = [SITE["couleur"], SITE["secondary"], SITE["accent"], SITE["font"], SITE["photo"],
+              ASSET_MANIFEST.get("site.css", ""), fingerprint(template_dict["theme.css"].encode("utf-8"))]
+    return fingerprint(json.dumps(values).encode("utf-8"))
+
+def theme_stylesheet():
+    """
+    (css, empreinte) de la feuille du thème courant ; réinitialise le CSS
+    critique quand le thème a changé.
+    """
+    key = theme_css_key()
+    with _theme_css_lock:
+        if _theme_css_cache["key"] != key:
+            css = minify_css(render_template("theme.css"))
+            stored = load_json_manifest(CRITICAL_CSS_FILE)
+            _theme_css_cache.update({
+                "key": key,
+                "css": css,
+                "hash": fingerprint(css.encode("utf-8")),
+                "rules": None,
+                "critical": stored.get("pages", {}) if stored.get("key") == key else {},
+            })
+        return _theme_css_cache["css"], _theme_css_cache["hash"]
+
+@app.template_global()
+def theme_css_url():
+    return url_for("theme_stylesheet_file", css_hash=theme_stylesheet()[1])
+
+class _FoldCollector(HTMLParser):
+    """Collecte balises, classes et ids des premiers éléments du <body>."""
+
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+        self.count = 0
+        self.in_body = False
+        self.tags = {"html", "body"}
+        self.classes = set(CRITICAL_ALWAYS_CLASSES)
+        self.ids = set()
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            self.in_body = True
+        if not self.in_body or self.count >= self.limit:
+            return
+        self.count += 1
+        self.tags.add(tag)
+        for name, value in attrs:
+            if name == "class" and value:
+                self.classes.update(value.split())
+            elif name == "id" and value:
+                self.ids.add(value)
+
+def split_css_rules(css):
+    """Découpe une feuille minifiée en [(prélude, corps)] (blocs imbriqués compris)."""
+    rules, i, n = [], 0, len(css)
+    while i < n:
+        j = css.find("{", i)
+        if j < 0:
+            break
+        prelude = css[i:j].rsplit(";", 1)[-1].strip()  # ignore @charset/@import
+        depth, k = 1, j + 1
+        while k < n and depth:
+            if css[k] == "{":
+                depth += 1
+            elif css[k] == "}":
+                depth -= 1
+            k += 1
+        rules.append((prelude, css[j + 1:k - 1]))
+        i = k
+    return rules
+
+def selector_in_fold(selector, fold):
+    if _DYNAMIC_PSEUDO_RE.search(selector):
+        return False
+    selector = _ATTRIBUTE_RE.sub("", _PSEUDO_RE.sub("", selector))
+    for prefix, name in _SELECTOR_TOKEN_RE.findall(selector):
+        if prefix == ".":
+            if name not in fold.classes:
+                return False
+        elif prefix == "#":
+            if name not in fold.ids:
+                return False
+        elif name.lower() not in fold.tags:
+            return False
+    return True
+
+def filter_critical_rules(rules, fold):
+    out = []
+    for prelude, body in rules:
+        if prelude.startswith(("@media", "@supports")):
+            inner = filter_critical_rules(split_css_rules(body), fold)
+            if inner:
+                out.append(f"{prelude}{{{inner}}}")
+        elif prelude.startswith("@font-face"):
+            out.append(f"{prelude}{{{body}}}")
+        elif prelude.startswith("@"):
+            continue  # @keyframes etc. : inutiles au premier rendu
+        else:
+            kept = [sel.strip() for sel in prelude.split(",") if selector_in_fold(sel.strip(), fold)]
+            if kept:
+                out.append(f"{','.join(kept)}{{{body}}}")
+    return "".join(out)
+
+def _critical_rules():
+    """Règles de site.css + thème, découpées une fois par thème (contexte de requête requis)."""
+    with _theme_css_lock:
+        if _theme_css_cache["rules"] is None:
+            with open(os.path.join(ASSETS_DIST_DIR, ASSET_MANIFEST["site.css"]), "r", encoding="utf-8") as f:
+                site_css = f.read()
+            # Une fois inlinées, les url() relatives du bundle doivent viser /assets/
+            assets_base = url_for("asset_file", filename="x")[:-1]
+            site_css = _CSS_RELATIVE_URL_RE.sub(lambda m: f"url({m.group(1)}{assets_base}", site_css)
+            _theme_css_cache["rules"] = split_css_rules(site_css) + split_css_rules(_theme_css_cache["css"])
+        return _theme_css_cache["rules"]
+
+def compute_critical_css(endpoint):
+    """
+    Rend la page `endpoint` et ne garde que les règles CSS qui touchent ses
+    premiers éléments. Jamais sous _theme_css_lock : la vue prend les verrous
+    de lecture des stores.
+    """
+    rules = _critical_rules()
+    with app.test_request_context(url_for(endpoint)):
+        g._critical_pass = True
+        try:
+            html = app.view_functions[endpoint]()
+        finally:
+            g.pop("_critical_pass", None)
+    fold = _FoldCollector(CRITICAL_FOLD_ELEMENTS)
+    fold.feed(html if isinstance(html, str) else html.get_data(as_text=True))
+    return filter_critical_rules(rules, fold)
+
+@app.template_global()
+def critical_css():
+    """
+    CSS critique de la page publique courante. None si la page n'en a pas,
+    si le bundle local site.css n'est pas construit, ou pendant son calcul :
+    celui-ci se fait en tâche de fond, jamais pendant le rendu d'une requête
+    (qui tient déjà des verrous de lecture de stores).
+    """
+    endpoint = request.endpoint
+    if endpoint not in CRITICAL_PAGES or g.get("_critical_pass") or not ASSET_MANIFEST.get("site.css"):
+        return None
+    theme_stylesheet()
+    with _theme_css_lock:
+        css = _theme_css_cache["critical"].get(endpoint)
+    if css is None:
+        schedule_critical_css_build()
+    return css
+
+def build_critical_css():
+    """
+    Calcule le CSS critique de toutes les pages publiques pour le thème courant
+    et l'enregistre pour les autres workers.
+    """
+    if not ASSET_MANIFEST.get("site.css"):
+        logging.warning("Bundle site.css absent : lancer `python app.py assets` d'abord.")
+        return {}
+    with app.test_request_context("/"):
+        theme_stylesheet()
+        with _theme_css_lock:
+            key = _theme_css_cache["key"]
+        pages = {endpoint: compute_critical_css(endpoint) for endpoint in CRITICAL_PAGES}
+        with _theme_css_lock:
+            if _theme_css_cache["key"] != key:
+                return pages  # thème changé entre-temps : un nouveau calcul suivra
+            _theme_css_cache["critical"] = dict(pages)
+    with open(CRITICAL_CSS_FILE, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "pages": pages}, f, ensure_ascii=False)
+    return pages
+
+_critical_build = {"running": False}
+
+def schedule_critical_css_build():
+    """Un seul calcul en tâche de fond à la fois."""
+    with _theme_css_lock:
+        if _critical_build["running"]:
+            return
+        _critical_build["running"] = True
+
+    def run():
+        try:
+            build_critical_css()
+        except Exception as e:
+            logging.error(f"Erreur calcul CSS critique: {e}")
+        finally:
+            with _theme_css_lock:
+                _critical_build["running"] = False
+    threading.Thread(target=run, daemon=True).start()
+
+# ----------------------------------------
+# EXPORT STATIQUE DES PAGES PUBLIQUES
+# ----------------------------------------
+# `python app.py export` rend les pages publiques de chaque langue (/fr/...,
+# /en/...) en HTML statique + variantes .gz/.br dans EXPORT_DIR, un lien
+# symbolique basculé atomiquement vers le dernier build. Exemple nginx :
+#   location / { root /srv/plan/export; gzip_static on;
+#                try_files $uri $uri/index.html @flask; }
+# Contact, la racine / (choix de langue) et l'admin restent servis par Flask.
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "export")
+EXPORT_PAGES = ("index", "services", "portfolio", "galeries", "pourquoi")
+# URL publique du site, pour les liens absolus (hreflang) des pages exportées
+SITE_URL = os.environ.get("SITE_URL", "")
+EXPORT_KEEP_BUILDS = 2
+# Délai de regroupement des écritures admin avant un nouvel export
+EXPORT_DEBOUNCE_SECONDS = float(os.environ.get("EXPORT_DEBOUNCE_SECONDS", 2.0))
+EXPORT_AUTO = os.environ.get("STATIC_EXPORT_AUTO", "").lower() in ("true", "1", "yes")
+_export_lock = threading.Lock()
+_export_timer = None
+
+def write_precompressed(path, data):
+    """Écrit data et ses variantes .gz/.br (toujours gardées, pour gzip_static)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    for encoding, suffix in SIDECAR_EXTENSIONS.items():
+        if encoding == "br" and brotli is None:
+            continue
+        with open(path + suffix, "wb") as f:
+            f.write(compress_bytes(data, encoding))
+
+def render_public_page(endpoint, lang):
+    """Rend une page publique hors requête ; renvoie (chemin, html)."""
+    with app.test_request_context("/"):
+        path = url_for(endpoint, lang_code=lang)
+    with app.test_request_context(path, base_url=SITE_URL or None):
+        g.lang = lang
+        html = app.view_functions[endpoint]()
+    return path, html if isinstance(html, str) else html.get_data(as_text=True)
+
+def export_static_site(out_dir=None):
+    """
+    Rend toutes les variantes publiques dans un nouveau dossier de build puis
+    fait pointer EXPORT_DIR dessus. Renvoie le dossier du build.
+    """
+    out_dir = out_dir or EXPORT_DIR
+    builds_dir = f"{out_dir}.builds"
+    build = os.path.join(builds_dir, datetime.now().strftime("%Y%m%d%H%M%S%f"))
+    with _export_lock, app.app_context():
+        with app.test_request_context("/"):
+            theme_css, theme_hash = theme_stylesheet()
+        for lang in LANGS:
+            for endpoint in EXPORT_PAGES:
+                path, html = render_public_page(endpoint, lang)
+                target = os.path.join(build, path.strip("/"), "index.html")
+                write_precompressed(target, html.encode("utf-8"))
+        # La feuille du thème est référencée en absolu par les pages
+        write_precompressed(os.path.join(build, f"theme.{theme_hash}.css"), theme_css.encode("utf-8"))
+        # Bascule atomique du lien symbolique vers le nouveau build
+        tmp_link = f"{out_dir}.tmp-link"
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(os.path.abspath(build), tmp_link)
+        if os.path.isdir(out_dir) and not os.path.islink(out_dir):
+            shutil.rmtree(out_dir)
+        os.replace(tmp_link, out_dir)
+        for old in sorted(os.listdir(builds_dir))[:-EXPORT_KEEP_BUILDS]:
+            shutil.rmtree(os.path.join(builds_dir, old), ignore_errors=True)
+    logging.info(f"Export statique terminé: {build}")
+    return build
+
+def schedule_static_export():
+    """Relance l'export après EXPORT_DEBOUNCE_SECONDS sans nouvelle écriture."""
+    global _export_timer
+    if not (EXPORT_AUTO or os.path.lexists(EXPORT_DIR)):
+        return
+
+    def run():
+        try:
+            export_static_site()
+        except Exception as e:
+            logging.error(f"Erreur export statique: {e}")
+
+    if _export_timer is not None:
+        _export_timer.cancel()
+    _export_timer = threading.Timer(EXPORT_DEBOUNCE_SECONDS, run)
+    _export_timer.daemon = True
+    _export_timer.start()
+
+# ----------------------------------------
+# VERSIONS DU CONTENU PUBLIC
+# ----------------------------------------
+# Date de dernière modification de chaque store, persistée : sert au lastmod
+# du sitemap et à l'invalidation des rendus dérivés (export, sitemap).
+CONTENT_VERSIONS_FILE = os.environ.get("CONTENT_VERSIONS_FILE_PATH",
+                                       os.path.join(UPLOAD_FOLDER, "content_versions.json"))
+# Services, portfolio et atouts sont définis dans le code : leur version est
+# celle du déploiement (mtime de app.py).
+CODE_STORES = ("code", "services", "portfolio", "atouts")
+_content_versions_lock = threading.Lock()
+
+def _file_version(path):
+    try:
+        return datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d %H:%M:%S")
+    except OSError:
+        return None
+
+def load_content_versions():
+    versions = load_json_manifest(CONTENT_VERSIONS_FILE)
+    code_version = _file_version(os.path.abspath(__file__))
+    for store in CODE_STORES:
+        if code_version and versions.get(store, "") < code_version:
+            versions[store] = code_version
+    for store, path in (("config", CONFIG_FILE), ("rotator", ROTATOR_FILE), ("gallery", GALLERY_FILE)):
+        versions.setdefault(store, _file_version(path) or code_version)
+    return versions
+
+CONTENT_VERSIONS = load_content_versions()
+
+def notify_content_changed(store):
+    """
+    Point unique appelé après chaque écriture admin du contenu public.
+    """
+    with _content_versions_lock:
+        CONTENT_VERSIONS[store] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        save_json_file(CONTENT_VERSIONS_FILE, dict(CONTENT_VERSIONS))
+    invalidate_sitemap()
+    schedule_static_export()
+
 # ----------------------------------------
 # CHARGEMENT DES DONNÉES PERSISTANTES AU DÉMARRAGE
 # ----------------------------------------
 # Création dossier d’uploads si nécessaire
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# Messages de contact
-MSGS = load_json_file(MSG_FILE, expect_dict=False)
-if isinstance(MSGS, list):
-    for m in MSGS:
-        if 'status' not in m:
-            m['status'] = 'new'
-        if 'timestamp' not in m:
-            m['timestamp'] = ""
-else:
-    MSGS = []
+# Tout l'état persistant tient dans un snapshot binaire (pickle versionné)
+# plus un journal d'opérations (WAL, une ligne JSON par écriture). Au
+# démarrage on charge le snapshot et on ne rejoue que le journal : le coût
+# ne dépend plus de la taille de messages.json / traffic.json. Les fichiers
+# JSON restent écrits à chaque compaction, comme export lisible.
+#
+# Le journal est partagé entre processus (workers préforkés) : chaque
+# écriture se fait sous un verrou fichier (flock) après rattrapage du
+# journal, et chaque requête vérifie d'abord si le journal a grandi
+# (sync_state) pour appliquer les écritures des autres workers.
+STATE_SCHEMA = 1
+STATE_SNAPSHOT_FILE = os.path.join(UPLOAD_FOLDER, "state.snapshot")
+STATE_WAL_PREFIX = os.path.join(UPLOAD_FOLDER, "state.wal.")
+STATE_LOCK_FILE = os.path.join(UPLOAD_FOLDER, "state.lock")
+# Taille du journal au-delà de laquelle on compacte (nouveau snapshot)
+STATE_COMPACT_BYTES = int(os.environ.get("STATE_COMPACT_BYTES", 8 * 1024 * 1024))
+STATE_FSYNC = os.environ.get("STATE_FSYNC", "").lower() in ("true", "1", "yes")
+# Écriture différée des remplacements admin (déplacements, suppressions) :
+# délai sans nouvelle modification, et délai maximal depuis la première
+# modification non écrite (fenêtre de perte en cas de crash). 0 = immédiat.
+WRITE_BEHIND_DELAY = float(os.environ.get("WRITE_BEHIND_DELAY", 2))
+WRITE_BEHIND_MAX_DELAY = float(os.environ.get("WRITE_BEHIND_MAX_DELAY", 10))
+# Stores persistés : fichier JSON d'export (None = snapshot seulement) et type
+STORE_FILES = {
+    "messages": (MSG_FILE, False),
+    "traffic": (TRAFFIC_FILE, False),
+    "rotator": (ROTATOR_FILE, False),
+    "config": (CONFIG_FILE, True),
+    "gallery": (GALLERY_FILE, False),
+    "attachments": (ATTACHMENTS_FILE, True),  # nom de fichier -> métadonnées extraites
+    "services": (None, False),
+    "portfolio": (None, False),
+    "atouts": (None, False),
+}
+# Fichiers internes jamais servis par /uploads/
+INTERNAL_UPLOAD_FILES = {os.path.basename(path) for path, _ in STORE_FILES.values() if path} | {
+    "content_versions.json"}
+
+# Contenu initial des stores définis dans le code
+DEFAULT_SERVICES = [
+    {"titre": {"fr": "Plans d'armatures Revit", "en": "Rebar plans (Revit)"},
+     "desc": {"fr": "Plans d'armatures clairs et complets pour béton armé.",
+              "en": "Clear, complete rebar plans for reinforced concrete."},
+     "icon": "bi-diagram-3"},
+    {"titre": {"fr": "Études et plans métalliques", "en": "Steel structure studies & plans"},
+     "desc": {"fr": "Calculs et plans pour charpentes, hangars, structures métalliques.",
+              "en": "Design & drawings for steel frames, hangars, metal structures."},
+     "icon": "bi-building"},
+    {"titre": {"fr": "Modélisation BIM complète", "en": "Complete BIM modeling"},
+     "desc": {"fr": "Maquettes numériques, familles paramétriques, coordination.",
+              "en": "Digital models, parametric families, project coordination."},
+     "icon": "bi-boxes"},
+    {"titre": {"fr": "Audit et optimisation", "en": "Audit & optimization"},
+     "desc": {"fr": "Vérification, corrections et conseils pour réduire coûts/risques.",
+              "en": "Checks, corrections, advice to reduce cost & risks."},
+     "icon": "bi-search"},
+    {"titre": {"fr": "Formation/Accompagnement", "en": "Training/Support"},
+     "desc": {"fr": "Formation Revit ou support ponctuel pour vos équipes.",
+              "en": "Revit training or support for your team."},
+     "icon": "bi-person-video3"},
+]
+DEFAULT_PORTFOLIO = [
+    {
+        "titre": {"fr": "Résidence de standing (Niamey)", "en": "Premium Residence (Niamey)"},
+        "desc": {
+            "fr": "Plans de coffrage et ferraillage, modélisation Revit, synthèse et quantitatifs.",
+            "en": "Formwork and rebar plans, Revit modeling, syntheses and BOQs."
+        },
+        "imgs": ["https://images.unsplash.com/photo-1506744038136-46273834b3fb?auto=format&fit=crop&w=600&q=80"],
+        "fichiers": []
+    }
+]
+DEFAULT_ATOUTS = [
+    {"fr": "7 ans d'expérience sur des projets variés en Afrique et à l'international.",
+     "en": "7 years of experience with varied projects in Africa and abroad."},
+    {"fr": "Maîtrise avancée de Revit, AutoCAD, Robot Structural Analysis.",
+     "en": "Advanced skills in Revit, AutoCAD, Robot Structural Analysis."},
+    {"fr": "Réactivité : réponse à toutes demandes en moins de 24h.",
+     "en": "Responsive: answers to all requests in less than 24h."},
+    {"fr": "Travail 100% à distance, process sécurisé, confidentialité garantie.",
+     "en": "100% remote work, secured process, guaranteed confidentiality."},
+    {"fr": "Respect total des délais et adaptation à vos besoins spécifiques.",
+     "en": "Strict respect for deadlines, adaptable to your needs."},
+    {"fr": "Conseils gratuits avant devis : je vous oriente même sans plans précis.",
+     "en": "Free advice before any quote, even if you don't have precise plans."},
+]
+STORE_DEFAULTS = {"services": DEFAULT_SERVICES, "portfolio": DEFAULT_PORTFOLIO, "atouts": DEFAULT_ATOUTS}
+
+STATE = {}
+# Un verrou lecteurs/écrivain par store : les lectures (pages, recherches
+# admin) ne bloquent que les écritures du même store. _state_lock sérialise
+# les écritures du journal (numéro de séquence).
+STORE_LOCKS = {name: RWLock() for name in STORE_FILES}
+_state_lock = threading.RLock()
+# seq : dernière opération appliquée ; path/offset : position de lecture
+# dans le segment courant du journal (partagé par tous les processus)
+_state_wal = {"seq": 0, "path": None, "offset": 0, "file": None, "lock_fd": None,
+              "bytes": 0, "compacting": False}
+# Opérations en attente d'écriture : store -> transformations (par id) et
+# base = contenu journalisé sur lequel elles ont été appliquées en mémoire
+_write_behind = {"pending": {}, "base": {}, "first": None, "timer": None}
+_write_behind_lock = threading.Lock()
+
+def normalize_store(name, data):
+    if name == "messages":
+        for msg in data:
+            if 'status' not in msg:
+                msg['status'] = 'new'
+            if 'timestamp' not in msg:
+                msg['timestamp'] = ""
+    return data
+
+def wal_segments():
+    """Segments du journal, triés par premier numéro de séquence."""
+    segments = []
+    for name in os.listdir(UPLOAD_FOLDER):
+        path = os.path.join(UPLOAD_FOLDER, name)
+        if path.startswith(STATE_WAL_PREFIX) and name.rsplit(".", 1)[-1].isdigit():
+            segments.append((int(name.rsplit(".", 1)[-1]), path))
+    return [path for _, path in sorted(segments)]
+
+class _ProcessLock:
+    """Verrou exclusif entre threads et entre processus (flock sur state.lock)."""
+    def __enter__(self):
+        _state_lock.acquire()
+        if fcntl is not None:
+            if _state_wal["lock_fd"] is None:
+                _state_wal["lock_fd"] = os.open(STATE_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(_state_wal["lock_fd"], fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(_state_wal["lock_fd"], fcntl.LOCK_UN)
+        _state_lock.release()
+
+@contextmanager
+def reading(*stores):
+    """Verrou de lecture sur plusieurs stores (pris dans un ordre fixe)."""
+    with ExitStack() as stack:
+        for name in sorted(stores):
+            stack.enter_context(STORE_LOCKS[name].read())
+        yield
+
+def reads_stores(*stores):
+    """Décorateur de vue : rendu sous verrou de lecture des stores affichés."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            with reading(*stores):
+                return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+def _apply(store, op, value=None, index=None):
+    with STORE_LOCKS[store].write():
+        _apply_unlocked(STATE[store], op, value, index)
+
+def _apply_unlocked(target, op, value, index):
+    if op == "append":
+        target.append(value)
+    elif op == "set":
+        target[index] = value
+    elif op == "pop":
+        target.pop(index)
+    elif op == "replace":
+        if isinstance(target, dict):
+            target.clear()
+            target.update(value)
+        else:
+            target[:] = value
+    else:
+        raise ValueError(f"opération inconnue: {op}")
+
+def _install_store(name, data):
+    """Remplace le contenu d'un store en place (les alias MSGS, SERVICES... restent valides)."""
+    if name in STATE:
+        _apply(name, "replace", data)
+    else:
+        STATE[name] = data
+
+def _tail_wal():
+    """
+    Applique les opérations écrites depuis notre dernière lecture, en suivant
+    les marqueurs de rotation. Renvoie l'ensemble des stores modifiés.
+    """
+    changed = set()
+    while _state_wal["path"]:
+        path = _state_wal["path"]
+        try:
+            with open(path, "rb") as f:
+                f.seek(_state_wal["offset"])
+                next_path = None
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # écriture en cours dans un autre processus
+                    _state_wal["offset"] += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        logging.warning(f"Ligne de journal illisible ignorée dans {path}")
+                        continue
+                    if "rotate" in entry:
+                        next_path = os.path.join(UPLOAD_FOLDER, entry["rotate"])
+                        break
+                    if entry["seq"] <= _state_wal["seq"]:
+                        continue
+                    _state_wal["seq"] = entry["seq"]
+                    _apply(entry["store"], entry["op"], entry.get("value"), entry.get("index"))
+                    changed.add(entry["store"])
+        except FileNotFoundError:
+            # Segment déjà compacté par un autre processus : on repart du snapshot
+            changed |= _load_snapshot_and_tail()[0]
+            break
+        if next_path is None:
+            break
+        _state_wal["path"], _state_wal["offset"] = next_path, 0
+    return changed
+
+def _load_snapshot_and_tail():
+    """
+    Charge le snapshot (ou, à défaut, les fichiers JSON) puis rejoue le journal.
+    Pour repartir des fichiers JSON (restauration manuelle), supprimer
+    state.snapshot et les state.wal.* avant le démarrage.
+    """
+    snapshot = None
+    if os.path.exists(STATE_SNAPSHOT_FILE):
+        try:
+            with open(STATE_SNAPSHOT_FILE, "rb") as f:
+                snapshot = pickle.load(f)
+            if snapshot.get("schema") != STATE_SCHEMA:
+                logging.warning(f"Snapshot au schéma {snapshot.get('schema')}, rechargement depuis les JSON.")
+                snapshot = None
+        except Exception as e:
+            logging.error(f"Erreur lecture snapshot {STATE_SNAPSHOT_FILE}: {e}. Rechargement depuis les JSON.")
+            snapshot = None
+    for name, (path, expect_dict) in STORE_FILES.items():
+        data = snapshot["stores"].get(name) if snapshot else None
+        if data is None and path:
+            data = normalize_store(name, load_json_file(path, expect_dict=expect_dict))
+        elif data is None:
+            data = json.loads(json.dumps(STORE_DEFAULTS[name]))
+        _install_store(name, data)
+    _state_wal["seq"] = snapshot["seq"] if snapshot else 0
+    segments = wal_segments()
+    _state_wal["path"], _state_wal["offset"] = (segments[0] if segments else None), 0
+    _tail_wal()
+    return set(STORE_FILES), snapshot is not None
+
+def _drop_torn_tail():
+    """
+    Sous verrou, aucune écriture n'est en cours : des octets après notre
+    position sont une ligne interrompue par un crash, on les coupe.
+    """
+    path = _state_wal["path"]
+    if path and os.path.exists(path) and os.path.getsize(path) > _state_wal["offset"]:
+        logging.warning(f"Fin de journal tronquée ignorée dans {path}")
+        with open(path, "rb+") as f:
+            f.truncate(_state_wal["offset"])
+
+def load_state():
+    """Chargement au démarrage ; renvoie True si un snapshot doit être (ré)écrit."""
+    start = time.perf_counter()
+    with _ProcessLock():
+        had_snapshot = _load_snapshot_and_tail()[1]
+        _drop_torn_tail()
+        if _state_wal["path"] is None:
+            _open_wal_segment()
+        _ensure_item_ids()
+    logging.info(f"État chargé en {(time.perf_counter() - start) * 1000:.1f} ms "
+                 f"({'snapshot' if had_snapshot else 'JSON'}, seq={_state_wal['seq']})")
+    return not had_snapshot
+
+# Stores dont les éléments portent un identifiant stable (opérations groupées,
+# édition et suppression depuis l'admin)
+ID_STORES = ("messages", "rotator", "gallery", "services", "portfolio", "atouts")
+
+def new_item_id():
+    return uuid.uuid4().hex[:12]
 
-# Trafic logs
-TRAFFIC = load_json_file(TRAFFIC_FILE, expect_dict=False)
-if not isinstance(TRAFFIC, list):
-    TRAFFIC = []
+def _ensure_item_ids():
+    """
+    Sous verrou, au démarrage : donne un identifiant aux éléments qui n'en ont
+    pas (données antérieures), une fois pour toutes via le journal.
+    """
+    for store in ID_STORES:
+        if all("id" in item for item in STATE[store]):
+            continue
+        items = []
+        for i, item in enumerate(STATE[store]):
+            if "id" not in item:
+                digest = hashlib.sha1(f"{store}:{i}:{json.dumps(item, sort_keys=True)}".encode()).hexdigest()
+                item = dict(item, id=digest[:12])
+            items.append(item)
+        _apply(store, "replace", items)
+        _log_op(store, "replace", items)
+        logging.info(f"Identifiants ajoutés aux éléments de {store}")
 
-# Carousel items
-ROTATOR_ITEMS = load_json_file(ROTATOR_FILE, expect_dict=False)
-if not isinstance(ROTATOR_ITEMS, list):
-    ROTATOR_ITEMS = []
+def _open_wal_segment():
+    """Démarre un nouveau segment ; l'ancien se termine par un marqueur de rotation."""
+    path = f"{STATE_WAL_PREFIX}{_state_wal['seq'] + 1:012d}"
+    if _state_wal["path"] and _state_wal["path"] != path:
+        _wal_write(json.dumps({"rotate": os.path.basename(path)}) + "\n")
+    if _state_wal["file"] is not None:
+        _state_wal["file"].close()
+    _state_wal["file"] = open(path, "a", encoding="utf-8")
+    _state_wal["path"], _state_wal["offset"], _state_wal["bytes"] = path, os.path.getsize(path), 0
 
-# Config thème (dict)
-config_theme = load_json_file(CONFIG_FILE, expect_dict=True)
+def _wal_write(line):
+    if _state_wal["file"] is None or _state_wal["file"].name != _state_wal["path"]:
+        if _state_wal["file"] is not None:
+            _state_wal["file"].close()
+        _state_wal["file"] = open(_state_wal["path"], "a", encoding="utf-8")
+    _state_wal["file"].write(line)
+    _state_wal["file"].flush()
+    if STATE_FSYNC:
+        os.fsync(_state_wal["file"].fileno())
+    _state_wal["offset"] += len(line.encode("utf-8"))
+    _state_wal["bytes"] += len(line)
+
+def sync_state():
+    """
+    Vérification de version : applique les écritures des autres processus si
+    le segment courant a grandi ou a été compacté. Coût nominal : un stat().
+    """
+    path = _state_wal["path"]
+    try:
+        if path and os.path.getsize(path) == _state_wal["offset"]:
+            return
+    except OSError:
+        pass
+    with _state_lock:
+        changed = _catch_up()
+    if changed:
+        refresh_derived_state(changed)
+
+def _log_op(store, op, value=None, index=None):
+    """Sous verrou : ajoute une opération déjà appliquée en mémoire au journal."""
+    _state_wal["seq"] += 1
+    entry = {"seq": _state_wal["seq"], "store": store, "op": op}
+    if value is not None:
+        entry["value"] = value
+    if index is not None:
+        entry["index"] = index
+    _wal_write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+def _catch_up():
+    """
+    Sous _state_lock : rattrape le journal sans perdre les opérations
+    différées. Les stores concernés reviennent à leur base journalisée, les
+    opérations des autres processus s'y appliquent, puis les transformations
+    locales sont rejouées sur ce contenu à jour.
+    """
+    with _write_behind_lock:
+        pending = {store: list(fns) for store, fns in _write_behind["pending"].items()}
+        base = dict(_write_behind["base"])
+    for store in pending:
+        _apply(store, "replace", base[store])
+    changed = _tail_wal()
+    for store, fns in pending.items():
+        items = list(STATE[store])
+        with _write_behind_lock:
+            _write_behind["base"][store] = items
+        for fn in fns:
+            items = fn(list(items))
+        _apply(store, "replace", items)
+    return changed
+
+def _log_pending():
+    """Sous verrou, après _catch_up : écrit le résultat des opérations différées."""
+    with _write_behind_lock:
+        pending, _write_behind["pending"] = _write_behind["pending"], {}
+        _write_behind["base"] = {}
+        _write_behind["first"] = None
+        if _write_behind["timer"] is not None:
+            _write_behind["timer"].cancel()
+            _write_behind["timer"] = None
+    for store in pending:
+        _log_op(store, "replace", list(STATE[store]))
+    return list(pending)
+
+def _commit(build=None):
+    """
+    Rattrape le journal, écrit les remplacements différés puis l'opération
+    (store, op, value, index) renvoyée par build(), sous le verrou
+    inter-processus : build voit donc l'état à jour. None = rien à écrire.
+    """
+    start = time.perf_counter()
+    with _ProcessLock():
+        changed = _catch_up()
+        _drop_torn_tail()
+        flushed = _log_pending()
+        op = build() if build is not None else None
+        if op is not None:
+            _apply(*op)
+            _log_op(*op)
+        need_compact = _state_wal["bytes"] > STATE_COMPACT_BYTES and not _state_wal["compacting"]
+        if need_compact:
+            _state_wal["compacting"] = True
+    observe_metric("storage", "state.wal", time.perf_counter() - start)
+    if changed:
+        refresh_derived_state(changed)
+    # Une notification par lot d'opérations différées, pas par clic
+    for store in flushed:
+        notify_content_changed(store)
+    if need_compact:
+        threading.Thread(target=compact_state, daemon=True).start()
+
+def apply_op(store, op, value=None, index=None):
+    """
+    Applique une écriture au store en mémoire et l'ajoute au journal.
+    op: "append" (value), "set" (index, value), "pop" (index), "replace" (value).
+    """
+    _commit(lambda: (store, op, value, index))
+
+def update_store(store, fn):
+    """
+    Transaction sur un store : fn reçoit une copie (liste ou dict) du contenu
+    à jour et renvoie (nouveau contenu ou None si inchangé, résultat). Le nouveau
+    contenu est appliqué et journalisé en une seule opération "replace".
+    Renvoie le résultat de fn.
+    """
+    result = []
+
+    def build():
+        current = STATE[store]
+        value, res = fn(dict(current) if isinstance(current, dict) else list(current))
+        result.append(res)
+        return (store, "replace", value, None) if value is not None else None
+
+    _commit(build)
+    return result[0]
+
+def update_item(store, item_id, fn):
+    """
+    Transaction sur l'élément d'identifiant item_id : son index est résolu
+    sur l'état à jour, sous le verrou. fn reçoit l'élément et renvoie sa
+    nouvelle version, ou None pour le supprimer. Renvoie l'élément avant
+    modification, None s'il n'existe pas (ou plus).
+    """
+    result = []
+
+    def build():
+        for i, item in enumerate(STATE[store]):
+            if item.get("id") == item_id:
+                result.append(item)
+                new_item = fn(item)
+                if new_item is None:
+                    return (store, "pop", None, i)
+                return (store, "set", dict(new_item, id=item_id), i)
+        return None
+
+    _commit(build)
+    return result[0] if result else None
+
+def find_item(store, item_id):
+    with reading(store):
+        return next((item for item in STATE[store] if item.get("id") == item_id), None)
+
+def write_behind(store, fn):
+    """
+    Applique fn (liste -> nouvelle liste, en désignant les éléments par leur
+    id) au store en mémoire tout de suite mais ne l'écrit dans le journal
+    qu'après WRITE_BEHIND_DELAY s sans autre modification, et au plus tard
+    WRITE_BEHIND_MAX_DELAY s après la première : une série de déplacements ne
+    coûte qu'une écriture. C'est l'opération qui est différée, pas le contenu :
+    elle est rejouée sur l'état à jour à chaque rattrapage du journal, les
+    écritures des autres processus ne sont donc pas écrasées. Toute écriture
+    immédiate (apply_op), la compaction, un fork ou l'arrêt du processus
+    écrivent d'abord ce qui est en attente. notify_content_changed est appelé
+    une fois par lot écrit, pas à chaque opération.
+    """
+    if WRITE_BEHIND_DELAY <= 0:
+        update_store(store, lambda items: (fn(items), None))
+        notify_content_changed(store)
+        return
+    with _state_lock:
+        now = time.monotonic()
+        with _write_behind_lock:
+            if store not in _write_behind["pending"]:
+                _write_behind["base"][store] = list(STATE[store])
+            _write_behind["pending"].setdefault(store, []).append(fn)
+        _apply(store, "replace", fn(list(STATE[store])))
+        with _write_behind_lock:
+            if _write_behind["first"] is None:
+                _write_behind["first"] = now
+            delay = min(WRITE_BEHIND_DELAY, _write_behind["first"] + WRITE_BEHIND_MAX_DELAY - now)
+            if _write_behind["timer"] is not None:
+                _write_behind["timer"].cancel()
+            _write_behind["timer"] = threading.Timer(max(delay, 0), flush_now)
+            _write_behind["timer"].daemon = True
+            _write_behind["timer"].start()
+
+def moved_item(item_id, step):
+    """Transformation différable : décale l'élément d'id item_id de step places."""
+    def fn(items):
+        for i, item in enumerate(items):
+            if item.get("id") == item_id:
+                j = i + step
+                if 0 <= j < len(items):
+                    items[i], items[j] = items[j], items[i]
+                break
+        return items
+    return fn
+
+def flush_now():
+    """Écrit immédiatement les opérations différées (arrêt, fork, tests)."""
+    with _write_behind_lock:
+        if not _write_behind["pending"]:
+            return
+    try:
+        _commit()
+    except Exception as e:
+        logging.error(f"Erreur écriture différée: {e}")
+
+atexit.register(flush_now)
+
+def compact_state():
+    """
+    Écrit un nouveau snapshot (et les exports JSON) puis supprime les segments
+    de journal qu'il couvre.
+    """
+    try:
+        with _ProcessLock():
+            _state_wal["compacting"] = True
+            changed = _catch_up()
+            flushed = _log_pending()
+            seq = _state_wal["seq"]
+            payload = pickle.dumps({"schema": STATE_SCHEMA, "seq": seq, "stores": STATE},
+                                   protocol=pickle.HIGHEST_PROTOCOL)
+            covered = wal_segments()
+            # Les écritures suivantes partent dans un nouveau segment
+            _open_wal_segment()
+            covered = [p for p in covered if p != _state_wal["path"]]
+            # Snapshot écrit sous verrou : deux compactions ne peuvent pas se croiser
+            tmp = f"{STATE_SNAPSHOT_FILE}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, STATE_SNAPSHOT_FILE)
+            for path in covered:
+                os.remove(path)
+        if changed:
+            refresh_derived_state(changed)
+        for store in flushed:
+            notify_content_changed(store)
+        stores = pickle.loads(payload)["stores"]
+        for name, (path, _) in STORE_FILES.items():
+            if path:
+                save_json_file(path, stores[name])
+        logging.info(f"Compaction de l'état: snapshot seq={seq}, {len(covered)} segments supprimés")
+    except Exception as e:
+        logging.error(f"Erreur compaction de l'état: {e}")
+    finally:
+        _state_wal["compacting"] = False
+
+def refresh_derived_state(stores):
+    """Met à jour ce qui dérive des stores modifiés par un autre processus."""
+    if "config" in stores:
+        apply_theme_config()
+    CONTENT_VERSIONS.update(load_json_manifest(CONTENT_VERSIONS_FILE))
+    invalidate_sitemap()
+
+# ----------------------------------------
+# PRÉCHARGEMENT ET FORK (workers préforkés)
+# ----------------------------------------
+# L'état, les templates compilés et les assets sont construits une fois dans
+# le processus maître ; les workers forkés les partagent en copy-on-write.
+# gc.freeze() évite que le ramasse-miettes ne réécrive (et donc ne copie) ces
+# pages dans chaque worker.
+def _before_fork():
+    flush_now()
+    # Ni journal d'état ni handler de log en pleine écriture : l'enfant
+    # hérite de flux cohérents (leurs verrous internes ne survivent pas au fork)
+    _state_lock.acquire()
+    for handler in LOG_HANDLERS:
+        handler.acquire()
+    gc.collect()
+    gc.freeze()
+
+def _after_fork_in_child():
+    global _state_lock, _json_writers, _write_behind_lock, _mail_lock, _ingest_lock
+    global _json_writers_lock, _metrics_lock, _compress_cache_lock, _theme_fonts_lock
+    global _theme_css_lock, _export_lock, _content_versions_lock, _sitemap_lock
+    # Verrous, threads et descripteurs propres au processus : flock est lié au descripteur.
+    # Tous les verrous du module sont recréés : un thread du parent a pu en
+    # tenir un au moment du fork, et il n'existe pas dans l'enfant pour le rendre.
+    _state_lock = threading.RLock()
+    _json_writers_lock = threading.Lock()
+    _metrics_lock = threading.Lock()
+    _compress_cache_lock = threading.Lock()
+    _theme_fonts_lock = threading.Lock()
+    _theme_css_lock = threading.RLock()
+    _critical_build["running"] = False
+    _export_lock = threading.Lock()
+    _content_versions_lock = threading.Lock()
+    _sitemap_lock = threading.Lock()
+    RATE_LIMITER.lock = threading.Lock()
+    _write_behind_lock = threading.Lock()
+    _write_behind.update(pending={}, base={}, first=None, timer=None)
+    _mail_lock = threading.Lock()
+    _mail["sender"] = None
+    _ingest_lock = threading.Lock()
+    _ingest.update(queue=queue.Queue(), thread=None, pending=set())
+    # Le thread d'écriture des logs n'existe pas dans l'enfant
+    start_log_listener()
+    for name in STORE_LOCKS:
+        STORE_LOCKS[name] = RWLock()
+    _json_writers = {}
+    _state_wal["lock_fd"] = None
+    _state_wal["file"] = None
+    _state_wal["compacting"] = False
+
+def _after_fork_in_parent():
+    for handler in LOG_HANDLERS:
+        handler.release()
+    _state_lock.release()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_before_fork, after_in_parent=_after_fork_in_parent,
+                        after_in_child=_after_fork_in_child)
+
+@app.before_request
+def sync_state_before_request():
+    sync_state()
+
+if load_state():
+    compact_state()
+
+MSGS = STATE["messages"]
+TRAFFIC = STATE["traffic"]
+ROTATOR_ITEMS = STATE["rotator"]
+config_theme = STATE["config"]
 # Valeurs par défaut si non présentes
 default_color = "#E91E63"     # magenta vif par défaut
 default_secondary = "#FF5722" # orange vif
@@ -167,9 +2917,10 @@ theme_font = config_theme.get("font", default_font)
 theme_photo = config_theme.get("photo", default_photo)
 
 # Galerie items
-GALLERY_ITEMS = load_json_file(GALLERY_FILE, expect_dict=False)
-if not isinstance(GALLERY_ITEMS, list):
-    GALLERY_ITEMS = []
+GALLERY_ITEMS = STATE["gallery"]
+
+# Index des pièces jointes (métadonnées extraites en tâche de fond)
+ATTACHMENTS = STATE["attachments"]
 
 # Variables globales du site
 SITE = {
@@ -199,73 +2950,36 @@ SITE = {
     "couleur": theme_color,
     "secondary": theme_secondary,
     "accent": theme_accent,
-    "font": theme_font
-}
-ANNEE = datetime.now().year
-
-# Services initiaux
-SERVICES = [
-    {"titre": {"fr": "Plans d'armatures Revit", "en": "Rebar plans (Revit)"},
-     "desc": {"fr": "Plans d'armatures clairs et complets pour béton armé.",
-              "en": "Clear, complete rebar plans for reinforced concrete."},
-     "icon": "bi-diagram-3"},
-    {"titre": {"fr": "Études et plans métalliques", "en": "Steel structure studies & plans"},
-     "desc": {"fr": "Calculs et plans pour charpentes, hangars, structures métalliques.",
-              "en": "Design & drawings for steel frames, hangars, metal structures."},
-     "icon": "bi-building"},
-    {"titre": {"fr": "Modélisation BIM complète", "en": "Complete BIM modeling"},
-     "desc": {"fr": "Maquettes numériques, familles paramétriques, coordination.",
-              "en": "Digital models, parametric families, project coordination."},
-     "icon": "bi-boxes"},
-    {"titre": {"fr": "Audit et optimisation", "en": "Audit & optimization"},
-     "desc": {"fr": "Vérification, corrections et conseils pour réduire coûts/risques.",
-              "en": "Checks, corrections, advice to reduce cost & risks."},
-     "icon": "bi-search"},
-    {"titre": {"fr": "Formation/Accompagnement", "en": "Training/Support"},
-     "desc": {"fr": "Formation Revit ou support ponctuel pour vos équipes.",
-              "en": "Revit training or support for your team."},
-     "icon": "bi-person-video3"},
-]
+    "font": theme_font
+}
+ANNEE = datetime.now().year
 
-# Portfolio initial
-PORTFOLIO = [
-    {
-        "titre": {"fr": "Résidence de standing (Niamey)", "en": "Premium Residence (Niamey)"},
-        "desc": {
-            "fr": "Plans de coffrage et ferraillage, modélisation Revit, synthèse et quantitatifs.",
-            "en": "Formwork and rebar plans, Revit modeling, syntheses and BOQs."
-        },
-        "imgs": ["https://images.unsplash.com/photo-1506744038136-46273834b3fb?auto=format&fit=crop&w=600&q=80"],
-        "fichiers": []
-    }
-]
+def apply_theme_config():
+    """Recopie dans SITE les réglages du thème (après modification par un autre worker)."""
+    SITE["couleur"] = config_theme.get("couleur", default_color)
+    SITE["secondary"] = config_theme.get("secondary", default_secondary)
+    SITE["accent"] = config_theme.get("accent", default_accent)
+    SITE["font"] = config_theme.get("font", default_font)
+    SITE["photo"] = config_theme.get("photo", default_photo)
 
-# Atouts initiaux
-ATOUTS = [
-    {"fr": "7 ans d'expérience sur des projets variés en Afrique et à l'international.",
-     "en": "7 years of experience with varied projects in Africa and abroad."},
-    {"fr": "Maîtrise avancée de Revit, AutoCAD, Robot Structural Analysis.",
-     "en": "Advanced skills in Revit, AutoCAD, Robot Structural Analysis."},
-    {"fr": "Réactivité : réponse à toutes demandes en moins de 24h.",
-     "en": "Responsive: answers to all requests in less than 24h."},
-    {"fr": "Travail 100% à distance, process sécurisé, confidentialité garantie.",
-     "en": "100% remote work, secured process, guaranteed confidentiality."},
-    {"fr": "Respect total des délais et adaptation à vos besoins spécifiques.",
-     "en": "Strict respect for deadlines, adaptable to your needs."},
-    {"fr": "Conseils gratuits avant devis : je vous oriente même sans plans précis.",
-     "en": "Free advice before any quote, even if you don't have precise plans."},
-]
+# Polices locales à (re)générer si la famille du thème a changé depuis le dernier build
+if THEME_FONTS.get("family") != SITE["font"] and find_font_sources(SITE["font"]):
+    schedule_theme_fonts_build(SITE["font"])
+
+SERVICES = STATE["services"]
+PORTFOLIO = STATE["portfolio"]
+ATOUTS = STATE["atouts"]
 
 # ----------------------------------------
 # INJECTION DE VARIABLES GLOBALES DANS JINJA
 # ----------------------------------------
 @app.context_processor
 def inject_global_vars():
-    lang = session.get("lang", "fr")
+    lang = current_lang()
     return {
         "site": SITE,
         "annee": ANNEE,
-        "langs": {"fr": "Français", "en": "English"},
+        "langs": LANGS,
         "lang": lang,
         "SERVICES": SERVICES,
         "PORTFOLIO": PORTFOLIO,
@@ -280,7 +2994,7 @@ def inject_global_vars():
 @app.before_request
 def log_traffic():
     path = request.path or ""
-    ignore_prefixes = [f"/{ADMIN_SECRET_URL}", "/static", "/favicon.ico", "/sitemap.xml"]
+    ignore_prefixes = [f"/{ADMIN_SECRET_URL}", "/static", "/assets", "/theme.", "/favicon.ico", "/sitemap"]
     if any(path.startswith(pref) for pref in ignore_prefixes):
         return
     if request.method in ("GET", "POST"):
@@ -290,57 +3004,531 @@ def log_traffic():
             "method": request.method,
             "remote_addr": request.remote_addr or ""
         }
-        TRAFFIC.append(entry)
-        save_json_file(TRAFFIC_FILE, TRAFFIC)
+        apply_op("traffic", "append", entry)
 
 # ----------------------------------------
 # GESTION DE LA LANGUE
 # ----------------------------------------
+# Les pages publiques portent la langue dans l'URL (/fr/..., /en/...) : leur
+# HTML ne dépend plus de la session et peut être mis en cache partagé. Les
+# pages admin gardent la langue choisie en session.
+def preferred_lang():
+    """Langue du visiteur hors URL : cookie, session, Accept-Language, défaut."""
+    lang = request.cookies.get("lang") or session.get("lang")
+    if lang in LANGS:
+        return lang
+    return request.accept_languages.best_match(LANGS) or DEFAULT_LANG
+
+def current_lang():
+    lang = g.get("lang")
+    if lang:
+        return lang
+    return preferred_lang() if has_request_context() else DEFAULT_LANG
+
+@app.url_defaults
+def add_lang_code(endpoint, values):
+    if endpoint in PUBLIC_ENDPOINTS:
+        values.setdefault("lang_code", current_lang())
+
+@app.url_value_preprocessor
+def pull_lang_code(endpoint, values):
+    if values and "lang_code" in values:
+        g.lang = values.pop("lang_code")
+
+def lang_alternates():
+    """URL de la page publique courante dans chaque langue (liens hreflang)."""
+    if request.endpoint not in PUBLIC_ENDPOINTS:
+        return {}
+    args = {k: v for k, v in (request.view_args or {}).items() if k != "lang_code"}
+    return {code: url_for(request.endpoint, lang_code=code, _external=True, **args) for code in LANGS}
+
+@app.context_processor
+def inject_lang_alternates():
+    return {"lang_alternates": lang_alternates}
+
 @app.route('/set_lang', methods=["POST"])
 def set_lang():
+    """
+    Repli sans JavaScript du sélecteur de langue : renvoie vers la même page
+    dans la langue choisie et la mémorise pour les pages admin et la racine.
+    """
     lang = request.form.get("lang")
-    if lang in ("fr", "en"):
+    # Chemin seul : pas de redirection vers un autre site
+    path = urlsplit(request.form.get("next") or request.referrer or "/").path
+    if not path.startswith("/") or path.startswith("//") or "\\" in path:
+        path = "/"
+    response = redirect(path)
+    if lang in LANGS:
         session["lang"] = lang
-    return redirect(request.referrer or url_for('index'))
+        prefix, _, rest = path.lstrip("/").partition("/")
+        if prefix in LANGS:
+            response = redirect(f"/{lang}/{rest}")
+        response.set_cookie("lang", lang, max_age=365 * 24 * 3600, samesite="Lax")
+    return response
 
-# ----------------------------------------
-# TOGGLE DARK MODE
-# ----------------------------------------
-@app.route('/toggle_dark')
-def toggle_dark():
-    session['dark_mode'] = not session.get('dark_mode', False)
-    return redirect(request.referrer or url_for('index'))
+@app.after_request
+def public_cache_headers(response):
+    """
+    Pages publiques en GET, sans message flash ni écriture de session :
+    cacheables par un CDN / proxy partagé.
+    """
+    if (request.method == "GET" and request.endpoint in PUBLIC_ENDPOINTS
+            and response.status_code == 200 and not session.modified):
+        response.headers["Cache-Control"] = f"public, max-age={PUBLIC_MAX_AGE}"
+        g._public_cache = True
+    return response
 
 # ----------------------------------------
 # ROUTES PUBLIQUES
 # ----------------------------------------
+# Le mode sombre est géré côté navigateur (localStorage), voir base.html.
 @app.route('/')
+def root():
+    response = redirect(url_for('index', lang_code=preferred_lang()))
+    response.vary.update(("Accept-Language", "Cookie"))
+    return response
+
+@app.route('/<any(fr, en):lang_code>/')
+@reads_stores("rotator", "services", "atouts", "portfolio")
 def index():
     return render_template("index.html")
 
-@app.route('/services')
+@app.route('/<any(fr, en):lang_code>/services')
+@reads_stores("services")
 def services():
     return render_template("services.html", titre_page="Services")
 
-@app.route('/portfolio')
+@app.route('/<any(fr, en):lang_code>/portfolio')
+@reads_stores("portfolio")
 def portfolio():
     return render_template("portfolio.html", titre_page="Portfolio")
 
-@app.route('/galeries')
+@app.route('/<any(fr, en):lang_code>/galeries')
+@reads_stores("gallery")
 def galeries():
     return render_template("galleries.html", titre_page="Galeries")
 
-@app.route('/pourquoi')
+@app.route('/<any(fr, en):lang_code>/pourquoi')
+@reads_stores("atouts")
 def pourquoi():
     return render_template("pourquoi.html", titre_page="Pourquoi moi ?")
 
+def legacy_redirect(endpoint):
+    """Anciennes URL sans langue : redirection permanente vers /<langue>/..."""
+    def view():
+        # 308 conserve la méthode et le corps (POST du formulaire de contact)
+        code = 301 if request.method == "GET" else 308
+        response = redirect(url_for(endpoint, lang_code=preferred_lang()), code=code)
+        response.vary.update(("Accept-Language", "Cookie"))
+        return response
+    return view
+
+for _endpoint, _path in (("services", "/services"), ("portfolio", "/portfolio"), ("galeries", "/galeries"),
+                         ("pourquoi", "/pourquoi"), ("contact", "/contact")):
+    app.add_url_rule(_path, f"legacy_{_endpoint}", legacy_redirect(_endpoint), methods=["GET", "POST"])
+app.add_url_rule("/toggle_dark", "toggle_dark", lambda: redirect(request.referrer or "/"))
+
+# ----------------------------------------
+# LIMITATION DE DÉBIT ET ANTI-ABUS (contact, login admin)
+# ----------------------------------------
+# Seau à jetons par (route, client) : `capacité` envois d'affilée, puis un
+# jeton regagné toutes les période/capacité secondes. Les seaux restent en
+# mémoire de chaque processus : ni verrou de fichier ni E/S par requête.
+# Le contrôle a lieu avant la lecture du corps (pièces jointes comprises).
+# Le formulaire de contact exige en plus un champ piège vide et une preuve de
+# travail (défi signé par le serveur, résolu en JavaScript, avec un SHA-256
+# en JS pur hors contexte sécurisé), vérifiée elle aussi avant la lecture du
+# corps ; seul l'usage unique du défi est partagé entre processus.
+def parse_rate_limits(spec, defaults):
+    """'contact=5/600,admin_login=10/900' -> {route: (capacité, période en s)}."""
+    limits = dict(defaults)
+    for part in spec.split(","):
+        name, _, value = part.partition("=")
+        capacity, _, period = value.partition("/")
+        try:
+            limits[name.strip()] = (int(capacity), float(period))
+        except ValueError:
+            continue
+    return {name: limit for name, limit in limits.items() if limit[0] > 0 and limit[1] > 0}
+
+RATE_LIMITS = parse_rate_limits(os.environ.get("RATE_LIMITS", ""), {
+    "contact": (5, 600),        # 5 messages d'affilée, puis 1 toutes les 2 minutes
+    "admin_login": (10, 900),   # 10 essais par quart d'heure
+})
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", 10000))
+# En-tête ajouté par le reverse proxy (ex. X-Forwarded-For) ; vide = adresse TCP
+RATE_LIMIT_CLIENT_HEADER = os.environ.get("RATE_LIMIT_CLIENT_HEADER", "")
+# Difficulté de la preuve de travail (bits nuls en tête du SHA-256), 0 = désactivée
+CONTACT_POW_BITS = min(int(os.environ.get("CONTACT_POW_BITS", 14)), 32)
+CONTACT_POW_TTL = int(os.environ.get("CONTACT_POW_TTL", 3600))
+CONTACT_HONEYPOT_FIELD = "website"
+# Défis déjà utilisés (un marqueur par défi, expiré après CONTACT_POW_TTL)
+POW_USED_DIR = os.path.join(UPLOAD_FOLDER, "state.pow")
+# Routes dont le budget est aussi tenu dans un fichier commun à tous les
+# workers (sous flock) : la force brute ne gagne rien au nombre de workers
+RATE_LIMIT_SHARED = {name.strip() for name in os.environ.get("RATE_LIMIT_SHARED", "admin_login").split(",")
+                     if name.strip()}
+RATE_LIMIT_SHARED_FILE = os.path.join(UPLOAD_FOLDER, "state.ratelimit.json")
+RATE_LIMIT_PAGES = {
+    "contact": ("contact.html", "Contact"),
+    "admin_login": ("admin/login.html", "Admin Login"),
+}
+
+def _take_token(buckets, key, capacity, rate, now):
+    """Consomme un jeton du seau key ; renvoie 0 ou l'attente en secondes."""
+    tokens, stamp = buckets.get(key, (capacity, now))
+    tokens = min(capacity, tokens + max(0.0, now - stamp) * rate)
+    wait = 0 if tokens >= 1 else (1 - tokens) / rate
+    buckets[key] = (tokens - 1 if not wait else tokens, now)
+    return wait
+
+class TokenBucketLimiter:
+    """
+    Seaux à jetons en mémoire, par processus : aucune E/S par requête. Avec
+    des workers préforkés, chaque worker a ses propres seaux ; pour les
+    routes de `shared`, une requête acceptée localement consomme aussi un
+    jeton du seau commun de shared_file, sous flock : le budget y est celui
+    de RATE_LIMITS quel que soit le nombre de workers. Un client déjà bloqué
+    localement est refusé sans E/S.
+    """
+    def __init__(self, limits, shared=(), shared_file=None):
+        self.limits = limits
+        self.buckets = {}  # clé -> (jetons, instant)
+        self.lock = threading.Lock()
+        self.shared = set(shared) if shared_file and fcntl is not None else set()
+        self.shared_file = shared_file
+
+    def hit(self, route, client):
+        """Consomme un jeton ; renvoie 0 si la requête passe, sinon l'attente en secondes."""
+        capacity, period = self.limits[route]
+        rate = capacity / period
+        key = f"{route}|{client}"
+        now = time.time()
+        with self.lock:
+            wait = _take_token(self.buckets, key, capacity, rate, now)
+            if len(self.buckets) > RATE_LIMIT_MAX_KEYS:
+                self._prune(self.buckets, now)
+        if wait or route not in self.shared:
+            return wait
+        return self._hit_shared(key, capacity, rate, now)
+
+    def _hit_shared(self, key, capacity, rate, now):
+        fd = os.open(self.shared_file, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(os.dup(fd), "r+", encoding="utf-8") as f:
+                try:
+                    buckets = {k: tuple(v) for k, v in json.load(f).items()}
+                except (ValueError, AttributeError, TypeError):
+                    buckets = {}  # fichier vide ou écriture interrompue
+                wait = _take_token(buckets, key, capacity, rate, now)
+                self._prune(buckets, now)
+                f.seek(0)
+                f.truncate()
+                json.dump(buckets, f)
+        except OSError as e:
+            logging.warning(f"Limiteur partagé indisponible, seau local seul: {e}")
+            return 0
+        finally:
+            os.close(fd)
+        return wait
+
+    def _prune(self, buckets, now):
+        """Sous verrou : oublie les seaux pleins, puis les plus anciens."""
+        for key, (tokens, stamp) in list(buckets.items()):
+            limit = self.limits.get(key.partition("|")[0])
+            # Seau de nouveau plein : équivalent à une absence d'entrée
+            if limit is None or tokens + (now - stamp) * limit[0] / limit[1] >= limit[0]:
+                del buckets[key]
+        excess = len(buckets) - RATE_LIMIT_MAX_KEYS
+        if excess > 0:
+            for key, _ in sorted(buckets.items(), key=lambda kv: kv[1][1])[:excess]:
+                del buckets[key]
+
+def use_pow_token(challenge, expires):
+    """
+    Marque un défi résolu comme utilisé, pour tous les processus : un fichier
+    créé en O_EXCL par défi (un seul appel système). False s'il a déjà servi.
+    """
+    os.makedirs(POW_USED_DIR, exist_ok=True)
+    name = hashlib.sha1(challenge.encode()).hexdigest()
+    try:
+        os.close(os.open(os.path.join(POW_USED_DIR, name), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+    except FileExistsError:
+        return False
+    os.utime(os.path.join(POW_USED_DIR, name), (expires, expires))
+    now = time.time()
+    if now - _pow_pruned["at"] > CONTACT_POW_TTL / 4:
+        _pow_pruned["at"] = now
+        # Défis expirés : verify_pow les refuse déjà, leur marqueur est inutile
+        for entry in os.scandir(POW_USED_DIR):
+            try:
+                if entry.stat().st_mtime < now:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+    return True
+
+RATE_LIMITER = TokenBucketLimiter(RATE_LIMITS, RATE_LIMIT_SHARED, RATE_LIMIT_SHARED_FILE)
+_pow_pruned = {"at": 0.0}
+
+def client_address():
+    if RATE_LIMIT_CLIENT_HEADER:
+        # Dernière adresse de la chaîne : celle ajoutée par notre proxy
+        forwarded = request.headers.get(RATE_LIMIT_CLIENT_HEADER, "").rsplit(",", 1)[-1].strip()
+        if forwarded:
+            return forwarded
+    return request.remote_addr or "unknown"
+
+def _pow_signature(body):
+    return hmac.new(app.secret_key.encode(), body.encode(), hashlib.sha256).hexdigest()[:20]
+
+def issue_pow_challenge():
+    body = f"{int(time.time())}.{uuid.uuid4().hex[:16]}.{CONTACT_POW_BITS}"
+    return f"{body}.{_pow_signature(body)}"
+
+def verify_pow(solution):
+    """solution = '<défi>:<compteur>' dont le SHA-256 commence par `bits` bits nuls."""
+    challenge, _, counter = solution.rpartition(":")
+    parts = challenge.split(".")
+    if len(parts) != 4 or not counter.isdigit() or len(counter) > 16:
+        return False
+    stamp, _, bits, signature = parts
+    if not hmac.compare_digest(signature, _pow_signature(challenge.rsplit(".", 1)[0])):
+        return False
+    if not stamp.isdigit() or not bits.isdigit() or int(bits) < CONTACT_POW_BITS:
+        return False
+    if not 0 <= time.time() - int(stamp) <= CONTACT_POW_TTL:
+        return False
+    digest = hashlib.sha256(solution.encode()).digest()
+    if int.from_bytes(digest, "big") >> (256 - int(bits)):
+        return False
+    return use_pow_token(challenge, int(stamp) + CONTACT_POW_TTL)
+
+def too_many_requests(wait):
+    retry = max(1, int(wait + 0.999))
+    minutes = max(1, round(retry / 60))
+    message = (f"Trop de tentatives. Réessayez dans {minutes} min." if current_lang() == "fr"
+               else f"Too many attempts. Try again in {minutes} min.")
+    template, title = RATE_LIMIT_PAGES.get(request.endpoint, (None, None))
+    if template and not request.is_json:
+        flash(message, "danger")
+        response = Response(render_template(template, titre_page=title, pow_bits=CONTACT_POW_BITS),
+                            status=429, mimetype="text/html")
+    else:
+        response = Response(message, status=429, mimetype="text/plain")
+    response.headers["Retry-After"] = str(retry)
+    # Le corps n'a pas été lu : la connexion ne peut pas être réutilisée
+    response.headers["Connection"] = "close"
+    return response
+
+@app.before_request
+def throttle_abuse():
+    # Enregistré avant reject_oversize_body : un client bloqué n'obtient même pas de 413
+    if request.method != "POST" or request.endpoint not in RATE_LIMITS:
+        return None
+    client = client_address()
+    wait = RATE_LIMITER.hit(request.endpoint, client)
+    if wait:
+        count_abuse(request.endpoint, "limited", client)
+        return too_many_requests(wait)
+    if request.endpoint == "contact" and CONTACT_POW_BITS and not verify_pow(request.args.get("pow", "")):
+        count_abuse("contact", "pow_failed", client)
+        flash(("Vérification anti-spam échouée : activez JavaScript puis renvoyez le formulaire."
+               if current_lang() == "fr" else
+               "Anti-spam check failed: enable JavaScript and submit the form again."), "danger")
+        response = redirect(url_for("contact"), code=303)
+        response.headers["Connection"] = "close"
+        return response
+    count_abuse(request.endpoint, "allowed")
+    return None
+
+# ----------------------------------------
+# UPLOADS : LIMITES ET ÉCRITURE DIRECTE SUR DISQUE
+# ----------------------------------------
+# Les limites sont appliquées pendant la lecture du corps de la requête :
+# - taille totale par route (Content-Length vérifié avant toute lecture,
+#   corps sans longueur coupé dès la limite atteinte) ;
+# - extensions acceptées par route : une pièce refusée n'est pas stockée
+#   (la vue la signale comme avant) ;
+# - taille par extension, contrôlée au fil de l'écriture.
+# Chaque fichier est écrit directement dans UPLOAD_FOLDER sous un nom
+# temporaire puis renommé à sa place définitive (save_upload) : ni copie,
+# ni passage par /tmp. Les fichiers temporaires non réclamés sont supprimés
+# en fin de requête.
+MB = 1024 * 1024
+
+def parse_mb_limits(spec, defaults):
+    """'pdf=50,jpg=15' -> {nom: octets}, par-dessus defaults (en Mo)."""
+    limits = dict(defaults)
+    for part in spec.split(","):
+        name, _, value = part.partition("=")
+        try:
+            limits[name.strip()] = float(value)
+        except ValueError:
+            continue
+    return {name: int(mb * MB) for name, mb in limits.items()}
+
+UPLOAD_EXTENSION_LIMITS = parse_mb_limits(os.environ.get("UPLOAD_EXT_LIMITS_MB", ""), {
+    **{ext: 15 for ext in IMAGE_EXTENSIONS}, "pdf": 50, "dwg": 100, "rvt": 200, "zip": 100,
+    "docx": 20, "xlsx": 20, **{ext: 200 for ext in VIDEO_EXTENSIONS},
+    **{ext: 5 for ext in FONT_EXTENSIONS}, "json": 1,
+})
+UPLOAD_DEFAULT_EXTENSION_LIMIT = 20 * MB
+# Taille totale de la requête par route. Elle fait foi pour ces routes, au-dessus
+# comme en dessous de MAX_CONTENT_LENGTH (qui ne s'applique qu'aux autres).
+# Limites effectives : un fichier est borné par le minimum de la limite de son
+# extension et de celle de la route, soit par défaut
+#   contact            25 Mo au total (rvt, dwg, pdf... jusqu'à 25 Mo)
+#   admin_portfolio   250 Mo au total (rvt et vidéos 200, dwg 100, pdf 50, images 15)
+#   admin_carousel     20 Mo au total (images 15, pdf 20)
+#   admin_gallery     100 Mo au total (images 15 chacune)
+#   admin_settings     20 Mo au total (images 15, polices 5)
+#   autres routes      MAX_BODY_MB (50 Mo)
+UPLOAD_ROUTE_LIMITS = parse_mb_limits(os.environ.get("UPLOAD_ROUTE_LIMITS_MB", ""), {
+    "contact": 25, "admin_portfolio": 250, "admin_carousel": 20, "admin_gallery": 100,
+    "admin_gallery_import": 1, "admin_settings": 20,
+})
+UPLOAD_ROUTE_EXTENSIONS = {
+    "contact": ALLOWED_EXTENSIONS,
+    "admin_portfolio": ALLOWED_EXTENSIONS,
+    "admin_carousel": IMAGE_EXTENSIONS | PDF_EXTENSIONS,
+    "admin_gallery": IMAGE_EXTENSIONS,
+    "admin_gallery_import": {"json"},
+    "admin_settings": IMAGE_EXTENSIONS | FONT_EXTENSIONS,
+}
+UPLOAD_PART_PREFIX = ".upload-"
+
+class UploadStream:
+    """Fichier d'upload écrit dans UPLOAD_FOLDER, borné à limit octets."""
+    def __init__(self, filename, limit):
+        self.filename = filename
+        self.limit = limit
+        self.size = 0
+        fd, self.path = tempfile.mkstemp(prefix=UPLOAD_PART_PREFIX, suffix=".part", dir=UPLOAD_FOLDER)
+        self.file = os.fdopen(fd, "w+b")
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            self.discard()
+            raise RequestEntityTooLarge(
+                f"{self.filename}: fichier trop volumineux (max {self.limit / MB:g} Mo).")
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def commit(self, dest):
+        """Place le fichier à dest (renommage, ou déplacement si autre disque)."""
+        self.file.close()
+        shutil.move(self.path, dest)
+        self.path = None
+
+    def discard(self):
+        self.file.close()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+class DiscardedUpload(io.BytesIO):
+    """Pièce d'extension refusée pour la route : lue puis jetée, jamais stockée."""
+    def write(self, data):
+        return len(data)
+
+class UploadRequest(Request):
+    @property
+    def max_content_length(self):
+        route_limit = UPLOAD_ROUTE_LIMITS.get(self.endpoint)
+        if route_limit is not None:
+            return route_limit
+        return app.config["MAX_CONTENT_LENGTH"]
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        ext = filename.rsplit(".", 1)[-1].lower() if filename and "." in filename else ""
+        if ext not in UPLOAD_ROUTE_EXTENSIONS.get(self.endpoint, ALLOWED_EXTENSIONS):
+            return DiscardedUpload()
+        stream = UploadStream(filename, UPLOAD_EXTENSION_LIMITS.get(ext, UPLOAD_DEFAULT_EXTENSION_LIMIT))
+        self.__dict__.setdefault("_upload_streams", []).append(stream)
+        return stream
+
+app.request_class = UploadRequest
+
+def save_upload(file, path):
+    """Remplace file.save : l'upload est déjà sur disque, il est seulement renommé."""
+    if isinstance(file.stream, UploadStream):
+        file.stream.commit(path)
+    else:
+        file.save(path)
+
+@app.before_request
+def reject_oversize_body():
+    # Rejet sur l'en-tête, avant de lire le moindre octet du corps
+    limit = request.max_content_length
+    if limit and request.content_length and request.content_length > limit:
+        raise RequestEntityTooLarge(f"Requête trop volumineuse (max {limit / MB:g} Mo).")
+
+@app.teardown_request
+def discard_unclaimed_uploads(exc):
+    for stream in request.__dict__.get("_upload_streams", ()):
+        stream.discard()
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    if e.description == RequestEntityTooLarge.description:
+        limit = request.max_content_length or 0
+        message = f"Requête trop volumineuse (max {limit / MB:g} Mo)."
+    else:
+        message = e.description
+    if request.method == "POST" and request.endpoint in UPLOAD_ROUTE_LIMITS and not request.is_json:
+        flash(message, "danger")
+        response = redirect(request.path, code=303)
+    else:
+        response = Response(message, status=413, mimetype="text/plain")
+    # Le reste du corps n'a pas été lu : la connexion ne peut pas être réutilisée
+    response.headers["Connection"] = "close"
+    return response
+
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
+    name = os.path.basename(filename)
+    if (name in INTERNAL_UPLOAD_FILES or name.startswith(("state.", UPLOAD_PART_PREFIX))
+            or filename.startswith("state.")):
+        abort(404)
+    if filename.rsplit(".", 1)[-1].lower() in PRECOMPRESS_EXTENSIONS:
+        return send_precompressed(UPLOAD_FOLDER, filename)
     return send_from_directory(UPLOAD_FOLDER, filename)
 
-@app.route('/contact', methods=['GET', 'POST'])
+@app.route('/theme.<css_hash>.css')
+def theme_stylesheet_file(css_hash):
+    css, current = theme_stylesheet()
+    response = Response(css, mimetype="text/css")
+    if css_hash == current:
+        response.headers["Cache-Control"] = f"public, max-age={ASSETS_MAX_AGE}, immutable"
+    else:
+        # Ancienne empreinte (thème modifié depuis) : contenu à jour, sans cache long
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route('/assets/<path:filename>')
+def asset_file(filename):
+    # Noms avec empreinte : le contenu d'une URL ne change jamais
+    response = send_precompressed(os.path.abspath(ASSETS_DIST_DIR), filename, max_age=ASSETS_MAX_AGE)
+    response.headers["Cache-Control"] = f"public, max-age={ASSETS_MAX_AGE}, immutable"
+    return response
+
+@app.route('/<any(fr, en):lang_code>/contact', methods=['GET', 'POST'])
 def contact():
     if request.method == 'POST':
+        if request.form.get(CONTACT_HONEYPOT_FIELD):
+            # Champ invisible rempli : robot. Réponse identique à un envoi réussi,
+            # rien n'est enregistré (les pièces jointes sont jetées en fin de requête).
+            count_abuse("contact", "honeypot", client_address())
+            flash(("Message envoyé avec succès!" if current_lang()=="fr" else "Message sent successfully!"), "success")
+            return redirect(url_for('contact'))
         nom = request.form.get("nom", "").strip()
         email = request.form.get("email", "").strip()
         sujet = request.form.get("sujet", "").strip()
@@ -352,11 +3540,15 @@ def contact():
                 if allowed_file(file.filename):
                     filename = secure_filename(f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{file.filename}")
                     save_path = os.path.join(UPLOAD_FOLDER, filename)
-                    file.save(save_path)
+                    save_upload(file, save_path)
+                    precompress_upload(save_path)
+                    schedule_pdf_previews(save_path)
+                    schedule_attachment_metadata(save_path)
                     fichiers_info.append(filename)
                 else:
                     flash(f"Fichier non autorisé : {file.filename}", "warning")
         msg_obj = {
+            "id": new_item_id(),
             "nom": nom,
             "email": email,
             "sujet": sujet,
@@ -365,12 +3557,18 @@ def contact():
             "status": "new",
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
-        MSGS.append(msg_obj)
-        save_json_file(MSG_FILE, MSGS)
-        send_email_notification(f"Nouveau message: {sujet}", f"De {nom} <{email}>: {message}")
-        flash(("Message envoyé avec succès!" if session.get("lang","fr")=="fr" else "Message sent successfully!"), "success")
+        apply_op("messages", "append", msg_obj)
+        send_email_notification(f"Nouveau message: {sujet}", f"De {nom} <{email}>: {message}", reply_to=email)
+        flash(("Message envoyé avec succès!" if current_lang()=="fr" else "Message sent successfully!"), "success")
         return redirect(url_for('contact'))
-    return render_template("contact.html", titre_page="Contact")
+    return render_template("contact.html", titre_page="Contact", pow_bits=CONTACT_POW_BITS)
+
+@app.route('/contact/challenge')
+def contact_challenge():
+    # Hors de la page (mise en cache publique) : un défi neuf à chaque visiteur
+    response = jsonify(challenge=issue_pow_challenge(), bits=CONTACT_POW_BITS)
+    response.headers["Cache-Control"] = "no-store"
+    return response
 
 # ----------------------------------------
 # ADMIN LOGIN / LOGOUT
@@ -401,8 +3599,9 @@ def admin_logout():
 @app.route(f'/{ADMIN_SECRET_URL}')
 @admin_login_required
 def admin_index():
-    total_msgs = len(MSGS)
-    unread_msgs = sum(1 for m in MSGS if m.get("status")=="new")
+    with reading("messages"):
+        total_msgs = len(MSGS)
+        unread_msgs = sum(1 for m in MSGS if m.get("status")=="new")
     total_services = len(SERVICES)
     total_portfolio = len(PORTFOLIO)
     total_atouts = len(ATOUTS)
@@ -410,6 +3609,7 @@ def admin_index():
     total_gallery = len(GALLERY_ITEMS)
     total_traffic = len(TRAFFIC)
     return render_template("admin/index.html",
+                           metrics=metrics_summary(),
                            messages_total=total_msgs,
                            unread_msgs=unread_msgs,
                            total_services=total_services,
@@ -424,14 +3624,10 @@ def admin_index():
 @app.route(f'/{ADMIN_SECRET_URL}/services', methods=["GET", "POST"])
 @admin_login_required
 def admin_services():
-    edit_idx = request.args.get("edit")
-    service_to_edit = None
-    if edit_idx is not None and edit_idx.isdigit():
-        idx = int(edit_idx)
-        if 0 <= idx < len(SERVICES):
-            service_to_edit = SERVICES[idx]
+    edit_id = request.args.get("edit")
+    service_to_edit = find_item("services", edit_id) if edit_id else None
     if request.method == "POST":
-        idx_post = request.form.get("edit_idx")
+        id_post = request.form.get("edit_id")
         titre_fr = request.form.get("titre_fr","").strip()
         titre_en = request.form.get("titre_en","").strip()
         desc_fr = request.form.get("desc_fr","").strip()
@@ -440,41 +3636,41 @@ def admin_services():
         new_obj = {"titre": {"fr": titre_fr, "en": titre_en},
                    "desc": {"fr": desc_fr, "en": desc_en},
                    "icon": icon}
-        if idx_post and idx_post.isdigit():
-            idx2 = int(idx_post)
-            if 0 <= idx2 < len(SERVICES):
-                SERVICES[idx2] = new_obj
+        if id_post:
+            if update_item("services", id_post, lambda item: new_obj) is not None:
+                notify_content_changed("services")
                 flash("Service mis à jour.", "success")
+            else:
+                flash("Service introuvable.", "danger")
         else:
-            SERVICES.append(new_obj)
+            apply_op("services", "append", dict(new_obj, id=new_item_id()))
+            notify_content_changed("services")
             flash("Service ajouté.", "success")
         return redirect(url_for('admin_services'))
     return render_template("admin/services.html", service_to_edit=service_to_edit, titre_page="Gestion Services")
 
-@app.route(f'/{ADMIN_SECRET_URL}/services/delete/<int:idx>')
+@app.route(f'/{ADMIN_SECRET_URL}/services/delete/<item_id>')
 @admin_login_required
-def admin_services_delete(idx):
-    if 0 <= idx < len(SERVICES):
-        SERVICES.pop(idx)
+def admin_services_delete(item_id):
+    if update_item("services", item_id, lambda item: None) is not None:
+        notify_content_changed("services")
         flash("Service supprimé.", "info")
     else:
-        flash("Index invalide.", "danger")
+        flash("Service introuvable.", "danger")
     return redirect(url_for('admin_services'))
 
 # --- Gestion Portfolio ---
 @app.route(f'/{ADMIN_SECRET_URL}/portfolio', methods=["GET", "POST"])
 @admin_login_required
 def admin_portfolio():
-    edit_idx = request.args.get("edit")
-    projet_to_edit = None
-    if edit_idx is not None and edit_idx.isdigit():
-        idx = int(edit_idx)
-        if 0 <= idx < len(PORTFOLIO):
-            projet_to_edit = PORTFOLIO[idx]
-            proj = PORTFOLIO[idx]
-            proj['imgs_str'] = ",".join(proj.get("imgs", []))
+    edit_id = request.args.get("edit")
+    projet_to_edit = find_item("portfolio", edit_id) if edit_id else None
+    if projet_to_edit is not None:
+        # Copie : imgs_str ne sert qu'au formulaire et ne doit pas être persisté
+        projet_to_edit = dict(projet_to_edit)
+        projet_to_edit['imgs_str'] = ",".join(projet_to_edit.get("imgs", []))
     if request.method == "POST":
-        idx_post = request.form.get("edit_idx")
+        id_post = request.form.get("edit_id")
         titre_fr = request.form.get("titre_fr","").strip()
         titre_en = request.form.get("titre_en","").strip()
         desc_fr = request.form.get("desc_fr","").strip()
@@ -488,7 +3684,9 @@ def admin_portfolio():
                 if allowed_file(file.filename):
                     filename = secure_filename(f"port_{datetime.now().strftime('%Y%m%d%H%M%S')}_{file.filename}")
                     save_path = os.path.join(UPLOAD_FOLDER, filename)
-                    file.save(save_path)
+                    save_upload(file, save_path)
+                    precompress_upload(save_path)
+                    schedule_attachment_metadata(save_path)
                     fichiers_saved.append(filename)
                 else:
                     flash(f"Fichier non autorisé: {file.filename}", "warning")
@@ -498,61 +3696,66 @@ def admin_portfolio():
             "imgs": imgs_list,
             "fichiers": fichiers_saved
         }
-        if idx_post and idx_post.isdigit():
-            idx2 = int(idx_post)
-            if 0 <= idx2 < len(PORTFOLIO):
-                PORTFOLIO[idx2] = new_obj
+        if id_post:
+            replaced = update_item("portfolio", id_post, lambda item: new_obj)
+            if replaced is not None:
+                # Les fichiers de l'ancienne version ne sont plus référencés
+                forget_attachments([f for f in replaced.get("fichiers", []) if f not in fichiers_saved])
+                notify_content_changed("portfolio")
                 flash("Élément du portfolio mis à jour.", "success")
+            else:
+                flash("Élément du portfolio introuvable.", "danger")
         else:
-            PORTFOLIO.append(new_obj)
+            apply_op("portfolio", "append", dict(new_obj, id=new_item_id()))
+            notify_content_changed("portfolio")
             flash("Élément ajouté au portfolio.", "success")
         return redirect(url_for('admin_portfolio'))
     return render_template("admin/portfolio.html", projet_to_edit=projet_to_edit, titre_page="Gestion Portfolio")
 
-@app.route(f'/{ADMIN_SECRET_URL}/portfolio/delete/<int:idx>')
+@app.route(f'/{ADMIN_SECRET_URL}/portfolio/delete/<item_id>')
 @admin_login_required
-def admin_portfolio_delete(idx):
-    if 0 <= idx < len(PORTFOLIO):
-        PORTFOLIO.pop(idx)
+def admin_portfolio_delete(item_id):
+    removed = update_item("portfolio", item_id, lambda item: None)
+    if removed is not None:
+        forget_attachments(removed.get("fichiers", []))
+        notify_content_changed("portfolio")
         flash("Élément du portfolio supprimé.", "info")
     else:
-        flash("Index invalide.", "danger")
+        flash("Élément du portfolio introuvable.", "danger")
     return redirect(url_for('admin_portfolio'))
 
 # --- Gestion Atouts ---
 @app.route(f'/{ADMIN_SECRET_URL}/atouts', methods=["GET", "POST"])
 @admin_login_required
 def admin_atouts():
-    edit_idx = request.args.get("edit")
-    atout_to_edit = None
-    if edit_idx is not None and edit_idx.isdigit():
-        idx = int(edit_idx)
-        if 0 <= idx < len(ATOUTS):
-            atout_to_edit = ATOUTS[idx]
+    edit_id = request.args.get("edit")
+    atout_to_edit = find_item("atouts", edit_id) if edit_id else None
     if request.method == "POST":
-        idx_post = request.form.get("edit_idx")
+        id_post = request.form.get("edit_id")
         atout_fr = request.form.get("atout_fr","").strip()
         atout_en = request.form.get("atout_en","").strip()
         new_obj = {"fr": atout_fr, "en": atout_en}
-        if idx_post and idx_post.isdigit():
-            idx2 = int(idx_post)
-            if 0 <= idx2 < len(ATOUTS):
-                ATOUTS[idx2] = new_obj
+        if id_post:
+            if update_item("atouts", id_post, lambda item: new_obj) is not None:
+                notify_content_changed("atouts")
                 flash("Atout mis à jour.", "success")
+            else:
+                flash("Atout introuvable.", "danger")
         else:
-            ATOUTS.append(new_obj)
+            apply_op("atouts", "append", dict(new_obj, id=new_item_id()))
+            notify_content_changed("atouts")
             flash("Atout ajouté.", "success")
         return redirect(url_for('admin_atouts'))
     return render_template("admin/atouts.html", atout_to_edit=atout_to_edit, titre_page="Gestion Atouts")
 
-@app.route(f'/{ADMIN_SECRET_URL}/atouts/delete/<int:idx>')
+@app.route(f'/{ADMIN_SECRET_URL}/atouts/delete/<item_id>')
 @admin_login_required
-def admin_atouts_delete(idx):
-    if 0 <= idx < len(ATOUTS):
-        ATOUTS.pop(idx)
+def admin_atouts_delete(item_id):
+    if update_item("atouts", item_id, lambda item: None) is not None:
+        notify_content_changed("atouts")
         flash("Atout supprimé.", "info")
     else:
-        flash("Index invalide.", "danger")
+        flash("Atout introuvable.", "danger")
     return redirect(url_for('admin_atouts'))
 
 # --- Gestion Messages ---
@@ -562,16 +3765,17 @@ def admin_messages():
     page = request.args.get("page", 1, type=int)
     per_page = 10
     search = request.args.get("search","").strip().lower()
-    if search:
-        filtered = [m for m in MSGS if search in m.get("nom","").lower()
-                     or search in m.get("email","").lower()
-                     or search in m.get("sujet","").lower()]
-    else:
-        filtered = MSGS
-    total = len(filtered)
-    start = (page-1)*per_page
-    end = start + per_page
-    paginated = filtered[start:end]
+    with reading("messages"):
+        if search:
+            filtered = [m for m in MSGS if search in m.get("nom","").lower()
+                         or search in m.get("email","").lower()
+                         or search in m.get("sujet","").lower()]
+        else:
+            filtered = MSGS
+        total = len(filtered)
+        start = (page-1)*per_page
+        end = start + per_page
+        paginated = filtered[start:end]
     return render_template("admin/messages.html",
                            messages=paginated,
                            page=page,
@@ -580,25 +3784,212 @@ def admin_messages():
                            search_query=search,
                            titre_page="Gestion Messages")
 
-@app.route(f'/{ADMIN_SECRET_URL}/messages/view/<int:idx>', methods=["GET","POST"])
+@app.route(f'/{ADMIN_SECRET_URL}/messages/view/<msg_id>', methods=["GET","POST"])
 @admin_login_required
-def view_message(idx):
-    if idx < 0 or idx >= len(MSGS):
-        flash("Message introuvable.", "danger")
-        return redirect(url_for('admin_messages'))
-    msg = MSGS[idx]
-    if request.method == "POST":
+def view_message(msg_id):
+    msg = find_item("messages", msg_id)
+    if request.method == "POST" and msg is not None:
         action = request.form.get("action")
         if action == "mark_read":
-            msg['status'] = 'read'
-            save_json_file(MSG_FILE, MSGS)
-            flash("Message marqué comme lu.", "success")
+            msg = update_item("messages", msg_id, lambda item: dict(item, status='read'))
+            if msg is not None:
+                msg = dict(msg, status='read')
+                flash("Message marqué comme lu.", "success")
         elif action == "delete":
-            MSGS.pop(idx)
-            save_json_file(MSG_FILE, MSGS)
-            flash("Message supprimé.", "info")
-            return redirect(url_for('admin_messages'))
-    return render_template("admin/message_view.html", msg=msg, idx=idx, titre_page="Voir Message")
+            removed = update_item("messages", msg_id, lambda item: None)
+            if removed is not None:
+                forget_attachments(removed.get("fichiers", []))
+                flash("Message supprimé.", "info")
+                return redirect(url_for('admin_messages'))
+            msg = None
+    if msg is None:
+        flash("Message introuvable.", "danger")
+        return redirect(url_for('admin_messages'))
+    return render_template("admin/message_view.html", msg=msg, titre_page="Voir Message")
+
+# --- Opérations groupées (messages, carousel, galerie) ---
+def remove_rotator_files(item):
+    try:
+        filename = item.get("filename")
+        if filename:
+            path = os.path.join(UPLOAD_FOLDER, filename)
+            if os.path.exists(path):
+                os.remove(path)
+            remove_sidecars(path)
+            forget_attachments([filename])
+    except:
+        pass
+
+def remove_gallery_files(item):
+    """Supprime les fichiers locaux d'un élément de galerie (image, vidéo ou frames)."""
+    if item.get("type") == "rotation":
+        sources = item.get("frames", [])
+    else:
+        sources = [item.get("source", "")]
+    try:
+        for src in sources:
+            if src and not src.startswith("http"):
+                file_path = os.path.join(UPLOAD_FOLDER, src.split("/")[-1])
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+    except:
+        pass
+
+BULK_ACTIONS = {
+    "messages": ("delete", "mark_read"),
+    "rotator": ("delete", "reorder"),
+    "gallery": ("delete", "reorder"),
+}
+def remove_message_attachments(msg):
+    """Les pièces jointes restent dans les uploads ; seuls index et aperçus sont retirés."""
+    forget_attachments(msg.get("fichiers", []))
+
+BULK_FILE_REMOVERS = {"messages": remove_message_attachments,
+                      "rotator": remove_rotator_files, "gallery": remove_gallery_files}
+
+def bulk_apply(store, action, ids):
+    """
+    Applique action aux éléments d'identifiants ids en une transaction.
+    reorder : les ids donnés passent en tête dans cet ordre, les autres
+    suivent dans leur ordre actuel. Renvoie (nb d'éléments touchés, ids inconnus).
+    """
+    wanted = list(dict.fromkeys(ids))
+
+    def transform(items):
+        by_id = {item.get("id"): item for item in items}
+        unknown = [i for i in wanted if i not in by_id]
+        selected = set(wanted) - set(unknown)
+        if not selected:
+            return None, (0, unknown, [])
+        if action == "delete":
+            kept = [item for item in items if item.get("id") not in selected]
+            removed = [item for item in items if item.get("id") in selected]
+            return kept, (len(removed), unknown, removed)
+        if action == "mark_read":
+            count = sum(1 for item in items if item.get("id") in selected and item.get("status") != "read")
+            items = [dict(item, status="read") if item.get("id") in selected else item for item in items]
+            return (items if count else None), (count, unknown, [])
+        ordered = [by_id[i] for i in wanted if i in by_id]
+        ordered += [item for item in items if item.get("id") not in selected]
+        return ordered, (len(selected), unknown, [])
+
+    count, unknown, removed = update_store(store, transform)
+    remover = BULK_FILE_REMOVERS.get(store)
+    if remover:
+        for item in removed:
+            remover(item)
+    if count and store != "messages":
+        notify_content_changed(store)
+    return count, unknown
+
+def bulk_request():
+    """Paramètres d'une requête groupée : JSON {"action", "ids"} ou formulaire (ids multiples)."""
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        ids = data.get("ids") or []
+        return str(data.get("action", "")), [str(i) for i in ids] if isinstance(ids, list) else []
+    ids = request.form.getlist("ids")
+    if len(ids) == 1 and "," in ids[0]:
+        ids = ids[0].split(",")
+    return request.form.get("action", ""), [i.strip() for i in ids if i.strip()]
+
+def bulk_response(endpoint, message, count, unknown, status=200):
+    if request.is_json:
+        return jsonify({"ok": status == 200, "message": message, "count": count, "unknown": unknown}), status
+    flash(message, "success" if status == 200 and count else ("danger" if status != 200 else "info"))
+    return redirect(url_for(endpoint))
+
+BULK_ENDPOINTS = {"messages": "admin_messages", "rotator": "admin_carousel", "gallery": "admin_gallery"}
+BULK_LABELS = {"delete": "supprimé(s)", "mark_read": "marqué(s) comme lu(s)", "reorder": "réordonné(s)"}
+
+@app.route(f'/{ADMIN_SECRET_URL}/<any(messages, carousel, gallery):section>/bulk', methods=["POST"])
+@admin_login_required
+def admin_bulk(section):
+    store = "rotator" if section == "carousel" else section
+    endpoint = BULK_ENDPOINTS[store]
+    action, ids = bulk_request()
+    if action not in BULK_ACTIONS[store]:
+        return bulk_response(endpoint, f"Action groupée inconnue: {action}", 0, [], status=400)
+    if not ids:
+        return bulk_response(endpoint, "Aucun élément sélectionné.", 0, [], status=400)
+    count, unknown = bulk_apply(store, action, ids)
+    message = f"{count} élément(s) {BULK_LABELS[action]}."
+    if unknown:
+        message += f" {len(unknown)} identifiant(s) inconnu(s)."
+    return bulk_response(endpoint, message, count, unknown)
+
+def manifest_item(entry):
+    """Valide une entrée de manifeste de galerie ; renvoie l'élément ou None."""
+    if not isinstance(entry, dict):
+        return None
+
+    def valid_source(src, extensions):
+        if not isinstance(src, str) or not src:
+            return False
+        if not src.startswith(("http://", "https://")):
+            # Fichier déjà présent dans les uploads
+            name = src.split("/")[-1]
+            if secure_filename(name) != name or not os.path.isfile(os.path.join(UPLOAD_FOLDER, name)):
+                return False
+        return src.rsplit(".", 1)[-1].lower() in extensions
+
+    kind = entry.get("type", "image")
+    item = {"id": new_item_id(), "type": kind,
+            "title": str(entry.get("title", "")).strip(),
+            "description": str(entry.get("description", "")).strip()}
+    if kind == "rotation":
+        frames = entry.get("frames")
+        if not isinstance(frames, list) or len(frames) < 2 or not all(valid_source(f, IMAGE_EXTENSIONS) for f in frames):
+            return None
+        item["frames"] = [local_or_url(f) for f in frames]
+    elif kind in ("image", "video"):
+        source = entry.get("source")
+        if not valid_source(source, IMAGE_EXTENSIONS if kind == "image" else VIDEO_EXTENSIONS):
+            return None
+        item["source"] = local_or_url(source)
+    else:
+        return None
+    return item
+
+def local_or_url(src):
+    if src.startswith(("http://", "https://")):
+        return src
+    return url_for('uploaded_file', filename=src.split("/")[-1])
+
+@app.route(f'/{ADMIN_SECRET_URL}/gallery/import', methods=["POST"])
+@admin_login_required
+def admin_gallery_import():
+    """
+    Import groupé : manifeste JSON (liste d'éléments, ou {"items": [...]})
+    envoyé en corps JSON ou en fichier "manifest". Les entrées invalides sont
+    ignorées ; les valides sont ajoutées en une seule écriture.
+    """
+    if request.is_json:
+        manifest = request.get_json(silent=True)
+    else:
+        file = request.files.get("manifest")
+        try:
+            manifest = json.load(file.stream) if file and file.filename else None
+        except ValueError:
+            manifest = None
+    if isinstance(manifest, dict):
+        manifest = manifest.get("items")
+    if not isinstance(manifest, list):
+        return bulk_response("admin_gallery", "Manifeste invalide: liste d'éléments attendue.", 0, [], status=400)
+    items = [manifest_item(entry) for entry in manifest]
+    rejected = [i for i, item in enumerate(items) if item is None]
+    items = [item for item in items if item is not None]
+    if items:
+        update_store("gallery", lambda current: (current + items, None))
+        notify_content_changed("gallery")
+    message = f"{len(items)} élément(s) importé(s) dans la galerie."
+    if rejected:
+        message += f" {len(rejected)} entrée(s) invalide(s) ignorée(s)."
+    if request.is_json:
+        return jsonify({"ok": True, "message": message, "count": len(items),
+                        "ids": [item["id"] for item in items], "rejected": rejected})
+    flash(message, "success" if items else "warning")
+    return redirect(url_for('admin_gallery'))
 
 # --- Gestion Carousel ---
 @app.route(f'/{ADMIN_SECRET_URL}/carousel', methods=["GET", "POST"])
@@ -608,17 +3999,9 @@ def admin_carousel():
     delid = request.args.get("del")
     if delid and delid.isdigit():
         idx = int(delid)
-        if 0 <= idx < len(ROTATOR_ITEMS):
-            filename = ROTATOR_ITEMS[idx].get("filename")
-            try:
-                if filename:
-                    path = os.path.join(UPLOAD_FOLDER, filename)
-                    if os.path.exists(path):
-                        os.remove(path)
-            except:
-                pass
-            ROTATOR_ITEMS.pop(idx)
-            save_json_file(ROTATOR_FILE, ROTATOR_ITEMS)
+        # Écrite tout de suite (fichiers supprimés une fois l'item retiré) :
+        # seuls les déplacements sont différés
+        if 0 <= idx < len(ROTATOR_ITEMS) and bulk_apply("rotator", "delete", [ROTATOR_ITEMS[idx]["id"]])[0]:
             flash("Item supprimé du carousel.", "info")
         else:
             flash("Index invalide pour suppression.", "danger")
@@ -629,13 +4012,12 @@ def admin_carousel():
     if move and idx_param and idx_param.isdigit():
         idx = int(idx_param)
         if 0 <= idx < len(ROTATOR_ITEMS):
+            item_id = ROTATOR_ITEMS[idx]["id"]
             if move == "up" and idx > 0:
-                ROTATOR_ITEMS[idx-1], ROTATOR_ITEMS[idx] = ROTATOR_ITEMS[idx], ROTATOR_ITEMS[idx-1]
-                save_json_file(ROTATOR_FILE, ROTATOR_ITEMS)
+                write_behind("rotator", moved_item(item_id, -1))
                 flash("Item déplacé vers le haut.", "success")
             elif move == "down" and idx < len(ROTATOR_ITEMS)-1:
-                ROTATOR_ITEMS[idx+1], ROTATOR_ITEMS[idx] = ROTATOR_ITEMS[idx], ROTATOR_ITEMS[idx+1]
-                save_json_file(ROTATOR_FILE, ROTATOR_ITEMS)
+                write_behind("rotator", moved_item(item_id, 1))
                 flash("Item déplacé vers le bas.", "success")
         return redirect(url_for('admin_carousel'))
     if request.method == "POST":
@@ -653,15 +4035,17 @@ def admin_carousel():
                 return redirect(url_for('admin_carousel'))
             filename = secure_filename(f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{file.filename}")
             filepath = os.path.join(UPLOAD_FOLDER, filename)
-            file.save(filepath)
+            save_upload(file, filepath)
+            precompress_upload(filepath)
+            schedule_pdf_previews(filepath, "rotator")
             ftype = "image" if ext in IMAGE_EXTENSIONS else "pdf"
-            ROTATOR_ITEMS.append({"filename": filename, "type": ftype})
-            save_json_file(ROTATOR_FILE, ROTATOR_ITEMS)
+            apply_op("rotator", "append", {"id": new_item_id(), "filename": filename, "type": ftype})
+            notify_content_changed("rotator")
             flash("Fichier ajouté au carousel.", "success")
         else:
             flash("Fichier non valide.", "danger")
         return redirect(url_for('admin_carousel'))
-    return render_template("admin/carousel.html", titre_page="Gestion Carousel")
+    return render_template("admin/carousel.html", titre_page="Gestion Carousel", pdf_rasterizer=PDF_RASTERIZER)
 
 # --- Gestion Galerie (avec vues tournantes) ---
 @app.route(f'/{ADMIN_SECRET_URL}/gallery', methods=["GET", "POST"])
@@ -671,35 +4055,7 @@ def admin_gallery():
     delid = request.args.get("del")
     if delid and delid.isdigit():
         idx = int(delid)
-        if 0 <= idx < len(GALLERY_ITEMS):
-            item = GALLERY_ITEMS.pop(idx)
-            # Si local, supprimer les fichiers
-            try:
-                if item.get("type") == "image":
-                    src = item.get("source","")
-                    if src and not src.startswith("http"):
-                        filename = src.split("/")[-1]
-                        file_path = os.path.join(UPLOAD_FOLDER, filename)
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                elif item.get("type") == "video":
-                    src = item.get("source","")
-                    if src and not src.startswith("http"):
-                        filename = src.split("/")[-1]
-                        file_path = os.path.join(UPLOAD_FOLDER, filename)
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                elif item.get("type") == "rotation":
-                    # supprimer chaque frame locale
-                    for src in item.get("frames", []):
-                        if not src.startswith("http"):
-                            filename = src.split("/")[-1]
-                            file_path = os.path.join(UPLOAD_FOLDER, filename)
-                            if os.path.exists(file_path):
-                                os.remove(file_path)
-            except:
-                pass
-            save_json_file(GALLERY_FILE, GALLERY_ITEMS)
+        if 0 <= idx < len(GALLERY_ITEMS) and bulk_apply("gallery", "delete", [GALLERY_ITEMS[idx]["id"]])[0]:
             flash("Élément galerie supprimé.", "info")
         else:
             flash("Index invalide pour suppression.", "danger")
@@ -721,7 +4077,7 @@ def admin_gallery():
                     if ext in IMAGE_EXTENSIONS:
                         filename = secure_filename(f"gallery_{datetime.now().strftime('%Y%m%d%H%M%S')}_{file.filename}")
                         save_path = os.path.join(UPLOAD_FOLDER, filename)
-                        file.save(save_path)
+                        save_upload(file, save_path)
                         source = url_for('uploaded_file', filename=filename)
                         valid_images.append(source)
                     else:
@@ -731,21 +4087,21 @@ def admin_gallery():
                     flash(f"Fichier non autorisé: {file.filename}", "warning")
         if len(valid_images) > 1:
             # Crée un item rotation
-            GALLERY_ITEMS.append({
+            item = {
                 "type": "rotation",
                 "frames": valid_images,
                 "title": title,
                 "description": description
-            })
+            }
             added = True
         elif len(valid_images) == 1 and not url_input:
             # Un seul fichier image uploadé => item image classique
-            GALLERY_ITEMS.append({
+            item = {
                 "type": "image",
                 "source": valid_images[0],
                 "title": title,
                 "description": description
-            })
+            }
             added = True
         else:
             # Cas URL input
@@ -764,22 +4120,22 @@ def admin_gallery():
                         else:
                             flash(f"URL invalide: {u}", "warning")
                     if len(valid_urls) > 1:
-                        GALLERY_ITEMS.append({
+                        item = {
                             "type": "rotation",
                             "frames": valid_urls,
                             "title": title,
                             "description": description
-                        })
+                        }
                         added = True
                     elif len(valid_urls) == 1:
                         # Cas improbable : une URL unique => traiter plus bas
                         single_url = valid_urls[0]
-                        GALLERY_ITEMS.append({
+                        item = {
                             "type": "image",
                             "source": single_url,
                             "title": title,
                             "description": description
-                        })
+                        }
                         added = True
                 else:
                     # Une seule URL => image ou vidéo
@@ -787,20 +4143,20 @@ def admin_gallery():
                     if u.startswith("http://") or u.startswith("https://"):
                         ext = u.rsplit('.', 1)[-1].lower()
                         if ext in IMAGE_EXTENSIONS:
-                            GALLERY_ITEMS.append({
+                            item = {
                                 "type": "image",
                                 "source": u,
                                 "title": title,
                                 "description": description
-                            })
+                            }
                             added = True
                         elif ext in VIDEO_EXTENSIONS:
-                            GALLERY_ITEMS.append({
+                            item = {
                                 "type": "video",
                                 "source": u,
                                 "title": title,
                                 "description": description
-                            })
+                            }
                             added = True
                         else:
                             flash("L’URL ne pointe pas vers un format supporté (image/vidéo).", "warning")
@@ -812,7 +4168,9 @@ def admin_gallery():
                     flash("Veuillez fournir des fichiers ou des URLs pour la galerie.", "warning")
 
         if added:
-            save_json_file(GALLERY_FILE, GALLERY_ITEMS)
+            item["id"] = new_item_id()
+            apply_op("gallery", "append", item)
+            notify_content_changed("gallery")
             flash("Élément ajouté à la galerie.", "success")
         return redirect(url_for('admin_gallery'))
 
@@ -823,14 +4181,15 @@ def admin_gallery():
 @admin_login_required
 def admin_analytics():
     counts = {}
-    for m in MSGS:
-        ts = m.get("timestamp","")
-        if ts:
-            date = ts.split(" ")[0]
-            counts[date] = counts.get(date, 0) + 1
+    with reading("messages"):
+        for m in MSGS:
+            ts = m.get("timestamp","")
+            if ts:
+                date = ts.split(" ")[0]
+                counts[date] = counts.get(date, 0) + 1
+        total_msgs = len(MSGS)
+        unread_msgs = sum(1 for m in MSGS if m.get("status")=="new")
     sorted_dates = sorted(counts.items(), key=lambda x: x[0], reverse=True)
-    total_msgs = len(MSGS)
-    unread_msgs = sum(1 for m in MSGS if m.get("status")=="new")
     total_services = len(SERVICES)
     total_portfolio = len(PORTFOLIO)
     return render_template("admin/analytics.html",
@@ -845,10 +4204,17 @@ def admin_analytics():
 @app.route(f'/{ADMIN_SECRET_URL}/download_uploads')
 @admin_login_required
 def download_all_uploads():
+    # Exports JSON à jour avant l'archive
+    compact_state()
+    flush_json_writes()
     memory_file = io.BytesIO()
     with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
         for root, dirs, files in os.walk(UPLOAD_FOLDER):
+            if os.path.abspath(root) == os.path.abspath(UPLOAD_FOLDER) and "previews" in dirs:
+                dirs.remove("previews")  # aperçus PDF, régénérables
             for file in files:
+                if file.endswith((".gz", ".br", ".tmp", ".part")) or file.startswith("state."):
+                    continue  # variantes précompressées et état interne, régénérables
                 file_path = os.path.join(root, file)
                 arcname = os.path.relpath(file_path, UPLOAD_FOLDER)
                 zf.write(file_path, arcname=arcname)
@@ -863,13 +4229,14 @@ def admin_traffic():
     search_query = request.args.get('search', '').lower()
     page = request.args.get('page', 1, type=int)
     per_page = 20
-    filtered = TRAFFIC
-    if search_query:
-        filtered = [log for log in TRAFFIC if search_query in log.get('path',"").lower() or search_query in log.get('remote_addr',"").lower()]
-    total = len(filtered)
-    start = (page-1)*per_page
-    end = start + per_page
-    paginated = filtered[start:end]
+    with reading("traffic"):
+        filtered = TRAFFIC
+        if search_query:
+            filtered = [log for log in TRAFFIC if search_query in log.get('path',"").lower() or search_query in log.get('remote_addr',"").lower()]
+        total = len(filtered)
+        start = (page-1)*per_page
+        end = start + per_page
+        paginated = filtered[start:end]
     return render_template("admin/traffic.html",
                            logs=paginated,
                            total_logs=total,
@@ -878,6 +4245,156 @@ def admin_traffic():
                            search_query=search_query,
                            titre_page="Logs Traffic")
 
+# --- Exports CSV / JSON Lines (en flux) ---
+# Les lignes sont produites une par une à partir de tranches du store copiées
+# sous verrou de lecture : mémoire constante quelle que soit la taille, et
+# les écritures (contact, trafic) ne sont bloquées que le temps d'une copie.
+# Chaque ligne porte un curseur ; ?cursor=<curseur de la dernière ligne reçue>
+# reprend l'export juste après.
+EXPORT_CHUNK_ROWS = 500
+EXPORT_FIELDS = {
+    "messages": ("id", "timestamp", "status", "nom", "email", "sujet", "message", "fichiers"),
+    "traffic": ("timestamp", "method", "path", "remote_addr"),
+}
+EXPORT_MIMETYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+def iter_store(store, pos=0, after_id=None):
+    """
+    Parcourt store à partir de la position pos ; produit (curseur, élément).
+    Pour les stores à identifiants, la position est recalée sur le dernier
+    id lu si des éléments ont été supprimés entre deux tranches.
+    """
+    while True:
+        with reading(store):
+            items = STATE[store]
+            if after_id is not None and not (0 < pos <= len(items) and items[pos - 1].get("id") == after_id):
+                pos = next((i + 1 for i, item in enumerate(items) if item.get("id") == after_id),
+                           min(pos, len(items)))
+            chunk = items[pos:pos + EXPORT_CHUNK_ROWS]
+        if not chunk:
+            return
+        for item in chunk:
+            pos += 1
+            after_id = item.get("id")
+            yield (f"{pos}.{after_id}" if after_id else str(pos)), item
+
+def parse_export_cursor(value):
+    """'123' ou '123.<id>' -> (position, id) ; None si invalide."""
+    pos, _, item_id = value.partition(".")
+    if not pos.isdigit():
+        return None
+    return int(pos), (item_id or None)
+
+def export_rows(fmt, rows, fields):
+    """Sérialise (curseur, élément) en CSV ou JSON Lines, par paquets de lignes."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(fields + ("cursor",))
+    count = 0
+    for cursor, item in rows:
+        if fmt == "csv":
+            writer.writerow([" ".join(item.get(f) or []) if f == "fichiers" else item.get(f, "")
+                             for f in fields] + [cursor])
+        else:
+            buffer.write(json.dumps(dict(item, cursor=cursor), ensure_ascii=False) + "\n")
+        count += 1
+        if count % 100 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+@app.route(f'/{ADMIN_SECRET_URL}/export/<any(messages, traffic):store>.<any(csv, jsonl):fmt>')
+@admin_login_required
+def admin_export(store, fmt):
+    """
+    Export en flux. Paramètres : from / to (AAAA-MM-JJ, inclus), status
+    (messages), cursor (reprise), limit (nombre max de lignes).
+    """
+    date_from = request.args.get("from", "").strip()
+    date_to = request.args.get("to", "").strip()
+    status = request.args.get("status", "").strip()
+    limit = request.args.get("limit", 0, type=int)
+    for value in (date_from, date_to):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                return Response("Date invalide (format AAAA-MM-JJ).", status=400, mimetype="text/plain")
+    cursor = parse_export_cursor(request.args["cursor"]) if request.args.get("cursor") else (0, None)
+    if cursor is None:
+        return Response("Curseur invalide.", status=400, mimetype="text/plain")
+    pos, after_id = cursor
+    if store == "traffic" and date_from and not request.args.get("cursor"):
+        # Trafic journalisé dans l'ordre chronologique : départ par dichotomie
+        with reading("traffic"):
+            pos = bisect_left(TRAFFIC, date_from, key=lambda e: e.get("timestamp", ""))
+
+    def rows():
+        sent = 0
+        for row_cursor, item in iter_store(store, pos, after_id):
+            day = item.get("timestamp", "")[:10]
+            if date_to and day > date_to:
+                if store == "traffic":
+                    return  # chronologique : plus rien à exporter
+                continue
+            if date_from and day < date_from:
+                continue
+            if status and item.get("status") != status:
+                continue
+            yield row_cursor, item
+            sent += 1
+            if limit and sent >= limit:
+                return
+
+    name = f"{store}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    response = Response(export_rows(fmt, rows(), EXPORT_FIELDS[store]),
+                        mimetype=EXPORT_MIMETYPES[fmt])
+    response.headers["Content-Disposition"] = f"attachment; filename={name}"
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+# --- Profileur ---
+@app.route(f'/{ADMIN_SECRET_URL}/profiler', methods=["GET", "POST"])
+@admin_login_required
+def admin_profiler():
+    if request.method == "POST":
+        PROFILER["enabled"] = request.form.get("enabled") == "on"
+        try:
+            rate = float(request.form.get("sample_rate", PROFILER["sample_rate"]))
+        except ValueError:
+            rate = PROFILER["sample_rate"]
+        PROFILER["sample_rate"] = min(max(rate, 0.0), 1.0)
+        flash("Profileur activé." if PROFILER["enabled"] else "Profileur désactivé.", "info")
+        return redirect(url_for('admin_profiler'))
+    profiles = load_profiles()
+    selected = None
+    profile_id = request.args.get("id")
+    if profile_id:
+        selected = next((p for p in profiles if p.get("id") == profile_id), None)
+    slowest = sorted(profiles, key=lambda p: p.get("duration_ms", 0), reverse=True)[:25]
+    return render_template("admin/profiler.html",
+                           profiler=PROFILER,
+                           profiles=slowest,
+                           total_profiles=len(profiles),
+                           selected=selected,
+                           titre_page="Profileur")
+
+@app.route(f'/{ADMIN_SECRET_URL}/profiler/<profile_id>.prof')
+@admin_login_required
+def admin_profile_download(profile_id):
+    return send_from_directory(os.path.abspath(PROFILE_DIR), f"{secure_filename(profile_id)}.prof", as_attachment=True)
+
+# --- Métriques Prometheus ---
+@app.route(f'/{ADMIN_SECRET_URL}/metrics')
+def admin_metrics():
+    token_ok = bool(METRICS_TOKEN) and hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(), f"Bearer {METRICS_TOKEN}".encode())
+    if not token_ok and not session.get("admin_logged_in"):
+        abort(401)
+    return Response(render_prometheus_metrics(), mimetype="text/plain; version=0.0.4")
+
 # --- Robots.txt ---
 @app.route('/robots.txt')
 def robots_txt():
@@ -886,332 +4403,186 @@ def robots_txt():
     return Response(content, mimetype='text/plain')
 
 # --- Sitemap.xml ---
+# Généré une fois puis gardé en mémoire jusqu'au prochain changement de
+# contenu (notify_content_changed). Au-delà des limites du protocole, le
+# sitemap devient un index pointant vers /sitemap-<n>.xml.
+SITEMAP_MAX_URLS = int(os.environ.get("SITEMAP_MAX_URLS", 50000))
+SITEMAP_MAX_BYTES = 50 * 1024 * 1024
+SITEMAP_MAX_IMAGES_PER_URL = 1000
+SITEMAP_MAX_AGE = 3600
+# Stores dont dépend chaque page publique (pour son lastmod)
+PAGE_STORES = {
+    "index": ("code", "config", "rotator", "services", "atouts"),
+    "services": ("code", "config", "services"),
+    "portfolio": ("code", "config", "portfolio"),
+    "galeries": ("code", "config", "gallery"),
+    "pourquoi": ("code", "config", "atouts"),
+    "contact": ("code", "config"),
+}
+SITEMAP_NS = ('xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" '
+              'xmlns:xhtml="http://www.w3.org/1999/xhtml" '
+              'xmlns:image="http://www.google.com/schemas/sitemap-image/1.1"')
+_sitemap_cache = {"base": None, "files": None}
+_sitemap_lock = threading.Lock()
+
+def invalidate_sitemap():
+    with _sitemap_lock:
+        _sitemap_cache["files"] = None
+
+def page_images(endpoint, base):
+    """Images publiques affichées par la page (extension image du sitemap)."""
+    images = []
+    if endpoint == "galeries":
+        with reading("gallery"):
+            for item in GALLERY_ITEMS:
+                if item.get("type") == "image":
+                    images.append(item.get("source"))
+                elif item.get("type") == "rotation" and item.get("frames"):
+                    images.append(item["frames"][0])
+    elif endpoint == "portfolio":
+        with reading("portfolio"):
+            images = [proj["imgs"][0] for proj in PORTFOLIO if proj.get("imgs")]
+    absolute = []
+    for src in images:
+        if src and not src.startswith(("http://", "https://")):
+            src = base + src.lstrip("/")
+        if src:
+            absolute.append(src)
+    return absolute[:SITEMAP_MAX_IMAGES_PER_URL]
+
+def sitemap_lastmod(endpoint):
+    stamps = [CONTENT_VERSIONS[s] for s in PAGE_STORES.get(endpoint, ("code",)) if CONTENT_VERSIONS.get(s)]
+    return max(stamps)[:10] if stamps else None
+
+def sitemap_entries(base):
+    entries = []
+    for endpoint in PUBLIC_ENDPOINTS:
+        alternates = {code: url_for(endpoint, lang_code=code, _external=True) for code in LANGS}
+        links = "".join(f'<xhtml:link rel="alternate" hreflang="{code}" href="{escape(href)}"/>'
+                        for code, href in alternates.items())
+        lastmod = sitemap_lastmod(endpoint)
+        images = "".join(f"<image:image><image:loc>{escape(src)}</image:loc></image:image>"
+                         for src in page_images(endpoint, base))
+        for href in alternates.values():
+            entries.append(f"<url><loc>{escape(href)}</loc>"
+                           + (f"<lastmod>{lastmod}</lastmod>" if lastmod else "")
+                           + links + images + "</url>")
+    return entries
+
+def build_sitemap(base):
+    """
+    Renvoie {nom: xml} : soit {"sitemap.xml": urlset}, soit un index et ses
+    fichiers "sitemap-<n>.xml" si les limites d'URL ou d'octets sont dépassées.
+    """
+    header = f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset {SITEMAP_NS}>\n'
+    footer = "\n</urlset>"
+    chunks, current, size = [], [], len(header) + len(footer)
+    for entry in sitemap_entries(base):
+        entry_size = len(entry.encode("utf-8")) + 1
+        if current and (len(current) >= SITEMAP_MAX_URLS or size + entry_size > SITEMAP_MAX_BYTES):
+            chunks.append(current)
+            current, size = [], len(header) + len(footer)
+        current.append(entry)
+        size += entry_size
+    chunks.append(current)
+    if len(chunks) == 1:
+        return {"sitemap.xml": header + "\n".join(chunks[0]) + footer}
+    files = {}
+    lastmod = max(v for v in CONTENT_VERSIONS.values() if v)[:10]
+    index = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+    for n, chunk in enumerate(chunks, 1):
+        files[f"sitemap-{n}.xml"] = header + "\n".join(chunk) + footer
+        loc = url_for("sitemap_part", n=n, _external=True)
+        index.append(f"<sitemap><loc>{escape(loc)}</loc><lastmod>{lastmod}</lastmod></sitemap>")
+    index.append("</sitemapindex>")
+    files["sitemap.xml"] = "\n".join(index)
+    return files
+
+def sitemap_response(name):
+    base = request.url_root
+    with _sitemap_lock:
+        if _sitemap_cache["files"] is None or _sitemap_cache["base"] != base:
+            _sitemap_cache["files"] = build_sitemap(base)
+            _sitemap_cache["base"] = base
+        xml = _sitemap_cache["files"].get(name)
+    if xml is None:
+        abort(404)
+    response = app.response_class(xml, mimetype='application/xml')
+    response.headers["Cache-Control"] = f"public, max-age={SITEMAP_MAX_AGE}"
+    response.set_etag(hashlib.blake2b(xml.encode("utf-8"), digest_size=16).hexdigest())
+    return response.make_conditional(request)
+
 @app.route('/sitemap.xml', methods=['GET'])
 def sitemap():
-    pages = [
-        url_for('index', _external=True),
-        url_for('services', _external=True),
-        url_for('portfolio', _external=True),
-        url_for('galeries', _external=True),
-        url_for('pourquoi', _external=True),
-        url_for('contact', _external=True),
-        url_for('toggle_dark', _external=True),
-    ]
-    xml = ['<?xml version="1.0" encoding="UTF-8"?>',
-           '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
-    for p in pages:
-        xml.append(f"<url><loc>{p}</loc></url>")
-    xml.append("</urlset>")
-    response = app.response_class("\n".join(xml), mimetype='application/xml')
-    return response
+    return sitemap_response("sitemap.xml")
+
+@app.route('/sitemap-<int:n>.xml', methods=['GET'])
+def sitemap_part(n):
+    return sitemap_response(f"sitemap-{n}.xml")
 
 # ----------------------------------------
 # DÉFINITION DES TEMPLATES INLINE (DictLoader)
 # ----------------------------------------
-# Pour rester en single-file, on stocke tous les templates Jinja dans un dict.
-# Le CSS est retravaillé pour des couleurs vives et alternances de sections.
-base_template = """
-<!DOCTYPE html>
-<html lang="{{ lang }}">
-<head>
-    <meta charset="UTF-8">
-    <title>{% if titre_page %}{{ titre_page }} | {% endif %}{{ site.nom }}</title>
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <!-- Bootstrap CSS -->
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css" rel="stylesheet">
-    <!-- AOS animations -->
-    <link href="https://cdn.jsdelivr.net/npm/aos@2.3.4/dist/aos.css" rel="stylesheet">
-    <!-- Google Font dynamique -->
-    <link href="https://fonts.googleapis.com/css2?family={{ site.font|replace(' ','+') }}:wght@300;400;500;600;700&display=swap" rel="stylesheet">
-    <!-- Bootstrap Icons -->
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.css" rel="stylesheet">
-    <!-- SpriteSpin (pour vues tournantes) -->
-    <script src="https://cdn.jsdelivr.net/npm/jquery@3.6.0/dist/jquery.min.js"></script>
-    <script src="https://cdn.jsdelivr.net/npm/spritespin@4.0.11/release/spritespin.min.js"></script>
-    <style>
-        /* Palette vive via variables CSS */
-        :root {
-            --color-primary: {{ site.couleur }};           /* magenta vif ou valeur admin */
-            --color-secondary: {{ site.secondary }};       /* orange vif ou valeur admin */
-            --color-accent: {{ site.accent }};             /* vert vif ou valeur admin */
-            --color-alt1: #FFF3E0;   /* pastel pêche clair pour alternance */
-            --color-alt2: #E8F5E9;   /* pastel vert clair */
-            --color-alt3: #E3F2FD;   /* pastel bleu clair */
-            --bg-light: #FAFAFA;     /* fond clair */
-            --bg-dark: #121212;      /* fond sombre plus doux */
-            --text-dark: #212121;    /* texte sombre */
-            --text-light: #F5F5F5;   /* texte clair */
-            --card-bg-light: #FFFFFF;/* carte en mode clair */
-            --card-bg-alt: #F1F1F1;  /* alternatif clair */
-            --card-bg-dark: #1E1E1E; /* carte en mode sombre */
-            --gradient-primary: linear-gradient(135deg, {{ site.couleur }}, {{ site.secondary }}); 
-            --gradient-secondary: linear-gradient(135deg, {{ site.secondary }}, {{ site.accent }});
-            --gradient-accent: linear-gradient(135deg, {{ site.accent }}, {{ site.couleur }});
-            --font-family: '{{ site.font }}', Arial, sans-serif;
-        }
-        body {
-            font-family: var(--font-family);
-            background: var(--bg-light);
-            color: var(--text-dark);
-            margin: 0; padding: 0;
-            transition: background 0.3s, color 0.3s;
-        }
-        body.dark-mode {
-            background: var(--bg-dark) !important;
-            color: var(--text-light) !important;
-        }
-        a {
-            color: var(--color-primary);
-            text-decoration: none;
-            transition: color 0.2s;
-        }
-        a:hover {
-            color: var(--color-accent);
-            text-decoration: underline;
-        }
-        /* Navbar */
-        .navbar {
-            background: var(--gradient-primary) !important;
-        }
-        .navbar .nav-link {
-            color: #fff !important;
-        }
-        .navbar .nav-link.active {
-            color: var(--color-accent) !important;
-            font-weight: bold;
-            border-bottom: 2px solid var(--color-accent);
-        }
-        .navbar .nav-link:hover {
-            color: var(--color-accent) !important;
-        }
-        .dark-toggle { cursor: pointer; color: #fff; margin-left: 1rem; }
-        /* Hero */
-        .hero {
-            position: relative;
-            text-align: center;
-            color: var(--text-light);
-            padding: 80px 0;
-            background:
-                linear-gradient(135deg, rgba(233,30,99,0.8), rgba(255,87,34,0.8)),
-                url('{{ site.photo }}') center/cover no-repeat;
-        }
-        .hero img {
-            width: 140px; height:140px; object-fit:cover;
-            border-radius: 50%;
-            border: 3px solid var(--color-accent);
-            box-shadow: 0 4px 16px rgba(0,0,0,0.6);
-            transition: transform 0.3s;
-        }
-        .hero img:hover {
-            transform: scale(1.05);
-        }
-        .hero h1, .hero h3, .hero p {
-            text-shadow: 1px 1px 6px rgba(0,0,0,0.7);
-            margin: 10px 0;
-        }
-        .hero .btn-contact {
-            border-radius: 30px;
-            padding: 12px 30px;
-            font-size: 1.1rem;
-            background: var(--color-secondary);
-            color: #fff;
-            box-shadow: 0 4px 12px rgba(0,0,0,0.3);
-            transition: transform 0.2s, box-shadow 0.2s;
-        }
-        .hero .btn-contact:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 6px 16px rgba(0,0,0,0.4);
-            background: var(--color-accent);
-        }
-        /* Section titles */
-        .section-title {
-            color: var(--color-primary);
-            margin-top: 48px;
-            margin-bottom: 24px;
-            font-weight: 600;
-            letter-spacing: 0.5px;
-            position: relative;
-            display: inline-block;
-        }
-        .section-title::after {
-            content: "";
-            display: block;
-            width: 60px;
-            height: 3px;
-            background: var(--color-primary);
-            margin: 8px auto 0;
-            border-radius: 2px;
-        }
-        /* Service cards */
-        .service-card {
-            background: var(--card-bg-light);
-            border-radius:20px;
-            padding:24px 16px;
-            text-align:center;
-            margin-bottom:20px;
-            box-shadow:0 2px 14px rgba(0,0,0,0.1);
-            transition: transform 0.3s, box-shadow 0.3s, background 0.3s;
-            border-top: 4px solid var(--color-primary);
-        }
-        .service-card:hover {
-            transform: translateY(-6px);
-            box-shadow:0 6px 24px rgba(0,0,0,0.15);
-            background: var(--card-bg-alt);
-        }
-        .service-card i {
-            font-size:2.4rem;
-            color: var(--color-secondary);
-            margin-bottom:12px;
-        }
-        body.dark-mode .service-card {
-            background: var(--card-bg-dark);
-            color: var(--text-light);
-        }
-        body.dark-mode .service-card:hover {
-            background: #2a2a2a;
-        }
-        /* Portfolio */
-        .card-portfolio {
-            border: none;
-            border-radius: 15px;
-            overflow: hidden;
-            transition: transform 0.3s, box-shadow 0.3s, background 0.3s;
-            background: var(--card-bg-light);
-            color: var(--text-dark);
-            box-shadow:0 2px 12px rgba(0,0,0,0.1);
-            margin-bottom: 24px;
-            border-left: 4px solid var(--color-secondary);
-        }
-        .card-portfolio:hover {
-            transform: translateY(-6px);
-            box-shadow:0 8px 28px rgba(0,0,0,0.2);
-            background: var(--card-bg-alt);
-        }
-        .portfolio-img {
-            height:200px; width:100%; object-fit:cover;
-        }
-        body.dark-mode .card-portfolio {
-            background: var(--card-bg-dark);
-            color: var(--text-light);
-        }
-        /* Gallery */
-        .gallery-container {
-            display: flex;
-            flex-wrap: wrap;
-            gap: 16px;
-            justify-content: center;
-        }
-        .gallery-item {
-            background: var(--card-bg-light);
-            border-radius: 12px;
-            overflow: hidden;
-            box-shadow: 0 2px 12px rgba(0,0,0,0.1);
-            transition: transform 0.3s, box-shadow 0.3s, background 0.3s;
-            width: 300px;
-            display: flex;
-            flex-direction: column;
-            border-top: 4px solid var(--color-accent);
-        }
-        .gallery-item:hover {
-            transform: translateY(-4px);
-            box-shadow: 0 6px 20px rgba(0,0,0,0.15);
-            background: var(--card-bg-alt);
-        }
-        .gallery-item img,
-        .gallery-item video {
-            max-width: 100%;
-            height: auto;
-            display: block;
-        }
-        .gallery-caption {
-            padding: 12px;
-        }
-        .gallery-caption h5 {
-            margin: 0 0 8px;
-            font-size: 1.1rem;
-            color: var(--color-primary);
-        }
-        .gallery-caption p {
-            margin: 0;
-            font-size: 0.95rem;
-            color: #555;
-        }
-        body.dark-mode .gallery-item {
-            background: var(--card-bg-dark);
-            color: var(--text-light);
-        }
-        /* Viewer 360° */
-        .rotation-viewer {
-            width: 100%;
-            aspect-ratio: 1 / 1;
-            background: #f2f2f2;
-            position: relative;
-            border: 2px solid var(--color-primary);
-        }
-        /* Footer */
-        .footer { background: var(--bg-dark); color: #fff; padding: 30px 0; margin-top: 0; }
-        .footer a { color: var(--color-accent); text-decoration: none; }
-        .footer a:hover { text-decoration: underline; }
-        .project-cta {
-            background: var(--gradient-secondary);
-            color:#fff;
-            border-radius:20px;
-            padding:25px 15px;
-            margin:30px 0 15px 0;
-            box-shadow:0 4px 16px rgba(0,0,0,0.15);
-            font-size:1.1rem;
-            font-weight:500;
-            text-align: center;
-        }
-        /* Admin */
-        .admin-nav { background:#2c2f33; padding:10px; border-radius:10px; margin-bottom:10px; }
-        .admin-nav a { color:#FFD700; margin:0 8px; font-weight:bold; text-decoration:none;}
-        .admin-panel {
-            background: var(--card-bg-light);
-            border-radius:14px;
-            padding:20px 16px;
-            margin-top:10px;
-            box-shadow:0 4px 24px rgba(0,0,0,0.1);
-            color: var(--text-dark);
-        }
-        body.dark-mode .admin-panel {
-            background: var(--card-bg-dark);
-            color: var(--text-light);
-        }
-        .admin-table td, .admin-table th { vertical-align:middle; color: inherit; }
-        .admin-msg { background: #fff3cd; border:1px solid var(--color-primary); border-radius:8px; padding:12px 18px; }
-        /* Drag-drop */
-        .drag-drop-area {
-            border:2px dashed #bbb;
-            border-radius:10px;
-            background:#f8fbff;
-            text-align:center;
-            padding:20px 8px;
-            color:#789;
-            margin-bottom:12px;
-            transition: border .2s, background .2s;
-            position: relative;
-        }
-        .drag-drop-area.dragover { border:2.2px solid var(--color-primary); background:#e7f7ff; }
-        /* Responsive */
-        @media (max-width:600px) {
-            html { font-size:15px; }
-            .hero, .carousel { padding: 40px 0 30px 0; }
-            .project-cta { padding:10px 5px; }
-            .admin-panel { padding:10px 8px; }
-            .carousel-item img {
-                max-height: 250px;
-                height: auto;
-            }
-            .hero img { width: 100px; height:100px; }
-            .gallery-item {
-                width: 100%;
-            }
-        }
-    </style>
+# Pour rester en single-file, on stocke tous les templates Jinja dans un dict.
+base_template = """
+<!DOCTYPE html>
+<html lang="{{ lang }}">
+<head>
+    <meta charset="UTF-8">
+    <title>{% if titre_page %}{{ titre_page }} | {% endif %}{{ site.nom }}</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    {% set critical = critical_css() %}
+    {% if critical %}
+    <!-- CSS critique en ligne ; le reste des feuilles se charge sans bloquer le rendu -->
+    <style>{{ critical|safe }}</style>
+    {% for href in [asset_url('site.css'), theme_css_url()] %}
+    <link rel="preload" href="{{ href }}" as="style" onload="this.onload=null;this.rel='stylesheet'">
+    <noscript><link rel="stylesheet" href="{{ href }}"></noscript>
+    {% endfor %}
+    {% else %}
+    {% if asset_url('site.css') %}
+    <!-- Bootstrap, AOS et Bootstrap Icons (bundle local) -->
+    <link href="{{ asset_url('site.css') }}" rel="stylesheet">
+    {% else %}
+    <!-- Bootstrap CSS -->
+    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css" rel="stylesheet">
+    <!-- AOS animations -->
+    <link href="https://cdn.jsdelivr.net/npm/aos@2.3.4/dist/aos.css" rel="stylesheet">
+    <!-- Bootstrap Icons -->
+    <link href="https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.css" rel="stylesheet">
+    {% endif %}
+    <!-- Feuille du thème (couleurs et police de l'admin) -->
+    <link href="{{ theme_css_url() }}" rel="stylesheet">
+    {% endif %}
+    {% set local_fonts = theme_fonts() %}
+    {% if local_fonts %}
+    <!-- Police du thème auto-hébergée (sous-ensemble WOFF2) -->
+    {% for url in local_fonts.preload %}
+    <link rel="preload" href="{{ url }}" as="font" type="font/woff2" crossorigin>
+    {% endfor %}
+    <style>{{ local_fonts.css|safe }}</style>
+    {% else %}
+    <!-- Google Font dynamique -->
+    <link href="https://fonts.googleapis.com/css2?family={{ site.font|replace(' ','+') }}:wght@300;400;500;600;700&display=swap" rel="stylesheet">
+    {% endif %}
+    {% for code, href in lang_alternates().items() %}
+    <link rel="alternate" hreflang="{{ code }}" href="{{ href }}">
+    {% if code == 'fr' %}<link rel="alternate" hreflang="x-default" href="{{ href }}">{% endif %}
+    {% endfor %}
     {% block head_extra %}{% endblock %}
 </head>
-<body class="{{ 'dark-mode' if session.get('dark_mode') else '' }}">
+<body>
+<script>
+// Mode sombre mémorisé dans le navigateur : appliqué avant le premier rendu
+function applyDark(on) { document.body.classList.toggle('dark-mode', on); }
+try { applyDark(localStorage.getItem('theme') === 'dark'); } catch (e) {}
+function toggleDark() {
+  var on = !document.body.classList.contains('dark-mode');
+  applyDark(on);
+  try { localStorage.setItem('theme', on ? 'dark' : 'light'); } catch (e) {}
+}
+</script>
 <nav class="navbar navbar-expand-lg sticky-top">
   <div class="container">
     <a class="navbar-brand" href="{{ url_for('index') }}">{{ site.nom }}</a>
@@ -1227,21 +4598,19 @@ base_template = """
         <li class="nav-item"><a class="nav-link {% if request.endpoint=='pourquoi' %}active{% endif %}" href="{{ url_for('pourquoi') }}">{{ "Pourquoi moi ?" if lang=='fr' else "Why me?" }}</a></li>
         <li class="nav-item"><a class="nav-link {% if request.endpoint=='contact' %}active{% endif %}" href="{{ url_for('contact') }}">{{ "Contact / Projets" if lang=='fr' else "Contact / Project" }}</a></li>
         <li class="nav-item lang-select">
+          {% set alternates = lang_alternates() %}
           <form method="post" action="{{ url_for('set_lang') }}" style="display:inline;">
-            <select name="lang" onchange="this.form.submit()" class="form-select form-select-sm" style="display:inline;width:96px;">
+            <input type="hidden" name="next" value="{{ request.path }}">
+            <select name="lang" onchange="{% if alternates %}location.href=this.options[this.selectedIndex].dataset.href{% else %}this.form.submit(){% endif %}" class="form-select form-select-sm" style="display:inline;width:96px;">
               {% for code, name in langs.items() %}
-                <option value="{{ code }}" {% if lang==code %}selected{% endif %}>{{ name }}</option>
+                <option value="{{ code }}" {% if alternates %}data-href="{{ alternates[code] }}"{% endif %} {% if lang==code %}selected{% endif %}>{{ name }}</option>
               {% endfor %}
             </select>
           </form>
         </li>
         <li class="nav-item">
-          <a href="{{ url_for('toggle_dark') }}" class="dark-toggle" title="{{ 'Mode sombre' if not session.get('dark_mode') else 'Mode clair' }}">
-            {% if session.get('dark_mode') %}
-              <i class="bi bi-sun-fill"></i>
-            {% else %}
-              <i class="bi bi-moon-fill"></i>
-            {% endif %}
+          <a href="#" onclick="toggleDark(); return false;" class="dark-toggle" title="{{ 'Mode sombre / clair' if lang=='fr' else 'Dark / light mode' }}">
+            <i class="bi bi-moon-fill"></i><i class="bi bi-sun-fill"></i>
           </a>
         </li>
       </ul>
@@ -1280,12 +4649,18 @@ base_template = """
     <div class="mt-2 small">&copy; {{ annee }} – {{ "Développé par" if lang=='fr' else "Developed by" }} {{ site.nom }}</div>
   </div>
 </footer>
+{% if asset_url('site.js') %}
+<!-- Bootstrap JS + AOS (bundle local, différé) -->
+<script src="{{ asset_url('site.js') }}" defer></script>
+{% else %}
 <!-- Bootstrap JS bundle -->
-<script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js"></script>
+<script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js" defer></script>
 <!-- AOS animations -->
-<script src="https://cdn.jsdelivr.net/npm/aos@2.3.4/dist/aos.js"></script>
+<script src="https://cdn.jsdelivr.net/npm/aos@2.3.4/dist/aos.js" defer></script>
+{% endif %}
 <script>
-  AOS.init({duration: 800, once: true});
+  // Les scripts différés sont exécutés avant DOMContentLoaded
+  document.addEventListener('DOMContentLoaded', function(){ AOS.init({duration: 800, once: true}); });
   // Drag-drop area (contact form)
   const dropArea = document.getElementById('dragDrop');
   if (dropArea) {
@@ -1313,35 +4688,298 @@ base_template = """
       }
     });
   }
-
-  // Initialisation SpriteSpin pour chaque viewer 360°
-  document.addEventListener('DOMContentLoaded', function(){
-    $('.rotation-viewer').each(function(){
-      const $el = $(this);
-      let frames = $el.data('images'); // array of image URLs
-      if (Array.isArray(frames) && frames.length>0) {
-        // Taille du conteneur
-        let width = $el.width();
-        SpriteSpin.create({
-          container: $el,
-          source: frames,
-          width: width,
-          height: width,
-          frames: frames.length,
-          sense: -1,
-          animate: false,
-          frameTime: 40,
-          module: SpriteSpinModule360
-        });
-      }
-    });
-  });
 </script>
 {% block scripts_extra %}{% endblock %}
 </body>
 </html>
 """
 
+# Template theme.css (feuille du thème, servie avec empreinte)
+# Le CSS est retravaillé pour des couleurs vives et alternances de sections.
+theme_css_template = """
+/* Palette vive via variables CSS */
+:root {
+    --color-primary: {{ site.couleur }};           /* magenta vif ou valeur admin */
+    --color-secondary: {{ site.secondary }};       /* orange vif ou valeur admin */
+    --color-accent: {{ site.accent }};             /* vert vif ou valeur admin */
+    --color-alt1: #FFF3E0;   /* pastel pêche clair pour alternance */
+    --color-alt2: #E8F5E9;   /* pastel vert clair */
+    --color-alt3: #E3F2FD;   /* pastel bleu clair */
+    --bg-light: #FAFAFA;     /* fond clair */
+    --bg-dark: #121212;      /* fond sombre plus doux */
+    --text-dark: #212121;    /* texte sombre */
+    --text-light: #F5F5F5;   /* texte clair */
+    --card-bg-light: #FFFFFF;/* carte en mode clair */
+    --card-bg-alt: #F1F1F1;  /* alternatif clair */
+    --card-bg-dark: #1E1E1E; /* carte en mode sombre */
+    --gradient-primary: linear-gradient(135deg, {{ site.couleur }}, {{ site.secondary }}); 
+    --gradient-secondary: linear-gradient(135deg, {{ site.secondary }}, {{ site.accent }});
+    --gradient-accent: linear-gradient(135deg, {{ site.accent }}, {{ site.couleur }});
+    --font-family: '{{ site.font }}', Arial, sans-serif;
+}
+body {
+    font-family: var(--font-family);
+    background: var(--bg-light);
+    color: var(--text-dark);
+    margin: 0; padding: 0;
+    transition: background 0.3s, color 0.3s;
+}
+body.dark-mode {
+    background: var(--bg-dark) !important;
+    color: var(--text-light) !important;
+}
+a {
+    color: var(--color-primary);
+    text-decoration: none;
+    transition: color 0.2s;
+}
+a:hover {
+    color: var(--color-accent);
+    text-decoration: underline;
+}
+/* Navbar */
+.navbar {
+    background: var(--gradient-primary) !important;
+}
+.navbar .nav-link {
+    color: #fff !important;
+}
+.navbar .nav-link.active {
+    color: var(--color-accent) !important;
+    font-weight: bold;
+    border-bottom: 2px solid var(--color-accent);
+}
+.navbar .nav-link:hover {
+    color: var(--color-accent) !important;
+}
+.dark-toggle { cursor: pointer; color: #fff; margin-left: 1rem; }
+.dark-toggle .bi-sun-fill, body.dark-mode .dark-toggle .bi-moon-fill { display: none; }
+body.dark-mode .dark-toggle .bi-sun-fill { display: inline; }
+/* Hero */
+.hero {
+    position: relative;
+    text-align: center;
+    color: var(--text-light);
+    padding: 80px 0;
+    background:
+        linear-gradient(135deg, rgba(233,30,99,0.8), rgba(255,87,34,0.8)),
+        url('{{ site.photo }}') center/cover no-repeat;
+}
+.hero img {
+    width: 140px; height:140px; object-fit:cover;
+    border-radius: 50%;
+    border: 3px solid var(--color-accent);
+    box-shadow: 0 4px 16px rgba(0,0,0,0.6);
+    transition: transform 0.3s;
+}
+.hero img:hover {
+    transform: scale(1.05);
+}
+.hero h1, .hero h3, .hero p {
+    text-shadow: 1px 1px 6px rgba(0,0,0,0.7);
+    margin: 10px 0;
+}
+.hero .btn-contact {
+    border-radius: 30px;
+    padding: 12px 30px;
+    font-size: 1.1rem;
+    background: var(--color-secondary);
+    color: #fff;
+    box-shadow: 0 4px 12px rgba(0,0,0,0.3);
+    transition: transform 0.2s, box-shadow 0.2s;
+}
+.hero .btn-contact:hover {
+    transform: translateY(-2px);
+    box-shadow: 0 6px 16px rgba(0,0,0,0.4);
+    background: var(--color-accent);
+}
+/* Section titles */
+.section-title {
+    color: var(--color-primary);
+    margin-top: 48px;
+    margin-bottom: 24px;
+    font-weight: 600;
+    letter-spacing: 0.5px;
+    position: relative;
+    display: inline-block;
+}
+.section-title::after {
+    content: "";
+    display: block;
+    width: 60px;
+    height: 3px;
+    background: var(--color-primary);
+    margin: 8px auto 0;
+    border-radius: 2px;
+}
+/* Service cards */
+.service-card {
+    background: var(--card-bg-light);
+    border-radius:20px;
+    padding:24px 16px;
+    text-align:center;
+    margin-bottom:20px;
+    box-shadow:0 2px 14px rgba(0,0,0,0.1);
+    transition: transform 0.3s, box-shadow 0.3s, background 0.3s;
+    border-top: 4px solid var(--color-primary);
+}
+.service-card:hover {
+    transform: translateY(-6px);
+    box-shadow:0 6px 24px rgba(0,0,0,0.15);
+    background: var(--card-bg-alt);
+}
+.service-card i {
+    font-size:2.4rem;
+    color: var(--color-secondary);
+    margin-bottom:12px;
+}
+body.dark-mode .service-card {
+    background: var(--card-bg-dark);
+    color: var(--text-light);
+}
+body.dark-mode .service-card:hover {
+    background: #2a2a2a;
+}
+/* Portfolio */
+.card-portfolio {
+    border: none;
+    border-radius: 15px;
+    overflow: hidden;
+    transition: transform 0.3s, box-shadow 0.3s, background 0.3s;
+    background: var(--card-bg-light);
+    color: var(--text-dark);
+    box-shadow:0 2px 12px rgba(0,0,0,0.1);
+    margin-bottom: 24px;
+    border-left: 4px solid var(--color-secondary);
+}
+.card-portfolio:hover {
+    transform: translateY(-6px);
+    box-shadow:0 8px 28px rgba(0,0,0,0.2);
+    background: var(--card-bg-alt);
+}
+.portfolio-img {
+    height:200px; width:100%; object-fit:cover;
+}
+body.dark-mode .card-portfolio {
+    background: var(--card-bg-dark);
+    color: var(--text-light);
+}
+/* Gallery */
+.gallery-container {
+    display: flex;
+    flex-wrap: wrap;
+    gap: 16px;
+    justify-content: center;
+}
+.gallery-item {
+    background: var(--card-bg-light);
+    border-radius: 12px;
+    overflow: hidden;
+    box-shadow: 0 2px 12px rgba(0,0,0,0.1);
+    transition: transform 0.3s, box-shadow 0.3s, background 0.3s;
+    width: 300px;
+    display: flex;
+    flex-direction: column;
+    border-top: 4px solid var(--color-accent);
+}
+.gallery-item:hover {
+    transform: translateY(-4px);
+    box-shadow: 0 6px 20px rgba(0,0,0,0.15);
+    background: var(--card-bg-alt);
+}
+.gallery-item img,
+.gallery-item video {
+    max-width: 100%;
+    height: auto;
+    display: block;
+}
+.gallery-caption {
+    padding: 12px;
+}
+.gallery-caption h5 {
+    margin: 0 0 8px;
+    font-size: 1.1rem;
+    color: var(--color-primary);
+}
+.gallery-caption p {
+    margin: 0;
+    font-size: 0.95rem;
+    color: #555;
+}
+body.dark-mode .gallery-item {
+    background: var(--card-bg-dark);
+    color: var(--text-light);
+}
+/* Viewer 360° */
+.rotation-viewer {
+    width: 100%;
+    aspect-ratio: 1 / 1;
+    background: #f2f2f2;
+    position: relative;
+    border: 2px solid var(--color-primary);
+}
+/* Footer */
+.footer { background: var(--bg-dark); color: #fff; padding: 30px 0; margin-top: 0; }
+.footer a { color: var(--color-accent); text-decoration: none; }
+.footer a:hover { text-decoration: underline; }
+.project-cta {
+    background: var(--gradient-secondary);
+    color:#fff;
+    border-radius:20px;
+    padding:25px 15px;
+    margin:30px 0 15px 0;
+    box-shadow:0 4px 16px rgba(0,0,0,0.15);
+    font-size:1.1rem;
+    font-weight:500;
+    text-align: center;
+}
+/* Admin */
+.admin-nav { background:#2c2f33; padding:10px; border-radius:10px; margin-bottom:10px; }
+.admin-nav a { color:#FFD700; margin:0 8px; font-weight:bold; text-decoration:none;}
+.admin-panel {
+    background: var(--card-bg-light);
+    border-radius:14px;
+    padding:20px 16px;
+    margin-top:10px;
+    box-shadow:0 4px 24px rgba(0,0,0,0.1);
+    color: var(--text-dark);
+}
+body.dark-mode .admin-panel {
+    background: var(--card-bg-dark);
+    color: var(--text-light);
+}
+.admin-table td, .admin-table th { vertical-align:middle; color: inherit; }
+.admin-msg { background: #fff3cd; border:1px solid var(--color-primary); border-radius:8px; padding:12px 18px; }
+/* Drag-drop */
+.drag-drop-area {
+    border:2px dashed #bbb;
+    border-radius:10px;
+    background:#f8fbff;
+    text-align:center;
+    padding:20px 8px;
+    color:#789;
+    margin-bottom:12px;
+    transition: border .2s, background .2s;
+    position: relative;
+}
+.drag-drop-area.dragover { border:2.2px solid var(--color-primary); background:#e7f7ff; }
+/* Responsive */
+@media (max-width:600px) {
+    html { font-size:15px; }
+    .hero, .carousel { padding: 40px 0 30px 0; }
+    .project-cta { padding:10px 5px; }
+    .admin-panel { padding:10px 8px; }
+    .carousel-item img {
+        max-height: 250px;
+        height: auto;
+    }
+    .hero img { width: 100px; height:100px; }
+    .gallery-item {
+        width: 100%;
+    }
+}
+"""
+
 # Template index.html
 index_template = """
 {% extends "base.html" %}
@@ -1363,10 +5001,17 @@ index_template = """
         {% if item.type=='image' %}
           <img src="{{ url_for('uploaded_file', filename=item.filename) }}" class="d-block w-100" alt="Carousel item" style="max-height:400px; object-fit:cover;">
         {% else %}
+          {% set preview = pdf_preview(item.filename, 'rotator') %}
+          {% if preview %}
+          <a href="{{ url_for('uploaded_file', filename=item.filename) }}" target="_blank">
+            <img src="{{ preview.cover }}" class="d-block w-100" alt="{{ item.filename }}" {% if not loop.first %}loading="lazy" {% endif %}style="max-height:400px; object-fit:contain; background:#f2f2f2;">
+          </a>
+          {% else %}
           <div class="d-flex justify-content-center align-items-center" style="height:400px; background:#f2f2f2;">
             <i class="bi bi-file-earmark-pdf-fill" style="font-size:3rem;color:var(--color-secondary);"></i>
             <span class="ms-2">{{ item.filename }}</span>
           </div>
+          {% endif %}
         {% endif %}
       </div>
       {% endfor %}
@@ -1463,6 +5108,41 @@ galleries_template = """
   {% endfor %}
 </div>
 {% endblock %}
+{% block scripts_extra %}
+{% if GALLERY_ITEMS|selectattr('type', 'equalto', 'rotation')|first %}
+<!-- SpriteSpin (pour vues tournantes), uniquement si la page en contient -->
+{% if asset_url('spin.js') %}
+<script src="{{ asset_url('spin.js') }}" defer></script>
+{% else %}
+<script src="https://cdn.jsdelivr.net/npm/jquery@3.6.0/dist/jquery.min.js" defer></script>
+<script src="https://cdn.jsdelivr.net/npm/spritespin@4.0.11/release/spritespin.min.js" defer></script>
+{% endif %}
+<script>
+  // Initialisation SpriteSpin pour chaque viewer 360°
+  document.addEventListener('DOMContentLoaded', function(){
+    $('.rotation-viewer').each(function(){
+      const $el = $(this);
+      let frames = $el.data('images'); // array of image URLs
+      if (Array.isArray(frames) && frames.length>0) {
+        // Taille du conteneur
+        let width = $el.width();
+        SpriteSpin.create({
+          container: $el,
+          source: frames,
+          width: width,
+          height: width,
+          frames: frames.length,
+          sense: -1,
+          animate: false,
+          frameTime: 40,
+          module: SpriteSpinModule360
+        });
+      }
+    });
+  });
+</script>
+{% endif %}
+{% endblock %}
 """
 
 # Template pourquoi.html
@@ -1489,7 +5169,11 @@ contact_template = """
 <h2 class="section-title text-center" data-aos="fade-up">{{ "Contact / Projets" if lang=='fr' else "Contact / Projects" }}</h2>
 <div class="row justify-content-center">
   <div class="col-md-8" data-aos="fade-up">
-    <form method="post" enctype="multipart/form-data">
+    <form method="post" enctype="multipart/form-data" id="contactForm">
+      <div aria-hidden="true" style="position:absolute; left:-10000px; width:1px; height:1px; overflow:hidden;">
+        <label for="website">Website</label>
+        <input type="text" id="website" name="website" tabindex="-1" autocomplete="off">
+      </div>
       <div class="mb-3">
         <label for="nom" class="form-label">{{ "Nom" if lang=='fr' else "Name" }}</label>
         <input type="text" class="form-control" id="nom" name="nom" required>
@@ -1519,6 +5203,80 @@ contact_template = """
   </div>
 </div>
 {% endblock %}
+{% block scripts_extra %}
+{% if pow_bits %}
+<script>
+  // Preuve de travail anti-spam : calculée dès la première saisie,
+  // puis jointe à l'URL d'envoi (vérifiée avant la lecture des pièces jointes)
+  (function(){
+    const form = document.getElementById('contactForm');
+    if (!form) return;
+    const subtle = window.isSecureContext && window.crypto && crypto.subtle;
+    // SHA-256 en JS pur (chaînes ASCII) : premier mot de 32 bits du condensé,
+    // pour les pages servies hors contexte sécurisé (sans crypto.subtle)
+    const K = [], H = [];
+    (function(){
+      const frac = function(x){ return ((x - Math.floor(x)) * 4294967296) | 0; };
+      for (let p = 2, n = 0; n < 64; p++) {
+        let prime = true;
+        for (let d = 2; d * d <= p; d++) if (p % d === 0) { prime = false; break; }
+        if (!prime) continue;
+        if (n < 8) H[n] = frac(Math.sqrt(p));
+        K[n++] = frac(Math.cbrt(p));
+      }
+    })();
+    function sha256Word(s){
+      const len = s.length, words = [], w = new Array(64);
+      for (let i = 0; i < len; i++) words[i >> 2] |= s.charCodeAt(i) << (24 - (i % 4) * 8);
+      words[len >> 2] |= 0x80 << (24 - (len % 4) * 8);
+      const total = ((len + 8) >> 6) * 16 + 16;
+      for (let i = 0; i < total; i++) words[i] |= 0;
+      words[total - 1] = len * 8;
+      const h = H.slice();
+      const ror = function(x, n){ return (x >>> n) | (x << (32 - n)); };
+      for (let j = 0; j < total; j += 16) {
+        let a = h[0], b = h[1], c = h[2], d = h[3], e = h[4], f = h[5], g = h[6], k = h[7];
+        for (let i = 0; i < 64; i++) {
+          if (i < 16) w[i] = words[j + i];
+          else {
+            const x = w[i - 15], y = w[i - 2];
+            w[i] = (w[i - 16] + (ror(x, 7) ^ ror(x, 18) ^ (x >>> 3)) + w[i - 7]
+                    + (ror(y, 17) ^ ror(y, 19) ^ (y >>> 10))) | 0;
+          }
+          const t1 = (k + (ror(e, 6) ^ ror(e, 11) ^ ror(e, 25)) + ((e & f) ^ (~e & g)) + K[i] + w[i]) | 0;
+          const t2 = ((ror(a, 2) ^ ror(a, 13) ^ ror(a, 22)) + ((a & b) ^ (a & c) ^ (b & c))) | 0;
+          k = g; g = f; f = e; e = (d + t1) | 0; d = c; c = b; b = a; a = (t1 + t2) | 0;
+        }
+        h[0] = (h[0] + a) | 0; h[1] = (h[1] + b) | 0; h[2] = (h[2] + c) | 0; h[3] = (h[3] + d) | 0;
+        h[4] = (h[4] + e) | 0; h[5] = (h[5] + f) | 0; h[6] = (h[6] + g) | 0; h[7] = (h[7] + k) | 0;
+      }
+      return h[0] >>> 0;
+    }
+    async function digestWord(text){
+      if (!subtle) return sha256Word(text);
+      const d = await subtle.digest('SHA-256', new TextEncoder().encode(text));
+      return new DataView(d).getUint32(0);
+    }
+    let work = null;
+    async function solve(){
+      const r = await fetch("{{ url_for('contact_challenge') }}", {cache: 'no-store'});
+      const c = await r.json();
+      for (let n = 0; ; n++) {
+        if (((await digestWord(c.challenge + ':' + n)) >>> (32 - c.bits)) === 0) return c.challenge + ':' + n;
+      }
+    }
+    form.addEventListener('focusin', function(){ if (!work) work = solve(); });
+    form.addEventListener('submit', function(e){
+      e.preventDefault();
+      form.querySelector('button[type=submit]').disabled = true;
+      (work || (work = solve())).then(function(solution){
+        form.action = "{{ url_for('contact') }}?pow=" + encodeURIComponent(solution);
+      }).finally(function(){ form.submit(); });
+    });
+  })();
+</script>
+{% endif %}
+{% endblock %}
 """
 
 # Template admin/login.html
@@ -1561,6 +5319,7 @@ admin_index_template = """
   <a href="{{ url_for('admin_analytics') }}">Analytics</a> |
   <a href="{{ url_for('admin_settings') }}">Settings</a> |
   <a href="{{ url_for('admin_traffic') }}">Trafic</a> |
+  <a href="{{ url_for('admin_profiler') }}">Profileur</a> |
   <a href="{{ url_for('admin_logout') }}">Logout</a>
 </div>
 <div class="admin-panel" data-aos="fade-up">
@@ -1576,6 +5335,47 @@ admin_index_template = """
     <div class="col-md-2"><div class="p-3 border mb-3"><strong>Logs Trafic:</strong> {{ total_traffic }}</div></div>
   </div>
 </div>
+<div class="admin-panel mt-3" data-aos="fade-up">
+  <h5>Performances <small class="text-muted">(depuis le démarrage du worker, {{ metrics.in_flight }} requête(s) en cours)</small></h5>
+  {% if metrics.routes %}
+  <table class="table table-sm admin-table">
+    <thead><tr><th>Endpoint</th><th>Requêtes</th><th>Moyenne (ms)</th><th>p95 (ms)</th><th>Octets envoyés</th></tr></thead>
+    <tbody>
+    {% for r in metrics.routes %}
+      <tr><td>{{ r.endpoint }}</td><td>{{ r.count }}</td><td>{{ '%.2f'|format(r.avg_ms) }}</td><td>{{ '%.1f'|format(r.p95_ms) }}</td><td>{{ r.bytes }}</td></tr>
+    {% endfor %}
+    </tbody>
+  </table>
+  {% endif %}
+  {% if metrics.storage %}
+  <h6>Écritures JSON</h6>
+  <table class="table table-sm admin-table">
+    <thead><tr><th>Fichier</th><th>Écritures</th><th>Moyenne (ms)</th></tr></thead>
+    <tbody>
+    {% for s in metrics.storage %}
+      <tr><td>{{ s.file }}</td><td>{{ s.count }}</td><td>{{ '%.2f'|format(s.avg_ms) }}</td></tr>
+    {% endfor %}
+    </tbody>
+  </table>
+  {% endif %}
+  {% if metrics.abuse %}
+  <h6>Anti-abus</h6>
+  <table class="table table-sm admin-table">
+    <thead><tr><th>Endpoint</th><th>Décision</th><th>Requêtes</th></tr></thead>
+    <tbody>
+    {% for a in metrics.abuse %}
+      <tr><td>{{ a.endpoint }}</td><td>{{ a.issue }}</td><td>{{ a.count }}</td></tr>
+    {% endfor %}
+    </tbody>
+  </table>
+  {% if metrics.offenders %}
+  <p class="small mb-2">Clients les plus refusés :
+    {% for client, n in metrics.offenders %}<code>{{ client }}</code> ({{ n }}){{ ", " if not loop.last }}{% endfor %}
+  </p>
+  {% endif %}
+  {% endif %}
+  <a href="{{ url_for('admin_metrics') }}" class="small">Export Prometheus</a>
+</div>
 {% endblock %}
 """
 
@@ -1605,8 +5405,8 @@ admin_services_template = """
         <td>{{ serv.desc['en'] }}</td>
         <td><i class="bi {{ serv.icon }}"></i> {{ serv.icon }}</td>
         <td>
-          <a href="{{ url_for('admin_services', edit=loop.index0) }}" class="btn btn-sm btn-primary">Éditer</a>
-          <a href="{{ url_for('admin_services_delete', idx=loop.index0) }}" class="btn btn-sm btn-danger" onclick="return confirm('Supprimer ce service?');">Suppr.</a>
+          <a href="{{ url_for('admin_services', edit=serv.id) }}" class="btn btn-sm btn-primary">Éditer</a>
+          <a href="{{ url_for('admin_services_delete', item_id=serv.id) }}" class="btn btn-sm btn-danger" onclick="return confirm('Supprimer ce service?');">Suppr.</a>
         </td>
       </tr>
     {% endfor %}
@@ -1618,7 +5418,7 @@ admin_services_template = """
   <hr>
   <h6>{{ 'Modifier le service' if service_to_edit else 'Ajouter un nouveau service' }}</h6>
   <form method="post" class="row g-2">
-    <input type="hidden" name="edit_idx" value="{{ request.args.get('edit') if service_to_edit is not none else '' }}">
+    <input type="hidden" name="edit_id" value="{{ service_to_edit.id if service_to_edit is not none else '' }}">
     <div class="col-md-3"><input type="text" name="titre_fr" value="{{ service_to_edit.titre['fr'] if service_to_edit else '' }}" class="form-control" placeholder="Service (FR)" required></div>
     <div class="col-md-3"><input type="text" name="titre_en" value="{{ service_to_edit.titre['en'] if service_to_edit else '' }}" class="form-control" placeholder="Service (EN)" required></div>
     <div class="col-md-3"><input type="text" name="desc_fr" value="{{ service_to_edit.desc['fr'] if service_to_edit else '' }}" class="form-control" placeholder="Description (FR)" required></div>
@@ -1660,11 +5460,20 @@ admin_portfolio_template = """
         <td>
           {% for f in proj.fichiers %}
             <a href="{{ url_for('uploaded_file', filename=f) }}" class="badge bg-info text-dark" target="_blank">{{ f }}</a><br>
+            {% set meta = attachment_info(f) %}
+            {% if meta %}
+              <details class="small mb-1">
+                <summary>{{ meta.type|upper }}, {{ '%.1f'|format(meta.size / 1048576) }} Mo{% if meta.fields %} · {{ meta.fields[0][1] }}{% endif %}</summary>
+                {% if meta.thumbnail_url %}<img src="{{ meta.thumbnail_url }}" alt="Vignette" loading="lazy" style="max-width:120px;"><br>{% endif %}
+                {% for label, value in meta.fields %}{{ label }} : {{ value }}<br>{% endfor %}
+                {% if meta.list %}{{ meta.list_label }} : {{ meta.list|join(' · ') }}{% endif %}
+              </details>
+            {% endif %}
           {% endfor %}
         </td>
         <td>
-          <a href="{{ url_for('admin_portfolio', edit=loop.index0) }}" class="btn btn-sm btn-primary">Éditer</a>
-          <a href="{{ url_for('admin_portfolio_delete', idx=loop.index0) }}" class="btn btn-sm btn-danger" onclick="return confirm('Supprimer cet élément?');">Suppr.</a>
+          <a href="{{ url_for('admin_portfolio', edit=proj.id) }}" class="btn btn-sm btn-primary">Éditer</a>
+          <a href="{{ url_for('admin_portfolio_delete', item_id=proj.id) }}" class="btn btn-sm btn-danger" onclick="return confirm('Supprimer cet élément?');">Suppr.</a>
         </td>
       </tr>
     {% endfor %}
@@ -1674,9 +5483,9 @@ admin_portfolio_template = """
     <p>Aucun élément dans le portfolio.</p>
   {% endif %}
   <hr>
-  <h6>{{ 'Modifier l\'élément' if projet_to_edit else 'Ajouter un nouvel élément' }}</h6>
+  <h6>{{ "Modifier l'élément" if projet_to_edit else 'Ajouter un nouvel élément' }}</h6>
   <form method="post" enctype="multipart/form-data" class="row g-2">
-    <input type="hidden" name="edit_idx" value="{{ request.args.get('edit') if projet_to_edit is not none else '' }}">
+    <input type="hidden" name="edit_id" value="{{ projet_to_edit.id if projet_to_edit is not none else '' }}">
     <div class="col-md-3"><input type="text" name="titre_fr" value="{{ projet_to_edit.titre.fr if projet_to_edit else '' }}" class="form-control" placeholder="Titre FR" required></div>
     <div class="col-md-3"><input type="text" name="titre_en" value="{{ projet_to_edit.titre.en if projet_to_edit else '' }}" class="form-control" placeholder="Titre EN" required></div>
     <div class="col-md-3"><input type="text" name="desc_fr" value="{{ projet_to_edit.desc.fr if projet_to_edit else '' }}" class="form-control" placeholder="Description FR" required></div>
@@ -1713,8 +5522,8 @@ admin_atouts_template = """
         <td>{{ at['fr'] }}</td>
         <td>{{ at['en'] }}</td>
         <td>
-          <a href="{{ url_for('admin_atouts', edit=loop.index0) }}" class="btn btn-sm btn-primary">Éditer</a>
-          <a href="{{ url_for('admin_atouts_delete', idx=loop.index0) }}" class="btn btn-sm btn-danger" onclick="return confirm('Supprimer cet atout?');">Suppr.</a>
+          <a href="{{ url_for('admin_atouts', edit=at.id) }}" class="btn btn-sm btn-primary">Éditer</a>
+          <a href="{{ url_for('admin_atouts_delete', item_id=at.id) }}" class="btn btn-sm btn-danger" onclick="return confirm('Supprimer cet atout?');">Suppr.</a>
         </td>
       </tr>
     {% endfor %}
@@ -1724,9 +5533,9 @@ admin_atouts_template = """
     <p>Aucun atout défini.</p>
   {% endif %}
   <hr>
-  <h6>{{ 'Modifier l\'atout' if atout_to_edit else 'Ajouter un nouvel atout' }}</h6>
+  <h6>{{ "Modifier l'atout" if atout_to_edit else 'Ajouter un nouvel atout' }}</h6>
   <form method="post" class="row g-2">
-    <input type="hidden" name="edit_idx" value="{{ request.args.get('edit') if atout_to_edit is not none else '' }}">
+    <input type="hidden" name="edit_id" value="{{ atout_to_edit.id if atout_to_edit is not none else '' }}">
     <div class="col-md-5"><input type="text" name="atout_fr" value="{{ atout_to_edit.fr if atout_to_edit }}" class="form-control" placeholder="Atout FR" required></div>
     <div class="col-md-5"><input type="text" name="atout_en" value="{{ atout_to_edit.en if atout_to_edit }}" class="form-control" placeholder="Atout EN" required></div>
     <div class="col-md-2"><button class="btn btn-contact w-100" type="submit">{{ 'Mettre à jour' if atout_to_edit else 'Ajouter' }}</button></div>
@@ -1746,6 +5555,9 @@ admin_messages_template = """
 </div>
 <div class="admin-panel" data-aos="fade-up">
   <h5>Gestion des Messages</h5>
+  <p class="small">Export : <a href="{{ url_for('admin_export', store='messages', fmt='csv') }}">CSV</a> |
+    <a href="{{ url_for('admin_export', store='messages', fmt='jsonl') }}">JSON Lines</a>
+    (filtres : ?from=AAAA-MM-JJ&amp;to=AAAA-MM-JJ&amp;status=new|read, reprise : ?cursor=...)</p>
   <form method="get" class="row mb-3">
     <div class="col-md-4">
       <input type="text" name="search" value="{{ search_query }}" class="form-control" placeholder="Rechercher...">
@@ -1755,11 +5567,16 @@ admin_messages_template = """
     </div>
   </form>
   {% if messages %}
+  <form id="bulk-messages" method="post" action="{{ url_for('admin_bulk', section='messages') }}" class="d-flex gap-2 mb-2">
+    <button class="btn btn-sm btn-success" type="submit" name="action" value="mark_read">Marquer la sélection comme lue</button>
+    <button class="btn btn-sm btn-danger" type="submit" name="action" value="delete" onclick="return confirm('Supprimer les messages sélectionnés?');">Supprimer la sélection</button>
+  </form>
   <table class="table table-hover admin-table">
-    <thead><tr><th>#</th><th>Nom</th><th>Email</th><th>Sujet</th><th>Status</th><th>Timestamp</th><th>Actions</th></tr></thead>
+    <thead><tr><th><input type="checkbox" onclick="document.querySelectorAll('input[form=bulk-messages]').forEach(function(c){c.checked=this.checked}, this)"></th><th>#</th><th>Nom</th><th>Email</th><th>Sujet</th><th>Status</th><th>Timestamp</th><th>Actions</th></tr></thead>
     <tbody>
     {% for m in messages %}
       <tr>
+        <td><input type="checkbox" form="bulk-messages" name="ids" value="{{ m.id }}"></td>
         <td>{{ loop.index0 + (page-1)*per_page }}</td>
         <td>{{ m.nom }}</td>
         <td>{{ m.email }}</td>
@@ -1767,7 +5584,7 @@ admin_messages_template = """
         <td>{{ m.status }}</td>
         <td>{{ m.timestamp }}</td>
         <td>
-          <a href="{{ url_for('view_message', idx=loop.index0 + (page-1)*per_page) }}" class="btn btn-sm btn-primary">Voir</a>
+          <a href="{{ url_for('view_message', msg_id=m.id) }}" class="btn btn-sm btn-primary">Voir</a>
         </td>
       </tr>
     {% endfor %}
@@ -1809,6 +5626,27 @@ admin_message_view_template = """
     {% if msg.fichiers %}
       {% for f in msg.fichiers %}
         <a href="{{ url_for('uploaded_file', filename=f) }}" target="_blank">{{ f }}</a><br>
+        {% set meta = attachment_info(f) %}
+        {% if meta %}
+          <span class="d-flex gap-3 my-2 small">
+            {% if meta.thumbnail_url %}<img src="{{ meta.thumbnail_url }}" alt="Vignette" loading="lazy" style="max-width:160px; max-height:160px; border:1px solid #ddd;">{% endif %}
+            <span>
+              {{ meta.type|upper }}, {{ '%.1f'|format(meta.size / 1048576) }} Mo, reçu le {{ meta.modified }}<br>
+              {% for label, value in meta.fields %}<strong>{{ label }} :</strong> {{ value }}<br>{% endfor %}
+              {% if meta.list %}<strong>{{ meta.list_label }} :</strong> {{ meta.list|join(' · ') }}<br>{% endif %}
+              {% if meta.error %}<span class="text-muted">Lecture partielle : {{ meta.error }}</span>{% endif %}
+            </span>
+          </span>
+        {% endif %}
+        {% set preview = pdf_preview(f) %}
+        {% if preview %}
+          <span class="d-flex flex-wrap gap-2 my-2">
+          {% for thumb in preview.thumbs %}
+            <a href="{{ url_for('uploaded_file', filename=f) }}#page={{ loop.index }}" target="_blank"><img src="{{ thumb }}" alt="Page {{ loop.index }}" loading="lazy" style="width:160px; border:1px solid #ddd;"></a>
+          {% endfor %}
+          </span>
+          {% if preview.pages > preview.thumbs|length %}<span class="small text-muted">{{ preview.pages }} pages, {{ preview.thumbs|length }} premières affichées.</span><br>{% endif %}
+        {% endif %}
       {% endfor %}
     {% else %}
       Aucun fichier.
@@ -1839,6 +5677,9 @@ admin_carousel_template = """
 <div class="admin-panel" data-aos="fade-up">
   <h5>Gestion du Carousel (page d'accueil)</h5>
   <p>Nombre d'items actuels: {{ ROTATOR_ITEMS|length }} / 6</p>
+  {% if not pdf_rasterizer %}
+  <div class="alert alert-warning small">Aperçus PDF désactivés : installez PyMuPDF (<code>pip install pymupdf</code>) ou poppler-utils (<code>pdftoppm</code>, <code>pdfinfo</code>).</div>
+  {% endif %}
   {% if ROTATOR_ITEMS %}
   <div class="table-responsive">
   <table class="table table-hover admin-table align-middle">
@@ -1853,7 +5694,12 @@ admin_carousel_template = """
           {% if item.type=='image' %}
             <img src="{{ url_for('uploaded_file', filename=item.filename) }}" alt="img" style="max-height:80px;">
           {% elif item.type=='pdf' %}
-            <i class="bi bi-file-earmark-pdf-fill" style="font-size:2rem;color:var(--color-secondary);"></i>
+            {% set preview = pdf_preview(item.filename, 'rotator') %}
+            {% if preview %}
+              <img src="{{ preview.thumbs[0] if preview.thumbs else preview.cover }}" alt="pdf" style="max-height:80px;">
+            {% else %}
+              <i class="bi bi-file-earmark-pdf-fill" style="font-size:2rem;color:var(--color-secondary);"></i>
+            {% endif %}
           {% endif %}
         </td>
         <td style="max-width:200px; word-break:break-all;">{{ item.filename }}</td>
@@ -1891,7 +5737,7 @@ admin_carousel_template = """
   </form>
   <div class="small mt-1">{{ 'Formats acceptés: jpg, jpeg, png, gif, pdf. Maximum 6 items.' if lang=='fr' else 'Accepted formats: jpg, jpeg, png, gif, pdf. Up to 6 items.' }}</div>
   {% else %}
-  <div class="alert alert-info">{{ 'Limite atteinte: 6 items. Supprimez-en avant d\'ajouter.' if lang=='fr' else 'Limit reached: 6 items. Remove some before adding.' }}</div>
+  <div class="alert alert-info">{{ "Limite atteinte: 6 items. Supprimez-en avant d'ajouter." if lang=='fr' else 'Limit reached: 6 items. Remove some before adding.' }}</div>
   {% endif %}
 </div>
 {% endblock %}
@@ -1909,14 +5755,18 @@ admin_gallery_template = """
 <div class="admin-panel" data-aos="fade-up">
   <h5>Gestion de la galerie</h5>
   {% if GALLERY_ITEMS %}
+  <form id="bulk-gallery" method="post" action="{{ url_for('admin_bulk', section='gallery') }}" class="mb-2">
+    <button class="btn btn-sm btn-danger" type="submit" name="action" value="delete" onclick="return confirm('Supprimer les éléments sélectionnés?');">Supprimer la sélection</button>
+  </form>
   <div class="table-responsive">
   <table class="table table-hover admin-table align-middle">
     <thead>
-      <tr><th>#</th><th>Type</th><th>Source / Frames</th><th>Titre</th><th>Description</th><th>Actions</th></tr>
+      <tr><th><input type="checkbox" onclick="document.querySelectorAll('input[form=bulk-gallery]').forEach(function(c){c.checked=this.checked}, this)"></th><th>#</th><th>Type</th><th>Source / Frames</th><th>Titre</th><th>Description</th><th>Actions</th></tr>
     </thead>
     <tbody>
     {% for item in GALLERY_ITEMS %}
       <tr>
+        <td><input type="checkbox" form="bulk-gallery" name="ids" value="{{ item.id }}"></td>
         <td>{{ loop.index0 }}</td>
         <td>{{ item.type }}</td>
         <td style="max-width:200px; word-break:break-all;">
@@ -1955,7 +5805,7 @@ admin_gallery_template = """
   <form method="post" enctype="multipart/form-data" class="row g-3">
     <div class="col-md-4">
       <label for="title" class="form-label">{{ 'Titre (optionnel)' if lang=='fr' else 'Title (optional)' }}</label>
-      <input type="text" class="form-control" id="title" name="title" placeholder="{{ 'Titre de l\'élément' if lang=='fr' else 'Item title' }}">
+      <input type="text" class="form-control" id="title" name="title" placeholder="{{ "Titre de l'élément" if lang=='fr' else 'Item title' }}">
     </div>
     <div class="col-md-4">
       <label for="description" class="form-label">{{ 'Description (optionnel)' if lang=='fr' else 'Description (optional)' }}</label>
@@ -1975,6 +5825,17 @@ admin_gallery_template = """
       <button type="submit" class="btn btn-contact">{{ 'Ajouter' if lang=='fr' else 'Add' }}</button>
     </div>
   </form>
+  <hr>
+  <h6>{{ 'Importer un manifeste JSON' if lang=='fr' else 'Import a JSON manifest' }}</h6>
+  <form method="post" action="{{ url_for('admin_gallery_import') }}" enctype="multipart/form-data" class="row g-3">
+    <div class="col-md-8">
+      <input type="file" class="form-control" name="manifest" accept=".json,application/json">
+      <div class="form-text">[{"type": "image", "source": "https://...", "title": "..."}, {"type": "rotation", "frames": ["a.jpg", "b.jpg"]}]</div>
+    </div>
+    <div class="col-md-4">
+      <button type="submit" class="btn btn-contact">{{ 'Importer' if lang=='fr' else 'Import' }}</button>
+    </div>
+  </form>
   <div class="mt-3">
     <p class="small">{{ 'Les images uploadées sont stockées dans uploads/ et resteront disponibles.' if lang=='fr' else 'Uploaded images are stored in uploads/ and remain available.' }}</p>
   </div>
@@ -2039,6 +5900,11 @@ admin_settings_template = """
       <label for="font" class="form-label">{{ 'Police (Google Font ou locale)' if lang=='fr' else 'Font (Google Font or local)' }}</label>
       <input type="text" class="form-control" id="font" name="font" value="{{ site.font }}" placeholder="Montserrat">
     </div>
+    <div class="col-md-4">
+      <label for="font_files" class="form-label">{{ 'Fichiers de police (optionnel)' if lang=='fr' else 'Font files (optional)' }}</label>
+      <input type="file" class="form-control" id="font_files" name="font_files" accept=".ttf,.otf,.woff,.woff2" multiple>
+      <div class="form-text">{{ 'La police est alors servie localement (WOFF2 allégé) au lieu de Google Fonts.' if lang=='fr' else 'The font is then served locally (subsetted WOFF2) instead of Google Fonts.' }}</div>
+    </div>
     <div class="col-md-4">
       <label class="form-label">{{ 'Photo de profil actuelle' if lang=='fr' else 'Current profile photo' }}</label><br>
       {% if site.photo %}
@@ -2079,6 +5945,9 @@ admin_traffic_template = """
 </div>
 <div class="admin-panel" data-aos="fade-up">
   <h5>Logs de trafic</h5>
+  <p class="small">Export : <a href="{{ url_for('admin_export', store='traffic', fmt='csv') }}">CSV</a> |
+    <a href="{{ url_for('admin_export', store='traffic', fmt='jsonl') }}">JSON Lines</a>
+    (filtres : ?from=AAAA-MM-JJ&amp;to=AAAA-MM-JJ, reprise : ?cursor=...)</p>
   <form method="get" class="row mb-3">
     <div class="col-md-4">
       <input type="text" name="search" value="{{ search_query }}" class="form-control" placeholder="Rechercher chemin ou IP...">
@@ -2119,9 +5988,77 @@ admin_traffic_template = """
 {% endblock %}
 """
 
+# Template admin/profiler.html
+admin_profiler_template = """
+{% extends "base.html" %}
+{% block content %}
+<div class="admin-nav text-center mb-3">
+  <a href="{{ url_for('admin_index') }}">Accueil admin</a> |
+  <a href="{{ url_for('admin_profiler') }}">Profileur</a> |
+  <a href="{{ url_for('admin_logout') }}">Logout</a>
+</div>
+<div class="admin-panel" data-aos="fade-up">
+  <h5>Profileur de requêtes</h5>
+  <form method="post" class="row g-2 align-items-center mb-3">
+    <div class="col-auto form-check ms-2">
+      <input class="form-check-input" type="checkbox" id="enabled" name="enabled" {% if profiler.enabled %}checked{% endif %}>
+      <label class="form-check-label" for="enabled">Activé</label>
+    </div>
+    <div class="col-auto">
+      <label for="sample_rate" class="form-label mb-0">Taux d'échantillonnage (0–1)</label>
+    </div>
+    <div class="col-auto">
+      <input type="number" step="0.01" min="0" max="1" class="form-control form-control-sm" id="sample_rate" name="sample_rate" value="{{ profiler.sample_rate }}">
+    </div>
+    <div class="col-auto"><button class="btn btn-sm btn-primary" type="submit">Appliquer</button></div>
+  </form>
+  <p class="small">{{ total_profiles }} profil(s) conservé(s). Les plus lents :</p>
+  {% if profiles %}
+  <table class="table table-sm table-hover admin-table">
+    <thead><tr><th>Date</th><th>Requête</th><th>Endpoint</th><th>Status</th><th>Durée (ms)</th><th>Templates (ms)</th><th></th></tr></thead>
+    <tbody>
+    {% for p in profiles %}
+      <tr>
+        <td>{{ p.timestamp }}</td>
+        <td style="max-width:240px; word-break:break-all;">{{ p.method }} {{ p.path }}</td>
+        <td>{{ p.endpoint }}</td>
+        <td>{{ p.status }}</td>
+        <td>{{ '%.1f'|format(p.duration_ms) }}</td>
+        <td>{{ '%.1f'|format(p.templates|sum(attribute='ms')) }}</td>
+        <td><a href="{{ url_for('admin_profiler', id=p.id) }}" class="btn btn-sm btn-primary">Détails</a></td>
+      </tr>
+    {% endfor %}
+    </tbody>
+  </table>
+  {% else %}
+    <p>Aucun profil enregistré.</p>
+  {% endif %}
+  {% if selected %}
+  <hr>
+  <h6>{{ selected.method }} {{ selected.path }} — {{ '%.1f'|format(selected.duration_ms) }} ms
+    <a href="{{ url_for('admin_profile_download', profile_id=selected.id) }}" class="small ms-2">.prof</a></h6>
+  {% if selected.templates %}
+  <p class="small mb-1"><strong>Rendu des templates :</strong>
+    {% for t in selected.templates %}{{ t.name }} {{ '%.2f'|format(t.ms) }} ms{% if not loop.last %}, {% endif %}{% endfor %}
+  </p>
+  {% endif %}
+  <table class="table table-sm admin-table">
+    <thead><tr><th>Fonction</th><th>Fichier:ligne</th><th>Appels</th><th>Propre (ms)</th><th>Cumulé (ms)</th></tr></thead>
+    <tbody>
+    {% for f in selected.functions %}
+      <tr><td>{{ f.func }}</td><td>{{ f.file }}:{{ f.line }}</td><td>{{ f.calls }}</td><td>{{ '%.3f'|format(f.tottime_ms) }}</td><td>{{ '%.3f'|format(f.cumtime_ms) }}</td></tr>
+    {% endfor %}
+    </tbody>
+  </table>
+  {% endif %}
+</div>
+{% endblock %}
+"""
+
 # On crée le DictLoader pour Jinja
 template_dict = {
     "base.html": base_template,
+    "theme.css": theme_css_template,
     "index.html": index_template,
     "services.html": services_template,
     "portfolio.html": portfolio_template,
@@ -2140,9 +6077,41 @@ template_dict = {
     "admin/analytics.html": admin_analytics_template,
     "admin/settings.html": admin_settings_template,
     "admin/traffic.html": admin_traffic_template,
+    "admin/profiler.html": admin_profiler_template,
 }
 app.jinja_loader = DictLoader(template_dict)
 
+# ----------------------------------------
+# CACHE DE BYTECODE JINJA ET PRÉCOMPILATION
+# ----------------------------------------
+# Le bytecode compilé est partagé sur disque par tous les workers ; chaque
+# fichier est indexé par nom + empreinte du source, si bien qu'anciens et
+# nouveaux workers peuvent cohabiter pendant un déploiement.
+TEMPLATE_CACHE_DIR = os.environ.get("TEMPLATE_CACHE_DIR", "template_cache")
+PRECOMPILE_TEMPLATES = os.environ.get("PRECOMPILE_TEMPLATES", "true").lower() in ("true", "1", "yes")
+
+class SourceHashBytecodeCache(FileSystemBytecodeCache):
+    def get_bucket(self, environment, name, filename, source):
+        checksum = self.get_source_checksum(source)
+        bucket = Bucket(environment, self.get_cache_key(f"{name}:{checksum}", filename), checksum)
+        self.load_bytecode(bucket)
+        return bucket
+
+def precompile_templates():
+    """Compile tous les templates au démarrage plutôt qu'au premier hit."""
+    start = time.perf_counter()
+    for name in template_dict:
+        app.jinja_env.get_template(name)
+    logging.info(f"{len(template_dict)} templates compilés en {(time.perf_counter() - start) * 1000:.1f} ms")
+
+try:
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    app.jinja_env.bytecode_cache = SourceHashBytecodeCache(TEMPLATE_CACHE_DIR, "plan-%s.cache")
+except OSError as e:
+    logging.warning(f"Cache de bytecode Jinja désactivé ({TEMPLATE_CACHE_DIR}): {e}")
+if PRECOMPILE_TEMPLATES:
+    precompile_templates()
+
 # ----------------------------------------
 # ROUTE ADMIN SETTINGS (après loader)
 # ----------------------------------------
@@ -2152,6 +6121,7 @@ def admin_settings():
     lang = session.get("lang", "fr")
     if request.method == "POST":
         changed = False
+        changes = {}  # clés de config modifiées, appliquées en une transaction
         nouvelle_couleur = request.form.get("couleur","").strip()
         nouvelle_secondary = request.form.get("secondary","").strip()
         nouvelle_accent = request.form.get("accent","").strip()
@@ -2162,7 +6132,7 @@ def admin_settings():
         if nouvelle_couleur:
             if nouvelle_couleur.startswith("#") and len(nouvelle_couleur)==7:
                 SITE["couleur"] = nouvelle_couleur
-                config_theme["couleur"] = nouvelle_couleur
+                changes["couleur"] = nouvelle_couleur
                 changed = True
             else:
                 flash("Format de couleur invalide. Utilisez #RRGGBB.", "warning")
@@ -2170,7 +6140,7 @@ def admin_settings():
         if nouvelle_secondary:
             if nouvelle_secondary.startswith("#") and len(nouvelle_secondary)==7:
                 SITE["secondary"] = nouvelle_secondary
-                config_theme["secondary"] = nouvelle_secondary
+                changes["secondary"] = nouvelle_secondary
                 changed = True
             else:
                 flash("Format de couleur secondaire invalide. Utilisez #RRGGBB.", "warning")
@@ -2178,25 +6148,40 @@ def admin_settings():
         if nouvelle_accent:
             if nouvelle_accent.startswith("#") and len(nouvelle_accent)==7:
                 SITE["accent"] = nouvelle_accent
-                config_theme["accent"] = nouvelle_accent
+                changes["accent"] = nouvelle_accent
                 changed = True
             else:
                 flash("Format de couleur accent invalide. Utilisez #RRGGBB.", "warning")
         # Font
+        font_changed = False
         if nouvelle_font:
+            font_changed = nouvelle_font != SITE["font"]
             SITE["font"] = nouvelle_font
-            config_theme["font"] = nouvelle_font
+            changes["font"] = nouvelle_font
             changed = True
+        # Fichiers de police (optionnels) pour l'auto-hébergement
+        font_dir = os.path.join(FONTS_SOURCE_DIR, font_family_slug(SITE["font"]))
+        for font_file in request.files.getlist("font_files"):
+            if not font_file or not font_file.filename:
+                continue
+            if font_file.filename.rsplit(".", 1)[-1].lower() in FONT_EXTENSIONS:
+                os.makedirs(font_dir, exist_ok=True)
+                save_upload(font_file, os.path.join(font_dir, secure_filename(font_file.filename)))
+                font_changed = True
+            else:
+                flash(f"Fichier de police non valide: {font_file.filename}", "warning")
+        if font_changed:
+            schedule_theme_fonts_build(SITE["font"])
         # Photo
         if photo_file and photo_file.filename:
             ext = photo_file.filename.rsplit('.', 1)[1].lower() if '.' in photo_file.filename else ''
             if ext in IMAGE_EXTENSIONS:
                 filename = secure_filename(f"profile_{datetime.now().strftime('%Y%m%d%H%M%S')}_{photo_file.filename}")
                 save_path = os.path.join(UPLOAD_FOLDER, filename)
-                photo_file.save(save_path)
+                save_upload(photo_file, save_path)
                 photo_path = url_for('uploaded_file', filename=filename)
                 SITE["photo"] = photo_path
-                config_theme["photo"] = photo_path
+                changes["photo"] = photo_path
                 changed = True
             else:
                 flash("Fichier de profil non valide. Extensions autorisées: jpg, jpeg, png, gif.", "warning")
@@ -2204,12 +6189,14 @@ def admin_settings():
             if nouvelle_photo_url:
                 if nouvelle_photo_url.startswith("http://") or nouvelle_photo_url.startswith("https://"):
                     SITE["photo"] = nouvelle_photo_url
-                    config_theme["photo"] = nouvelle_photo_url
+                    changes["photo"] = nouvelle_photo_url
                     changed = True
                 else:
                     flash("URL de photo invalide. Commencez par http:// ou https://", "warning")
         if changed:
-            save_json_file(CONFIG_FILE, config_theme)
+            update_store("config", lambda current: ({**current, **changes}, None))
+            schedule_critical_css_build()
+            notify_content_changed("config")
             flash(("Paramètres du thème mis à jour." if lang=="fr" else "Theme settings updated."), "success")
         return redirect(url_for('admin_settings'))
     return render_template("admin/settings.html", titre_page="Paramètres")
@@ -2217,8 +6204,272 @@ def admin_settings():
 # ----------------------------------------
 # LANCEMENT DE L’APPLICATION
 # ----------------------------------------
-if __name__ == '__main__':
+def run_dev_server(args):
     port = int(os.environ.get("PORT", 5000))
     host = "0.0.0.0"
     debug_env = os.environ.get("DEBUG", "False").lower() in ("true", "1", "yes")
     app.run(host=host, port=port, debug=debug_env)
+
+# ----------------------------------------
+# SERVEUR DE PRODUCTION (`python app.py serve`)
+# ----------------------------------------
+# threaded : un seul processus, N threads (état en mémoire protégé par verrous).
+# prefork  : N processus forkés après chargement de l'état et des templates
+#            (copy-on-write), synchronisés par le journal d'état.
+# gunicorn est utilisé s'il est installé ; sinon un préfork minimal sur le
+# serveur WSGI de Werkzeug (sans délai maximal par requête).
+if BaseApplication is not None:
+    class GunicornServer(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+def exit_on_signal(signum, frame):
+    """SIGTERM/SIGINT : sortie propre, les écritures différées sont vidées (atexit)."""
+    raise SystemExit(0)
+
+def serve_with_gunicorn(args, workers, threads):
+    options = {
+        "bind": f"{args.host}:{args.port}",
+        "workers": workers,
+        "threads": threads,
+        "worker_class": "gthread" if threads > 1 else "sync",
+        "keepalive": args.keepalive,
+        "timeout": args.timeout,
+        "graceful_timeout": args.timeout,
+        # L'application est déjà importée ici : les workers en héritent par fork
+        "preload_app": True,
+        "accesslog": None,
+        # Arrêt (ou recyclage) d'un worker : écritures différées et logs vidés
+        "worker_exit": lambda server, worker: (flush_now(), stop_log_listener()),
+    }
+    GunicornServer(options).run()
+
+def serve_with_werkzeug(args, workers, threads):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Délai d'inactivité d'une connexion keep-alive, entre deux requêtes
+        timeout = args.keepalive
+
+        def handle_one_request(self):
+            self.connection.settimeout(args.keepalive)
+            super().handle_one_request()
+
+        def parse_request(self):
+            # Requête commencée : en-têtes et corps (uploads lents) ont droit à
+            # args.timeout secondes sans données, et non au délai de keep-alive
+            self.connection.settimeout(args.timeout)
+            return super().parse_request()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    def run_worker():
+        server = make_server(args.host, args.port, app, request_handler=KeepAliveHandler, fd=sock.fileno())
+        if threads > 1:
+            # Pool borné : au plus `threads` connexions servies à la fois, les
+            # suivantes attendent dans la file d'écoute du socket (comme gthread)
+            pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http")
+            slots = threading.BoundedSemaphore(threads)
+
+            def serve_connection(request, client_address):
+                try:
+                    server.finish_request(request, client_address)
+                except Exception:
+                    server.handle_error(request, client_address)
+                finally:
+                    server.shutdown_request(request)
+                    slots.release()
+
+            def process_request(request, client_address):
+                slots.acquire()
+                pool.submit(serve_connection, request, client_address)
+
+            server.process_request = process_request
+        server.serve_forever()
+
+    if workers <= 1:
+        signal.signal(signal.SIGTERM, exit_on_signal)
+        run_worker()
+        return
+    children = set()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, exit_on_signal)
+            signal.signal(signal.SIGINT, exit_on_signal)
+            try:
+                run_worker()
+            finally:
+                flush_now()
+                stop_log_listener()
+                os._exit(0)
+        children.add(pid)
+
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    while children:
+        try:
+            pid, _status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            logging.warning(f"Worker {pid} arrêté, redémarrage")
+            spawn()
+
+def run_server(args):
+    if args.max_body_mb:
+        app.config["MAX_CONTENT_LENGTH"] = int(args.max_body_mb * 1024 * 1024)
+    if args.mode == "threaded":
+        workers, threads = 1, args.threads
+    else:
+        workers, threads = args.workers, args.threads
+    engine = "gunicorn" if BaseApplication is not None and not args.werkzeug else "werkzeug"
+    logging.info(f"Serveur {engine} {args.mode}: {workers} worker(s) x {threads} thread(s) "
+                 f"sur {args.host}:{args.port}, keep-alive {args.keepalive}s, timeout {args.timeout}s, "
+                 f"corps max {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} Mo "
+                 f"(uploads: {', '.join(f'{route} {limit // MB} Mo' for route, limit in UPLOAD_ROUTE_LIMITS.items())})")
+    if engine == "gunicorn":
+        serve_with_gunicorn(args, workers, threads)
+    else:
+        serve_with_werkzeug(args, workers, threads)
+
+class SMTPDebugHandler(socketserver.StreamRequestHandler):
+    """Serveur SMTP minimal de test : affiche (et enregistre) les e-mails reçus."""
+    out_dir = None
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.reply("220 smtp-debug prêt")
+        sender, recipients = "", []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+            if verb in ("HELO", "EHLO", "RSET", "NOOP"):
+                if verb == "RSET":
+                    sender, recipients = "", []
+                self.reply("250 OK")
+            elif verb == "MAIL":
+                sender, recipients = command[10:].strip(), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command[8:].strip())
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 Fin des données par <CR><LF>.<CR><LF>")
+                lines = []
+                for data_line in iter(self.rfile.readline, b""):
+                    if data_line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                self.deliver(sender, recipients, b"".join(lines))
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Au revoir")
+                return
+            else:
+                self.reply("502 Commande non implémentée")
+
+    def deliver(self, sender, recipients, data):
+        print(f"---------- De {sender} pour {', '.join(recipients)}", flush=True)
+        print(data.decode("utf-8", "replace"), flush=True)
+        if self.out_dir:
+            path = os.path.join(self.out_dir, f"{time.time_ns()}.eml")
+            with open(path, "wb") as f:
+                f.write(data)
+
+def run_smtp_debug(args):
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+    SMTPDebugHandler.out_dir = args.out
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer((args.host, args.port), SMTPDebugHandler) as server:
+        print(f"SMTP de test sur {args.host}:{args.port} (SMTP_HOST={args.host} SMTP_PORT={args.port})", flush=True)
+        server.serve_forever()
+
+def run_build_assets(args):
+    manifest = build_assets(source=args.source, fetch=not args.no_fetch)
+    for name, hashed in manifest.items():
+        print(f"{name} -> {hashed}")
+
+def run_build_critical(args):
+    for endpoint, css in build_critical_css().items():
+        print(f"{endpoint}: {len(css)} octets")
+
+def run_export(args):
+    print(export_static_site(args.out))
+
+def run_build_fonts(args):
+    if not build_theme_fonts(args.family or SITE["font"]):
+        sys.exit(1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Site plan-revit-bim")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("run", help="serveur de développement Flask (défaut)").set_defaults(func=run_dev_server)
+    p_serve = commands.add_parser("serve", help="serveur de production (threads ou workers préforkés)")
+    p_serve.add_argument("--mode", choices=("threaded", "prefork"), default=os.environ.get("SERVER_MODE", "threaded"))
+    p_serve.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    p_serve.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5000)))
+    p_serve.add_argument("--workers", type=int, default=int(os.environ.get("WEB_WORKERS", min(2 * (os.cpu_count() or 1) + 1, 8))),
+                         help="processus en mode prefork")
+    p_serve.add_argument("--threads", type=int, default=int(os.environ.get("WEB_THREADS", 8)), help="threads par processus")
+    p_serve.add_argument("--keepalive", type=int, default=int(os.environ.get("KEEPALIVE", 5)), help="keep-alive (s)")
+    p_serve.add_argument("--timeout", type=int, default=int(os.environ.get("REQUEST_TIMEOUT", 30)), help="délai max par requête (s)")
+    p_serve.add_argument("--max-body-mb", type=float, default=None, help="taille max d'une requête hors routes d'upload (défaut: MAX_BODY_MB ou 50)")
+    p_serve.add_argument("--werkzeug", action="store_true", help="ignore gunicorn même s'il est installé")
+    p_serve.set_defaults(func=run_server)
+    p_assets = commands.add_parser("assets", help="construit les bundles front auto-hébergés")
+    p_assets.add_argument("--source", help="dossier contenant déjà les fichiers tiers (hors-ligne)")
+    p_assets.add_argument("--no-fetch", action="store_true", help="n'utilise que assets/vendor existant")
+    p_assets.set_defaults(func=run_build_assets)
+    p_fonts = commands.add_parser("fonts", help="génère les WOFF2 de la police du thème")
+    p_fonts.add_argument("--family", help="famille à générer (défaut: police du thème)")
+    p_fonts.set_defaults(func=run_build_fonts)
+    p_export = commands.add_parser("export", help="exporte les pages publiques en HTML statique")
+    p_export.add_argument("--out", help=f"dossier de sortie (défaut: {EXPORT_DIR})")
+    p_export.set_defaults(func=run_export)
+    p_smtp = commands.add_parser("smtp-debug", help="serveur SMTP local de test (affiche les e-mails)")
+    p_smtp.add_argument("--host", default="127.0.0.1")
+    p_smtp.add_argument("--port", type=int, default=1025)
+    p_smtp.add_argument("--out", help="dossier où enregistrer les e-mails reçus (.eml)")
+    p_smtp.set_defaults(func=run_smtp_debug)
+    commands.add_parser("critical", help="précalcule le CSS critique des pages publiques").set_defaults(func=run_build_critical)
+    args = parser.parse_args(argv)
+    getattr(args, "func", run_dev_server)(args)
+
+if __name__ == '__main__':
+    main()
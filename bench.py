@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks reproductibles des chemins chauds de app.py.
+
+Les stores messages, traffic et gallery sont remplis de données synthétiques
+à chaque taille demandée, puis chaque cas est chronométré via le client de test
+Flask, dans un dossier d'uploads temporaire.
+
+Exemples :
+    python bench.py --sizes 10,1000,100000 --out bench.json
+    python bench.py --baseline bench.json          # compare à une référence
+    python bench.py --save-baseline bench.json     # écrit/écrase la référence
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+DEFAULT_SIZES = "10,100,1000,10000,100000,1000000"
+ATTACHMENT_BYTES = 64 * 1024
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks des chemins chauds de app.py")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="tailles des stores, séparées par des virgules (défaut: %(default)s)")
+    parser.add_argument("--cases", default="",
+                        help="sous-ensemble de cas à exécuter, séparés par des virgules")
+    parser.add_argument("--repeat", type=int, default=5, help="itérations par cas et par taille")
+    parser.add_argument("--max-seconds", type=float, default=30.0,
+                        help="budget par cas et par taille ; au-delà, les tailles supérieures sont sautées")
+    parser.add_argument("--out", default="", help="fichier JSON de sortie (défaut: stdout)")
+    parser.add_argument("--baseline", default="", help="fichier JSON de référence à comparer")
+    parser.add_argument("--save-baseline", default="", help="écrit aussi les résultats comme référence")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="ralentissement relatif toléré avant de signaler une régression")
+    return parser.parse_args(argv)
+
+
+def load_app(workdir):
+    """Importe app.py avec tous ses fichiers persistants redirigés vers workdir."""
+    os.environ["UPLOAD_FOLDER"] = os.path.join(workdir, "uploads")
+    os.environ["LOG_FILE_PATH"] = os.path.join(workdir, "app.log")
+    os.environ["PROFILE_DIR"] = os.path.join(workdir, "profiles")
+    # On mesure la vue contact, pas l'anti-abus : ni preuve de travail, ni
+    # limitation de débit pour les envois répétés du client de test
+    os.environ["CONTACT_POW_BITS"] = "0"
+    os.environ["RATE_LIMITS"] = "contact=1000000/1,admin_login=1000000/1"
+    # Pas de compaction en arrière-plan pendant les mesures : populate()
+    # compacte lui-même une fois les stores remplis
+    os.environ["STATE_COMPACT_BYTES"] = str(1 << 62)
+    for var in ("MSG_FILE_PATH", "TRAFFIC_FILE_PATH", "ROTATOR_FILE_PATH",
+                "CONFIG_FILE_PATH", "GALLERY_FILE_PATH"):
+        os.environ.pop(var, None)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+    logging.getLogger().setLevel(logging.WARNING)
+    return app_module
+
+
+# ----------------------------------------
+# DONNÉES SYNTHÉTIQUES
+# ----------------------------------------
+def synthetic_messages(n):
+    base = datetime(2024, 1, 1)
+    return [{
+        "nom": f"Client {i}",
+        "email": f"client{i}@example.com",
+        "sujet": f"Projet béton armé n°{i}",
+        "message": "Bonjour, je souhaite un devis pour des plans d'armatures. " * 3,
+        "fichiers": [],
+        "status": "new" if i % 3 else "read",
+        "timestamp": (base + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"),
+    } for i in range(n)]
+
+
+def synthetic_traffic(n):
+    base = datetime(2024, 1, 1)
+    paths = ("/fr/", "/fr/services", "/fr/portfolio", "/fr/galeries", "/fr/pourquoi", "/fr/contact")
+    return [{
+        "timestamp": (base + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S"),
+        "path": paths[i % len(paths)],
+        "method": "GET",
+        "remote_addr": f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+    } for i in range(n)]
+
+
+def synthetic_gallery(n):
+    items = []
+    for i in range(n):
+        if i % 10 == 0:
+            items.append({"type": "rotation",
+                          "frames": [f"https://example.com/rot{i}_{k}.jpg" for k in range(8)],
+                          "title": f"Vue 360° {i}", "description": "Maquette Revit"})
+        else:
+            items.append({"type": "image", "source": f"https://example.com/img{i}.jpg",
+                          "title": f"Image {i}", "description": "Plan de coffrage"})
+    return items
+
+
+def populate(app_module, size):
+    """Remplit les stores via le journal d'état, comme une écriture admin."""
+    for store, items in (("messages", synthetic_messages(size)),
+                         ("traffic", synthetic_traffic(size)),
+                         ("gallery", synthetic_gallery(size))):
+        if store in app_module.ID_STORES:
+            items = [dict(item, id=app_module.new_item_id()) for item in items]
+        app_module.apply_op(store, "replace", items)
+    # Snapshot et exports JSON à jour, journal vide : l'état d'un site en régime établi
+    app_module.compact_state()
+    app_module.flush_json_writes()
+
+
+# ----------------------------------------
+# CAS DE BENCHMARK
+# ----------------------------------------
+def make_cases(app_module, client):
+    admin = f"/{app_module.ADMIN_SECRET_URL}"
+    attachment = b"%PDF-1.4\n" + os.urandom(ATTACHMENT_BYTES)
+
+    def log_traffic():
+        with app_module.app.test_request_context("/fr/services"):
+            app_module.log_traffic()
+
+    def contact_post():
+        data = {
+            "nom": "Bench", "email": "bench@example.com", "sujet": "Devis",
+            "message": "Plans d'armatures pour R+2.",
+            "fichiers": [(io.BytesIO(attachment), "plans.pdf"), (io.BytesIO(attachment), "note.docx")],
+        }
+        resp = client.post("/fr/contact", data=data, content_type="multipart/form-data")
+        assert resp.status_code == 302, resp.status_code
+
+    def admin_messages_search():
+        resp = client.get(f"{admin}/messages?search=client9")
+        assert resp.status_code == 200, resp.status_code
+
+    def admin_traffic():
+        resp = client.get(f"{admin}/traffic?page=2&search=galeries")
+        assert resp.status_code == 200, resp.status_code
+
+    def galeries():
+        resp = client.get("/fr/galeries")
+        assert resp.status_code == 200, resp.status_code
+
+    def download_all_uploads():
+        resp = client.get(f"{admin}/download_uploads")
+        assert resp.status_code == 200, resp.status_code
+        resp.close()
+
+    return {
+        "log_traffic": log_traffic,
+        "contact_post": contact_post,
+        "admin_messages_search": admin_messages_search,
+        "admin_traffic": admin_traffic,
+        "galeries": galeries,
+        "download_all_uploads": download_all_uploads,
+    }
+
+
+def time_case(func, repeat, max_seconds):
+    timings = []
+    budget_start = time.perf_counter()
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+        if time.perf_counter() - budget_start > max_seconds:
+            break
+    return timings
+
+
+def summarize(case, size, timings):
+    ordered = sorted(timings)
+    return {
+        "case": case,
+        "size": size,
+        "runs": len(timings),
+        "min_s": ordered[0],
+        "median_s": statistics.median(ordered),
+        "mean_s": statistics.fmean(ordered),
+        "max_s": ordered[-1],
+    }
+
+
+def run(args):
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    workdir = tempfile.mkdtemp(prefix="plan_bench_")
+    try:
+        app_module = load_app(workdir)
+        client = app_module.app.test_client()
+        client.post(f"/{app_module.ADMIN_SECRET_URL}/login",
+                    data={"username": app_module.ADMIN_USER, "password": app_module.ADMIN_PASS})
+        cases = make_cases(app_module, client)
+        if args.cases:
+            wanted = {c.strip() for c in args.cases.split(",")}
+            cases = {name: fn for name, fn in cases.items() if name in wanted}
+        results, skipped = [], []
+        too_slow = set()
+        for size in sizes:
+            populate(app_module, size)
+            for name, func in cases.items():
+                if name in too_slow:
+                    skipped.append({"case": name, "size": size, "reason": "budget dépassé à une taille inférieure"})
+                    continue
+                timings = time_case(func, args.repeat, args.max_seconds)
+                results.append(summarize(name, size, timings))
+                print(f"{name:<24} n={size:<9} median={statistics.median(timings) * 1000:10.3f} ms "
+                      f"({len(timings)} runs)", file=sys.stderr)
+                if min(timings) > args.max_seconds:
+                    too_slow.add(name)
+        return {
+            "meta": {
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+                "sizes": sizes,
+            },
+            "results": results,
+            "skipped": skipped,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(report, baseline, threshold):
+    """
+    Compare les médianes à la référence ; renvoie la liste des régressions.
+    """
+    reference = {(r["case"], r["size"]): r for r in baseline.get("results", [])}
+    comparison, regressions = [], []
+    for r in report["results"]:
+        ref = reference.get((r["case"], r["size"]))
+        if not ref or not ref["median_s"]:
+            continue
+        ratio = r["median_s"] / ref["median_s"]
+        row = {"case": r["case"], "size": r["size"], "baseline_median_s": ref["median_s"],
+               "median_s": r["median_s"], "ratio": round(ratio, 3),
+               "regression": ratio > 1 + threshold}
+        comparison.append(row)
+        if row["regression"]:
+            regressions.append(row)
+    return comparison, regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["comparison"], regressions = compare(report, baseline, args.threshold)
+        for row in regressions:
+            print(f"RÉGRESSION {row['case']} n={row['size']}: x{row['ratio']}", file=sys.stderr)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"meta": report["meta"], "results": report["results"]}, f, indent=2, ensure_ascii=False)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Générateur de charge local : démarre app.py sur 127.0.0.1 (ou vise --url),
+rejoue un mélange de pages publiques, galerie, formulaires de contact avec
+pièce jointe et recherches admin, à plusieurs niveaux de concurrence.
+
+Tout reste hors-ligne : le serveur tourne dans un processus enfant avec un
+dossier d'uploads temporaire, sans preuve de travail ni limitation de débit
+sur le contact. Avec --url, la preuve de travail est résolue à chaque envoi ;
+le serveur visé doit être lancé avec un RATE_LIMITS assez large (par exemple
+RATE_LIMITS=contact=100000/1), sinon les envois répondent 429.
+
+Exemples :
+    python loadtest.py --concurrency 1,4,16 --duration 10
+    python loadtest.py --server prefork --workers 4 --threads 4 --out load.json
+    python loadtest.py --url http://127.0.0.1:8000 --mix pages=6,gallery=3,contact=1
+"""
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import http.client
+import multiprocessing
+from urllib.parse import urlsplit, urlencode
+
+DEFAULT_MIX = "pages=6,gallery=3,contact=1,admin_search=1"
+PUBLIC_PAGES = ("/fr/", "/en/services", "/fr/portfolio", "/en/pourquoi", "/fr/contact")
+SEARCH_TERMS = ("client", "devis", "plans", "revit", "zzz")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Tests de charge locaux pour app.py")
+    parser.add_argument("--url", default="", help="serveur déjà lancé à viser (sinon démarrage local)")
+    parser.add_argument("--server", choices=("threaded", "prefork"), default="threaded",
+                        help="mode de `app.py serve` pour le serveur local (défaut: %(default)s)")
+    parser.add_argument("--workers", type=int, default=4, help="processus pour --server prefork")
+    parser.add_argument("--threads", type=int, default=8, help="threads par processus du serveur local")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="niveaux de concurrence à balayer")
+    parser.add_argument("--duration", type=float, default=10.0, help="durée de chaque palier (s)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="poids des scénarios (défaut: %(default)s)")
+    parser.add_argument("--attachment-kb", type=int, default=256, help="taille de la pièce jointe du contact")
+    parser.add_argument("--seed-messages", type=int, default=500, help="messages pré-remplis (serveur local)")
+    parser.add_argument("--seed-gallery", type=int, default=50, help="items de galerie pré-remplis (serveur local)")
+    parser.add_argument("--out", default="", help="fichier JSON de sortie")
+    return parser.parse_args(argv)
+
+
+# ----------------------------------------
+# SERVEUR LOCAL
+# ----------------------------------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def seed_data(upload_folder, n_messages, n_gallery):
+    os.makedirs(upload_folder, exist_ok=True)
+    messages = [{"nom": f"Client {i}", "email": f"client{i}@example.com",
+                 "sujet": f"Devis plans {i}", "message": "Plans Revit pour R+1.",
+                 "fichiers": [], "status": "new", "timestamp": "2024-01-01 10:00:00"}
+                for i in range(n_messages)]
+    gallery = [{"type": "image", "source": f"https://example.com/img{i}.jpg",
+                "title": f"Image {i}", "description": "Plan"} for i in range(n_gallery)]
+    with open(os.path.join(upload_folder, "messages.json"), "w", encoding="utf-8") as f:
+        json.dump(messages, f)
+    with open(os.path.join(upload_folder, "gallery.json"), "w", encoding="utf-8") as f:
+        json.dump(gallery, f)
+
+
+def serve(workdir, port, mode, workers, threads):
+    os.environ["UPLOAD_FOLDER"] = os.path.join(workdir, "uploads")
+    os.environ["LOG_FILE_PATH"] = os.path.join(workdir, "app.log")
+    os.environ["PROFILE_DIR"] = os.path.join(workdir, "profiles")
+    os.environ["CONTACT_POW_BITS"] = "0"
+    os.environ["RATE_LIMITS"] = "contact=1000000/1,admin_login=1000000/1"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import logging
+    import app as app_module
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    app_module.main(["serve", "--mode", mode, "--host", "127.0.0.1", "--port", str(port),
+                     "--workers", str(workers), "--threads", str(threads)])
+
+
+def start_local_server(args, workdir):
+    port = free_port()
+    seed_data(os.path.join(workdir, "uploads"), args.seed_messages, args.seed_gallery)
+    proc = multiprocessing.Process(target=serve, args=(workdir, port, args.server, args.workers, args.threads), daemon=True)
+    proc.start()
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return proc, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("le serveur local n'a pas démarré")
+
+
+# ----------------------------------------
+# UTILISATEUR VIRTUEL
+# ----------------------------------------
+class VirtualUser:
+    """Une connexion keep-alive et, si besoin, une session admin."""
+
+    def __init__(self, base_url, admin_path, attachment):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.admin_path = admin_path
+        self.attachment = attachment
+        self.conn = None
+        self.cookie = ""
+        self.body = b""
+        self.pow_bits = None  # inconnu tant qu'aucun défi n'a été demandé
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                resp = self.conn.getresponse()
+                self.body = resp.read()
+                cookie = resp.getheader("Set-Cookie")
+                if cookie:
+                    self.cookie = cookie.split(";", 1)[0]
+                if resp.getheader("Connection", "").lower() == "close":
+                    self.close()
+                return resp.status
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def login(self, username, password):
+        body = urlencode({"username": username, "password": password})
+        return self.request("POST", f"{self.admin_path}/login", body,
+                            {"Content-Type": "application/x-www-form-urlencoded"})
+
+    def solve_pow(self):
+        """Preuve de travail du formulaire de contact ('' si le serveur n'en demande pas)."""
+        if self.pow_bits == 0:
+            return ""
+        if self.request("GET", "/contact/challenge") != 200:
+            return ""
+        challenge = json.loads(self.body)
+        self.pow_bits = bits = challenge["bits"]
+        if not bits:
+            return ""
+        counter = 0
+        while int.from_bytes(hashlib.sha256(f"{challenge['challenge']}:{counter}".encode()).digest(), "big") >> (256 - bits):
+            counter += 1
+        return urlencode({"pow": f"{challenge['challenge']}:{counter}"})
+
+    # Scénarios : chacun renvoie (route, status)
+    def pages(self):
+        path = random.choice(PUBLIC_PAGES)
+        return path, self.request("GET", path)
+
+    def gallery(self):
+        return "/fr/galeries", self.request("GET", "/fr/galeries")
+
+    def contact(self):
+        boundary = f"----plan{random.getrandbits(64):x}"
+        fields = {"nom": "Charge", "email": "charge@example.com", "sujet": "Devis", "message": "Test de charge"}
+        chunks = []
+        for name, value in fields.items():
+            chunks.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+        chunks.append(f'--{boundary}\r\nContent-Disposition: form-data; name="fichiers"; filename="plans.pdf"\r\n'
+                      f'Content-Type: application/pdf\r\n\r\n'.encode() + self.attachment + b"\r\n")
+        chunks.append(f"--{boundary}--\r\n".encode())
+        body = b"".join(chunks)
+        query = self.solve_pow()
+        return "POST /contact", self.request("POST", "/fr/contact" + (f"?{query}" if query else ""), body,
+                                             {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+    def admin_search(self):
+        term = random.choice(SEARCH_TERMS)
+        return "admin_search", self.request("GET", f"{self.admin_path}/messages?search={term}")
+
+
+# ----------------------------------------
+# BALAYAGE DE CONCURRENCE
+# ----------------------------------------
+def parse_mix(spec):
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("pages", "gallery", "contact", "admin_search"):
+            raise SystemExit(f"scénario inconnu: {name}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    rank = max(int(round(q * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def run_level(base_url, admin_path, credentials, concurrency, duration, mix, attachment):
+    names = [n for n, _ in mix]
+    weights = [w for _, w in mix]
+    samples = {}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def worker():
+        user = VirtualUser(base_url, admin_path, attachment)
+        if "admin_search" in names:
+            user.login(*credentials)
+        local = {}
+        while time.perf_counter() < stop_at:
+            scenario = random.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                route, status = getattr(user, scenario)()
+            except Exception:
+                route, status = scenario, 0
+            elapsed = time.perf_counter() - start
+            local.setdefault(route, []).append((elapsed, status))
+        user.close()
+        with lock:
+            for route, values in local.items():
+                samples.setdefault(route, []).extend(values)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    routes = {}
+    total = 0
+    for route, values in sorted(samples.items()):
+        latencies = sorted(v[0] for v in values)
+        errors = sum(1 for v in values if not v[1] or v[1] >= 400)
+        total += len(values)
+        routes[route] = {
+            "requests": len(values),
+            "errors": errors,
+            "rps": round(len(values) / wall, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        }
+    return {"concurrency": concurrency, "duration_s": round(wall, 3),
+            "requests": total, "rps": round(total / wall, 2), "routes": routes}
+
+
+def print_level(level):
+    print(f"\n== concurrence {level['concurrency']} : {level['rps']} req/s "
+          f"({level['requests']} requêtes en {level['duration_s']} s)", file=sys.stderr)
+    print(f"{'route':<16}{'req':>8}{'err':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}", file=sys.stderr)
+    for route, r in level["routes"].items():
+        print(f"{route:<16}{r['requests']:>8}{r['errors']:>6}{r['rps']:>9}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}", file=sys.stderr)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    mix = parse_mix(args.mix)
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    attachment = b"%PDF-1.4\n" + os.urandom(args.attachment_kb * 1024)
+    admin_path = "/" + os.environ.get("ADMIN_SECRET_URL", "issoufouachraf_2025")
+    credentials = (os.environ.get("ADMIN_USER", "bacseried@gmail.com"), os.environ.get("ADMIN_PASS", "mx23fy"))
+    workdir, proc = None, None
+    base_url = args.url.rstrip("/")
+    try:
+        if not base_url:
+            workdir = tempfile.mkdtemp(prefix="plan_load_")
+            proc, base_url = start_local_server(args, workdir)
+        report = {"server": args.url or f"local/{args.server}", "mix": args.mix, "levels": []}
+        for concurrency in levels:
+            level = run_level(base_url, admin_path, credentials, concurrency, args.duration, mix, attachment)
+            print_level(level)
+            report["levels"].append(level)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.join(5)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())